@@ -1,24 +1,654 @@
+import json
 import os
-from openai import OpenAI
+import queue
+import random
+import re
+import time
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from email.utils import parsedate_to_datetime
 from dotenv import load_dotenv
+from rate_limiting import TokenBucket, FairScheduler
+from single_flight import SingleFlight
+from telemetry import telemetry
+from tiered_cache import TieredCache, make_cache_key
+from token_budget import count_tokens, prompt_budget
 
 load_dotenv()
 api_key = os.getenv("API_KEY")
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=api_key,
+DEFAULT_MODEL = "meta-llama/llama-3.3-8b-instruct:free"
+
+API_TIMEOUT_SECONDS = float(os.getenv("API_TIMEOUT_SECONDS", "60"))
+API_CONNECT_TIMEOUT_SECONDS = float(os.getenv("API_CONNECT_TIMEOUT_SECONDS", "5"))
+API_MAX_CONNECTIONS = int(os.getenv("API_MAX_CONNECTIONS", "20"))
+
+# The openai SDK takes most of a second to import, so it is loaded (and the client
+# built) on the first API call rather than on every cold start of the app.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The shared OpenAI-compatible client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import openai
+
+                api_timeout = openai.Timeout(API_TIMEOUT_SECONDS, connect=API_CONNECT_TIMEOUT_SECONDS)
+                # The HTTP library's Limits type, taken from openai's own default so this works
+                # whether the SDK is built on httpx or its successor.
+                http_limits = type(openai.DEFAULT_CONNECTION_LIMITS)
+                # OPENROUTER_BASE_URL can point at any OpenAI-compatible server (e.g. benchmarks/stub_server.py).
+                _client = openai.OpenAI(
+                    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+                    api_key=api_key,
+                    max_retries=0,  # Retries happen in _send_with_retries, which honours Retry-After.
+                    timeout=api_timeout,
+                    http_client=openai.DefaultHttpxClient(
+                        timeout=api_timeout,
+                        limits=http_limits(max_connections=API_MAX_CONNECTIONS, max_keepalive_connections=API_MAX_CONNECTIONS),
+                    ),
+                )
+    return _client
+
+# --- TRAFFIC CONTROL ---
+# Shared by every Streamlit session in the process: a token bucket caps the request
+# rate, and the fair scheduler caps concurrent upstream requests while serving
+# "interactive" callers (chat, explanations) ahead of "batch" ones (bulk quiz sections).
+rate_limiter = TokenBucket(
+    rate=float(os.getenv("API_RATE_PER_SECOND", "1.0")),
+    burst=int(os.getenv("API_RATE_BURST", "5")),
+)
+scheduler = FairScheduler(
+    max_concurrent=int(os.getenv("API_MAX_CONCURRENT", "6")),
+    weights={"interactive": 3, "batch": 1},
+)
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "4"))
+API_BACKOFF_BASE_SECONDS = float(os.getenv("API_BACKOFF_BASE_SECONDS", "1.0"))
+API_BACKOFF_CAP_SECONDS = float(os.getenv("API_BACKOFF_CAP_SECONDS", "30"))
+
+
+
+class ApiBusyError(RuntimeError):
+    """The AI service kept rate-limiting us after every retry."""
+
+
+def _retry_after_seconds(error):
+    """Seconds requested by a Retry-After header (delta-seconds or HTTP date), if any."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_delay(attempt, error):
+    """Retry-After if the server sent one, otherwise capped exponential backoff with full jitter."""
+    retry_after = _retry_after_seconds(error)
+    if retry_after is not None:
+        return min(retry_after, API_BACKOFF_CAP_SECONDS)
+    return random.uniform(0, min(API_BACKOFF_CAP_SECONDS, API_BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def _send_with_retries(lane, still_wanted=None, **request):
+    """Sends one chat-completion request through the scheduler and rate limiter.
+
+    Transient failures (429, 5xx, connection errors and timeouts) are retried up to
+    API_MAX_RETRIES times. The scheduler slot is released while backing off. Returns
+    `(response, retries)` with the slot still held; the caller must call
+    `scheduler.release()` once it is done with the response (after consuming a stream).
+    `still_wanted()`, if given, is checked whenever a slot is granted: once it returns
+    False the slot is released and `(None, retries)` returned without sending anything.
+    """
+    client = get_client()
+    import openai
+    # APITimeoutError is a subclass of APIConnectionError.
+    retryable_errors = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+    attempt = 0
+    while True:
+        scheduler.acquire(lane)
+        if still_wanted is not None and not still_wanted():
+            scheduler.release()
+            return None, attempt
+        rate_limiter.acquire()
+        try:
+            return client.chat.completions.create(**request), attempt
+        except retryable_errors as e:
+            scheduler.release()
+            if attempt >= API_MAX_RETRIES:
+                if isinstance(e, openai.RateLimitError):
+                    raise ApiBusyError("The AI service is busy right now (rate limited). Please try again in a minute.") from e
+                raise
+            time.sleep(_backoff_delay(attempt, e))
+            attempt += 1
+        except Exception:
+            scheduler.release()
+            raise
+
+# --- RESPONSE CACHE ---
+# Identical (model, prompt, params) requests are answered from here instead of the network.
+response_cache = TieredCache(
+    path=None if os.getenv("RESPONSE_CACHE_DISABLED") else os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3"),
+    max_memory_items=int(os.getenv("RESPONSE_CACHE_MEMORY_ITEMS", "256")),
+    max_disk_bytes=int(os.getenv("RESPONSE_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(7 * 24 * 3600))) or None,
+)
+
+_network_stats_lock = threading.Lock()
+_network_stats = {"network_calls": 0, "network_seconds": 0.0}
+
+
+# --- SINGLE FLIGHT ---
+# Identical requests that arrive while one is already running (e.g. a whole class
+# pasting the same paragraph) share that request instead of each sending their own.
+# The upstream call runs on its own pool so it survives any one caller giving up.
+_flight_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("API_MAX_FLIGHTS", "32")),
+    thread_name_prefix="openrouter-flight",
 )
+in_flight = SingleFlight(_flight_executor)
+
+
+def _normalize_prompt(prompt: str) -> str:
+    """Canonicalises line endings and trailing whitespace so trivially different pastes share a key."""
+    lines = prompt.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    text = "\n".join(line.rstrip() for line in lines).strip()
+    return re.sub(r"\n{3,}", "\n\n", text)
+
+
+def make_request_key(prompt: str, model: str, generation_params: dict) -> str:
+    """Content-addressed cache key for one chat-completion request."""
+    return make_cache_key(model, _normalize_prompt(prompt), generation_params)
+
+
+def get_scheduler_stats() -> dict:
+    """Admissions, timeouts, active requests and queue depth per lane."""
+    return scheduler.snapshot()
+
+
+def get_cache_stats() -> dict:
+    """Cache counters plus an estimate of the network time saved by hits."""
+    stats = response_cache.stats()
+    with _network_stats_lock:
+        stats.update(_network_stats)
+    calls = stats["network_calls"]
+    avg_latency = stats["network_seconds"] / calls if calls else 0.0
+    stats["avg_network_seconds"] = avg_latency
+    stats["estimated_seconds_saved"] = stats["hits"] * avg_latency
+    stats["coalesced_calls"] = in_flight.stats["coalesced"]
+    stats["in_flight"] = in_flight.in_flight()
+    return stats
+
+
+def _usage_tokens(usage):
+    """(prompt_tokens, completion_tokens) from a response's usage block, or (None, None)."""
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def _record_call_timing(model: str, cached: bool, streamed: bool, ttft_seconds, total_seconds: float, retries: int = 0,
+                        feature: str = "other", usage=None):
+    """Records one call in telemetry; `ttft_seconds` is None when no first token was observed (non-streamed)."""
+    prompt_tokens, completion_tokens = _usage_tokens(usage)
+    telemetry.record_call(feature, model, cached, streamed, total_seconds, ttft_seconds,
+                          prompt_tokens, completion_tokens, retries)
+    if not cached:
+        with _network_stats_lock:
+            _network_stats["network_calls"] += 1
+            _network_stats["network_seconds"] += total_seconds
+
+
+def get_recent_call_timings() -> list:
+    """Time-to-first-token and total time of the most recent calls, oldest first."""
+    return telemetry.recent()
+
+
+_REQUEST_HEADERS = {
+    "HTTP-Referer": "https://yourdomain.com",
+    "X-Title": "EduTutorAI"
+}
+
+
+# Token counts for a stream closed before its usage block arrived (e.g. a hedge loser).
+_EstimatedUsage = namedtuple("_EstimatedUsage", ["prompt_tokens", "completion_tokens"])
+
+
+class _StreamProgress:
+    """What has been read so far from one streamed completion."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.parts = []
+        self.ttft = None
+        self.usage = None
+        self.complete = False
+
+    def read(self, stream, on_delta):
+        """Reads `stream`, passing each text delta to `on_delta`; stops early once it returns False."""
+        for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                self.usage = chunk.usage  # Sent with the final chunk.
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - self.started
+                if not on_delta(delta):
+                    return
+                self.parts.append(delta)
+        self.complete = True
+
+    def record(self, model, retries, feature):
+        total = time.perf_counter() - self.started
+        _record_call_timing(model, False, True, total if self.ttft is None else self.ttft, total, retries, feature,
+                            self.usage)
+
+    def cache(self, key):
+        content = "".join(self.parts)
+        if content:
+            response_cache.set(key, content)
+
+
+def _pump_stream(flight, key, prompt, model, lane, feature, generation_params):
+    """Flight producer: streams one completion upstream and publishes its chunks."""
+    progress = _StreamProgress()
+    stream, retries = _send_with_retries(
+        lane,
+        extra_headers=_REQUEST_HEADERS,
+        model=model,
+        messages=[
+            {"role": "user", "content": prompt}
+        ],
+        stream=True,
+        stream_options={"include_usage": True},
+        **generation_params
+    )
+
+    def publish(delta):
+        flight.publish(delta)
+        return not flight.abandoned  # Every reader left; stop paying for tokens nobody will see.
+
+    try:
+        progress.read(stream, publish)
+    finally:
+        # The slot covers the whole stream; an abandoned stream frees it too.
+        stream.close()
+        scheduler.release()
+    if progress.complete:
+        progress.record(model, retries, feature)
+        progress.cache(key)
+
 
-def call_openrouter_api(prompt: str, model: str = "meta-llama/llama-3.3-8b-instruct:free") -> str:
-    completion = client.chat.completions.create(
-        extra_headers={
-            "HTTP-Referer": "https://yourdomain.com",
-            "X-Title": "EduTutorAI"
-        },
+def _fetch_completion(flight, key, prompt, model, lane, feature, generation_params):
+    """Flight producer: one non-streaming completion, published as a single chunk."""
+    started = time.perf_counter()
+    completion, retries = _send_with_retries(
+        lane,
+        extra_headers=_REQUEST_HEADERS,
         model=model,
         messages=[
             {"role": "user", "content": prompt}
-        ]
+        ],
+        **generation_params
     )
-    return completion.choices[0].message.content
+    scheduler.release()
+    # Without streaming there is no first-token time; its total would skew the TTFT percentiles hedging uses.
+    elapsed = time.perf_counter() - started
+    _record_call_timing(model, False, False, None, elapsed, retries, feature, getattr(completion, "usage", None))
+
+    content = completion.choices[0].message.content
+    if content:
+        response_cache.set(key, content)
+        flight.publish(content)
+
+
+# --- MODEL ROUTING & HEDGED REQUESTS ---
+# MODEL_ROUTES_JSON picks the model per feature, e.g.
+#   {"chat": {"model": "a", "hedge_model": "b"}, "quiz": {"model": "c"}, "default": {"model": "d"}}
+# Features without a route use their parent feature's (ROUTE_PARENTS), then "default",
+# then DEFAULT_MODEL. With a hedge_model, an interactive request whose first token has
+# not arrived within the feature's p95 time-to-first-token is duplicated to the hedge
+# model; whichever answers first is used and the other is closed. HEDGE_MAX_RATIO caps the extra requests (and tokens)
+# as a share of hedge-eligible requests.
+Route = namedtuple("Route", ["model", "hedge_model"])
+MODEL_ROUTES = json.loads(os.getenv("MODEL_ROUTES_JSON", "{}"))
+ROUTE_PARENTS = {
+    "explain_quiz": "simplify",
+    "personalize_levels": "personalize",
+    "quiz_structured": "quiz",
+    "chat_summary": "chat",
+}
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS", "3.0"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.25"))
+HEDGE_MAX_RATIO = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))
+
+_hedge_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("API_MAX_FLIGHTS", "32")),
+    thread_name_prefix="openrouter-hedge",
+)
+_routing_lock = threading.Lock()
+_routing_stats = {"hedge_eligible": 0, "hedged": 0, "hedge_wins": 0, "primary_wins": 0, "cancelled_attempts": 0}
+
+
+def route_for(feature: str) -> Route:
+    """The configured (model, hedge_model) for a feature."""
+    route = MODEL_ROUTES.get(feature) or MODEL_ROUTES.get(ROUTE_PARENTS.get(feature)) or MODEL_ROUTES.get("default") or {}
+    return Route(route.get("model") or DEFAULT_MODEL, route.get("hedge_model"))
+
+
+def hedge_delay(feature: str) -> float:
+    """Seconds to wait for the first token before hedging: the feature's recent p95."""
+    p95 = telemetry.latency_percentile("llm_ttft_seconds", feature, 95, HEDGE_MIN_SAMPLES)
+    return HEDGE_DEFAULT_DELAY_SECONDS if p95 is None else max(HEDGE_MIN_DELAY_SECONDS, p95)
+
+
+def get_routing_stats() -> dict:
+    """Hedging counters plus the configured routes."""
+    with _routing_lock:
+        stats = dict(_routing_stats)
+    stats["routes"] = {feature: route_for(feature)._asdict() for feature in MODEL_ROUTES}
+    return stats
+
+
+def _close_quietly(stream):
+    try:
+        stream.close()
+    except Exception:
+        pass
+
+
+class _HedgeRace:
+    """First-token race between the primary and hedge requests of one flight."""
+
+    def __init__(self, flight):
+        self.flight = flight
+        self.winner = None
+        self.errors = {}
+        self.finished = set()
+        self._streams = {}
+        self._cond = threading.Condition()
+
+    def opened(self, model, stream) -> bool:
+        """Registers an attempt's open stream; False if another attempt already won."""
+        with self._cond:
+            self._streams[model] = stream
+            return self.winner in (None, model)
+
+    def claim(self, model) -> bool:
+        """Called on an attempt's first token: the first caller wins and the others are closed."""
+        with self._cond:
+            if self.winner is not None:
+                return self.winner == model
+            self.winner = model
+            losers = [stream for other, stream in self._streams.items() if other != model]
+            self._cond.notify_all()
+        for stream in losers:
+            _close_quietly(stream)  # Their reading threads see the error and drop out.
+        return True
+
+    def end(self, model, error=None):
+        with self._cond:
+            self.finished.add(model)
+            if error is not None:
+                self.errors[model] = error
+            self._cond.notify_all()
+
+    def wait(self, predicate, timeout=None):
+        with self._cond:
+            return self._cond.wait_for(predicate, timeout)
+
+
+def _race_attempt(race, key, prompt, model, lane, feature, generation_params):
+    """One streamed attempt of a hedged flight; publishes only if it wins the race.
+
+    A losing attempt is still recorded, as a "hedge_loser" call, so the extra tokens
+    and cost of hedging show up in telemetry.
+    """
+    progress = _StreamProgress()
+    try:
+        stream, retries = _send_with_retries(
+            lane,
+            still_wanted=lambda: race.winner in (None, model),
+            extra_headers=_REQUEST_HEADERS,
+            model=model,
+            messages=[
+                {"role": "user", "content": prompt}
+            ],
+            stream=True,
+            stream_options={"include_usage": True},
+            **generation_params
+        )
+    except Exception as e:
+        race.end(model, e)
+        return
+    if stream is None:  # The race was decided while this attempt waited for a slot.
+        race.end(model)
+        return
+
+    def publish(delta):
+        if not race.claim(model):
+            return False
+        race.flight.publish(delta)
+        return not race.flight.abandoned
+
+    error = None
+    try:
+        if race.opened(model, stream):
+            progress.read(stream, publish)
+    except Exception as e:
+        error = e
+    finally:
+        _close_quietly(stream)
+        scheduler.release()
+        if race.winner not in (None, model):
+            progress.usage = progress.usage or _EstimatedUsage(count_tokens(prompt), count_tokens("".join(progress.parts)))
+            progress.record(model, retries, "hedge_loser")
+        elif progress.complete:
+            progress.record(model, retries, feature)
+            progress.cache(key)
+        race.end(model, error)
+
+
+def _hedged_produce(flight, key, prompt, route, lane, feature, generation_params):
+    """Flight producer: the primary model, plus the hedge model if the primary is slow."""
+    race = _HedgeRace(flight)
+    attempts = [route.model]
+    _hedge_executor.submit(_race_attempt, race, key, prompt, route.model, lane, feature, generation_params)
+    # An early failure of the primary also triggers the hedge, as a failover.
+    race.wait(lambda: race.winner is not None or race.errors or route.model in race.finished, hedge_delay(feature))
+    primary_answered = route.model in race.finished and route.model not in race.errors  # With an empty reply.
+    with _routing_lock:
+        _routing_stats["hedge_eligible"] += 1
+        hedge = (race.winner is None and not primary_answered
+                 and _routing_stats["hedged"] < HEDGE_MAX_RATIO * _routing_stats["hedge_eligible"])
+        if hedge:
+            _routing_stats["hedged"] += 1
+    if hedge:
+        attempts.append(route.hedge_model)
+        telemetry.increment("llm_hedged_calls_total", feature, route.hedge_model)
+        _hedge_executor.submit(_race_attempt, race, key, prompt, route.hedge_model, lane, feature, generation_params)
+    race.wait(lambda: race.winner in race.finished or len(race.finished) == len(attempts))
+
+    if hedge and race.winner is not None:
+        with _routing_lock:
+            _routing_stats["hedge_wins" if race.winner == route.hedge_model else "primary_wins"] += 1
+            _routing_stats["cancelled_attempts"] += 1
+        telemetry.increment("llm_hedge_wins_total", feature, race.winner)
+    if race.winner in race.errors:
+        raise race.errors[race.winner]
+    if race.winner is None and race.errors:
+        raise race.errors.get(route.model) or next(iter(race.errors.values()))
+    # No winner and no error: every attempt finished with an empty reply.
+
+
+def _join_flight(key, prompt, route, lane, feature, generation_params, stream):
+    """Joins the in-flight request for `key`, starting it (hedged if the route says so) if needed."""
+    if route.hedge_model and route.hedge_model != route.model and lane == "interactive":
+        produce = lambda f: _hedged_produce(f, key, prompt, route, lane, feature, generation_params)
+    else:
+        producer = _pump_stream if stream else _fetch_completion
+        produce = lambda f: producer(f, key, prompt, route.model, lane, feature, generation_params)
+    flight, leader = in_flight.join(key, produce)
+    if not leader:
+        telemetry.increment("llm_coalesced_calls_total", feature, route.model)
+    return flight
+
+
+def _resolve_route(model, feature, prompt):
+    """An explicit `model` is used as is (no hedging); otherwise the feature's configured route."""
+    route = Route(model, None) if model else route_for(feature)
+    telemetry.increment("llm_routed_calls_total", feature, route.model)
+    budget = prompt_budget(feature)
+    if budget and count_tokens(prompt) > budget:
+        # Prompt builders fit their feature's budget; this counts the ones that do not.
+        telemetry.increment("prompt_over_budget_total", feature, route.model)
+    return route
+
+
+def stream_openrouter_api(prompt: str, model: str = None, bypass_cache: bool = False, lane: str = "interactive",
+                          feature: str = "other", timeout: float = None, cancel=None, **generation_params):
+    """Yields the completion text in chunks as they arrive from OpenRouter.
+
+    A cache hit is yielded as a single chunk. The full text is cached only once the
+    stream has been consumed to the end, so an abandoned stream never caches a prefix.
+    Identical requests already in flight are joined rather than sent again.
+    """
+    route = _resolve_route(model, feature, prompt)
+    model = route.model
+    key = make_request_key(prompt, model, generation_params)
+    started = time.perf_counter()
+    if not bypass_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            elapsed = time.perf_counter() - started
+            _record_call_timing(model, True, True, elapsed, elapsed, feature=feature)
+            yield cached
+            return
+
+    flight = _join_flight(key, prompt, route, lane, feature, generation_params, stream=True)
+    yield from flight.iter_chunks(timeout, cancel)
+
+
+def call_openrouter_api(prompt: str, model: str = None, bypass_cache: bool = False, stream: bool = False,
+                        lane: str = "interactive", feature: str = "other", timeout: float = None, cancel=None,
+                        **generation_params):
+    """Sends `prompt` to OpenRouter, serving repeated requests from the response cache.
+
+    Extra keyword arguments (temperature, max_tokens, ...) are forwarded to the API and
+    are part of the cache key. `bypass_cache=True` always hits the network, but still
+    refreshes the cached value. With `stream=True` a generator of text chunks is
+    returned instead of the full string (see stream_openrouter_api). `lane` selects the
+    fair-scheduler queue: "interactive" for user-facing calls, "batch" for bulk work.
+    `feature` ("quiz", "simplify", "personalize", "chat", ...) tags the call's telemetry
+    and, unless `model` is given, picks the model (and hedge model) from MODEL_ROUTES_JSON.
+
+    Concurrent calls with the same cache key share one upstream request (single
+    flight). `timeout` (seconds, raises TimeoutError) and `cancel` (a threading.Event,
+    raises CancelledError) apply to this caller's wait only; the shared request keeps
+    going for the other callers.
+    """
+    if stream:
+        return stream_openrouter_api(prompt, model, bypass_cache, lane, feature, timeout, cancel, **generation_params)
+
+    route = _resolve_route(model, feature, prompt)
+    model = route.model
+    key = make_request_key(prompt, model, generation_params)
+    started = time.perf_counter()
+    if not bypass_cache:
+        cached = response_cache.get(key)
+        if cached is not None:
+            elapsed = time.perf_counter() - started
+            _record_call_timing(model, True, False, None, elapsed, feature=feature)
+            return cached
+
+    flight = _join_flight(key, prompt, route, lane, feature, generation_params, stream=False)
+    return flight.result(timeout, cancel)
+
+
+# --- CONCURRENT CALLS ---
+# A bounded pool shared by all sessions, so independent LLM calls can overlap
+# without letting one page spawn an unbounded number of upstream requests.
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("API_MAX_WORKERS", "8")),
+    thread_name_prefix="openrouter-call",
+)
+
+
+def run_in_parallel(calls: dict, timeout: float = None) -> tuple:
+    """Runs independent zero-argument callables concurrently.
+
+    `calls` maps a name to a callable. Returns `(results, errors)`: two dicts keyed by
+    name, so a failure in one branch still leaves the other branches' results usable.
+    Total wait is roughly the slowest call rather than the sum of all of them.
+    """
+    futures = {name: _executor.submit(fn) for name, fn in calls.items()}
+    wait(futures.values(), timeout=timeout)
+    results, errors = {}, {}
+    for name, future in futures.items():
+        if not future.done():
+            future.cancel()
+            errors[name] = TimeoutError(f"'{name}' did not finish within {timeout}s")
+        elif future.exception() is not None:
+            errors[name] = future.exception()
+        else:
+            results[name] = future.result()
+    return results, errors
+
+
+def iterate_in_background(make_iterable, *args, stop=None, **kwargs):
+    """Runs `make_iterable(*args, **kwargs)` on the shared pool and returns an iterator
+    over its items, yielded as soon as the background thread produces them.
+
+    An exception raised in the background is re-raised by the returned iterator. The
+    background iteration stops, and the producer is closed (which releases its upstream
+    request), once `stop` (a threading.Event, e.g. a job's cancel_event) is set or the
+    returned iterator is closed or dropped.
+    """
+    items = queue.Queue()
+    done = object()
+    left = threading.Event()
+
+    def pump():
+        iterable = make_iterable(*args, **kwargs)
+        try:
+            for item in iterable:
+                if left.is_set() or (stop is not None and stop.is_set()):
+                    break
+                items.put((item, None))
+            items.put((done, None))
+        except BaseException as e:
+            items.put((done, e))
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
+
+    _executor.submit(pump)
+
+    def drain():
+        try:
+            while True:
+                item, error = items.get()
+                if item is done:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            left.set()
+
+    return drain()
@@ -1,18 +1,31 @@
 import streamlit as st
 import time
-import io # For handling file streams
+import uuid
 from utils import (
-    extract_text_from_pdf, extract_text_from_docx, # For file processing
-    generate_personalized_content_for_teacher,
-    generate_quiz_for_teacher,
-    simplify_student_text,
-    generate_quiz_from_student_text,
+    extract_text_from_upload, # For file processing
     answer_follow_up_question,
-    grade_assessment
+    record_chat_turn,
+    grade_assessment,
+    grade_class_submissions,
+    save_questions_to_bank,
+    assemble_quiz_from_bank,
+    show_notices,
+    submit_job,
+    submit_teacher_quiz_job,
+    get_job,
+    cancel_job,
+    get_job_stats,
+    get_quiz_generation_metrics
 )
+from api_service import get_cache_stats, get_recent_call_timings, get_routing_stats, get_scheduler_stats
+from document_store import document_store, document_handle
+from tutor_core import Notice
+from conversation import Conversation
+from telemetry import telemetry, start_metrics_server
 
 # Page Configuration
 st.set_page_config(page_title="EduTutor AI", layout="wide", initial_sidebar_state="expanded")
+start_metrics_server()  # No-op unless TELEMETRY_PORT is set.
 st.title("🎓 EduTutor AI")
 st.caption("Personalized Learning and Assessment System")
 
@@ -20,48 +33,436 @@ st.caption("Personalized Learning and Assessment System")
 # General
 if 'user_role' not in st.session_state: st.session_state.user_role = None
 
+# Background jobs: kind -> job id. The ids are mirrored in the URL, so a reload or a
+# reconnect (new session) picks the running jobs back up instead of losing the work.
+if 'job_owner' not in st.session_state: st.session_state.job_owner = uuid.uuid4().hex
+if 'job_notices' not in st.session_state: st.session_state.job_notices = []
+if 'active_jobs' not in st.session_state:
+    st.session_state.active_jobs = dict(
+        item.split(":", 1) for item in st.query_params.get("jobs", "").split(",") if ":" in item
+    )
+    if st.session_state.active_jobs and not st.session_state.user_role:
+        first_kind = next(iter(st.session_state.active_jobs))
+        st.session_state.user_role = "Teacher" if first_kind.startswith("teacher") else "Student"
+
 # Teacher related
 if 'teacher_input_method' not in st.session_state: st.session_state.teacher_input_method = "Paste Text"
-if 'teacher_content_input_value' not in st.session_state: st.session_state.teacher_content_input_value = ""
+if 'teacher_content_handle' not in st.session_state: st.session_state.teacher_content_handle = None
 if 'teacher_generated_questions' not in st.session_state: st.session_state.teacher_generated_questions = []
 if 'teacher_personalized_content_preview' not in st.session_state: st.session_state.teacher_personalized_content_preview = ""
 if 'teacher_file_uploader_key' not in st.session_state: st.session_state.teacher_file_uploader_key = 0 # To reset file uploader
 
 # Student related
 if 'student_input_method' not in st.session_state: st.session_state.student_input_method = "Paste Text"
-if 'student_main_input_text_value' not in st.session_state: st.session_state.student_main_input_text_value = ""
-if 'processed_text_for_qna_context' not in st.session_state: st.session_state.processed_text_for_qna_context = ""
+if 'student_main_input_handle' not in st.session_state: st.session_state.student_main_input_handle = None
+if 'processed_text_handle' not in st.session_state: st.session_state.processed_text_handle = None
 if 'simplified_student_text' not in st.session_state: st.session_state.simplified_student_text = ""
 if 'student_custom_questions' not in st.session_state: st.session_state.student_custom_questions = []
 if 'student_custom_answers' not in st.session_state: st.session_state.student_custom_answers = {}
 if 'student_custom_quiz_submitted' not in st.session_state: st.session_state.student_custom_quiz_submitted = False
-if 'student_conversation_history' not in st.session_state: st.session_state.student_conversation_history = []
+# Chat: recent turns plus a running summary of older ones, compacted in the background.
+if 'student_conversation' not in st.session_state: st.session_state.student_conversation = Conversation()
 if 'student_file_uploader_key' not in st.session_state: st.session_state.student_file_uploader_key = 0 # To reset file uploader
 
 
+# --- Documents ---
+# Session State holds only handles into the process-wide document store, which keeps
+# each distinct text once (compressed), however many sessions and keys refer to it.
+TEXT_AREA_MAX_CHARS = 20000  # Longer uploads are not copied into the text area's widget state.
+
+def hold_handle(state_key, handle):
+    """Points `state_key` at a stored document (None clears it), moving the reference."""
+    previous = st.session_state.get(state_key)
+    if handle != previous:
+        document_store.acquire(handle)
+        document_store.release(previous)
+        st.session_state[state_key] = handle
+
+def hold_document(state_key, text):
+    handle = document_handle(text) if text else None
+    if handle and handle != st.session_state.get(state_key):
+        document_store.put(text)
+    hold_handle(state_key, handle)
+
+def held_text(state_key):
+    return document_store.get(st.session_state.get(state_key)) or ""
+
+# --- Text inputs filled from uploads ---
+# The text areas take their value from Session State rather than `value=`, so an
+# upload can fill them in the same run (no extra st.rerun()) and actions can clear them.
+def set_text_input(widget_key, state_key, text):
+    hold_document(state_key, text)
+    st.session_state.pop(widget_key, None)  # Re-seeded from state_key when next rendered.
+
+def text_input_area(label, widget_key, state_key, height=200):
+    if widget_key not in st.session_state:
+        text = held_text(state_key)
+        st.session_state[widget_key] = text if len(text) <= TEXT_AREA_MAX_CHARS else ""
+    typed = st.text_area(label, height=height, key=widget_key)
+    if not typed:
+        text = held_text(state_key)
+        if len(text) > TEXT_AREA_MAX_CHARS:
+            # A long upload stays in the store only; typing in the box replaces it.
+            st.caption(f"📄 Using the uploaded document ({len(text.split()):,} words). Type above to replace it.")
+            return text
+    hold_document(state_key, typed)  # Sync if user types
+    return typed
+
+# --- Background jobs ---
+JOB_POLL_SECONDS = 1.0
+JOB_LABELS = {
+    "teacher_preview": "Personalized preview",
+    "teacher_quiz": "Quiz",
+    "teacher_resources": "Preview & quiz",
+    "student_processing": "Explanation & quiz",
+}
+
+def sync_job_query_params():
+    if st.session_state.active_jobs:
+        st.query_params["jobs"] = ",".join(f"{kind}:{job_id}" for kind, job_id in st.session_state.active_jobs.items())
+    else:
+        st.query_params.pop("jobs", None)
+
+def track_job(kind, job):
+    """Makes `job` this session's job of `kind`, cancelling the one it replaces."""
+    previous = st.session_state.active_jobs.get(kind)
+    if previous and previous != job.id:
+        cancel_job(previous)
+    st.session_state.active_jobs[kind] = job.id
+    sync_job_query_params()
+
+def cancel_all_jobs():
+    for job_id in st.session_state.active_jobs.values():
+        cancel_job(job_id)
+    st.session_state.active_jobs = {}
+    sync_job_query_params()
+
+def reset_conversation():
+    st.session_state.student_conversation.cancel_compaction()
+    st.session_state.student_conversation = Conversation()
+
 # --- Switch Role Logic ---
 def switch_role(new_role):
+    cancel_all_jobs()
     # Reset relevant states when switching roles
     st.session_state.teacher_input_method = "Paste Text"
-    st.session_state.teacher_content_input_value = ""
+    set_text_input("teacher_content_area_widget_key", "teacher_content_handle", "")
     st.session_state.teacher_generated_questions = []
     st.session_state.teacher_personalized_content_preview = ""
     st.session_state.teacher_file_uploader_key +=1
 
 
     st.session_state.student_input_method = "Paste Text"
-    st.session_state.student_main_input_text_value = ""
-    st.session_state.processed_text_for_qna_context = ""
+    set_text_input("student_main_input_widget_key", "student_main_input_handle", "")
+    hold_handle("processed_text_handle", None)
     st.session_state.simplified_student_text = ""
     st.session_state.student_custom_questions = []
     st.session_state.student_custom_answers = {}
     st.session_state.student_custom_quiz_submitted = False
-    st.session_state.student_conversation_history = []
+    reset_conversation()
     st.session_state.student_file_uploader_key +=1
 
     st.session_state.user_role = new_role
     st.rerun()
 
+# --- Shared rendering helpers ---
+def render_teacher_question(i, q):
+    st.markdown(f"**Q{i+1}: {q.get('question_text', 'N/A')}**")
+    if isinstance(q.get("options"), list):
+        for opt_text in q["options"]: st.write(f"- {opt_text}")
+    else: st.warning(f"Options for Q{i+1} not in list format.")
+    st.write(f"✅ Correct Answer: {q.get('correct_answer', 'Not specified')}")
+    st.divider()
+
+# --- Sidebar: AI response cache stats ---
+def render_cache_stats_sidebar():
+    stats = get_cache_stats()
+    with st.sidebar.expander("⚡ AI Cache Stats", expanded=False):
+        st.write(f"Hits: {stats['hits']} (memory {stats['memory_hits']}, disk {stats['disk_hits']})")
+        st.write(f"Misses: {stats['misses']} · Hit rate: {stats['hit_rate']:.0%}")
+        st.write(f"Evictions: {stats['evictions']}")
+        st.write(f"Shared in-flight requests: {stats['coalesced_calls']}")
+        st.write(f"Est. time saved: {stats['estimated_seconds_saved']:.1f}s")
+        jobs = get_job_stats()
+        docs = document_store.stats()
+        st.write(f"Documents: {docs['documents']} stored ({docs['referenced_documents']} in use) · "
+                 f"{docs['memory_bytes'] / 1e6:.1f} MB in memory · {docs['disk_bytes'] / 1e6:.1f} MB on disk "
+                 f"({docs['compression_ratio']:.1f}x compressed)")
+        st.write(f"Background jobs: {jobs['active']} running · {jobs['reused']} prefetched result(s) reused")
+        scheduler = get_scheduler_stats()
+        queued = " · ".join(f"{lane} {depth}" for lane, depth in sorted(scheduler["queued"].items()) if depth)
+        st.write(f"AI requests: {scheduler['active']} running · {queued or 'none'} queued "
+                 f"(peak queue {scheduler['max_queue_depth']}, {scheduler['timed_out']} timed out)")
+        timings = get_recent_call_timings()
+        if timings:
+            last = timings[-1]
+            first_token = f"first token {last['ttft_seconds']:.2f}s · " if last["ttft_seconds"] is not None else ""
+            st.write(f"Last call: {first_token}total {last['wall_seconds']:.2f}s")
+    latency = telemetry.snapshot()["latency"].get("llm_call_seconds", {})
+    if latency:
+        with st.sidebar.expander("📊 AI Call Latency", expanded=False):
+            for feature, summary in sorted(latency.items()):
+                st.write(f"{feature}: p50 {summary['p50']:.2f}s · p95 {summary['p95']:.2f}s ({summary['count']} calls)")
+            structured = get_quiz_generation_metrics()
+            if structured["quizzes"]:
+                st.write(f"Exact-count quizzes: {structured['quizzes']:.0f} · {structured['avg_round_trips']:.1f} calls and "
+                         f"~{structured['avg_tokens_est']:.0f} tokens per quiz · {structured['short_quizzes']:.0f} short")
+            routing = get_routing_stats()
+            if routing["hedged"]:
+                st.write(f"Hedged requests: {routing['hedged']} of {routing['hedge_eligible']} "
+                         f"(hedge won {routing['hedge_wins']}, primary won {routing['primary_wins']})")
+
+# --- Fragments ---
+# Each panel reruns on its own when its widgets change, instead of re-executing the
+# whole page (history, explanation markdown, uploads) on every chat message or answer.
+def remember_bank_save(questions, source_handle):
+    """Banks freshly generated questions and keeps a note to show after the rerun."""
+    if not questions:
+        return
+    added, duplicates = save_questions_to_bank(
+        questions, st.session_state.get("teacher_subject_widget_key", ""), document_store.get(source_handle) or ""
+    )
+    st.session_state.teacher_bank_message = (
+        f"Question bank: saved {added} new question(s), skipped {duplicates} near-duplicate(s)."
+    )
+
+def clear_teacher_input_if_unchanged(source_handle):
+    """Clears the content area for the next input, unless it was edited while the job ran."""
+    if st.session_state.teacher_content_handle == source_handle:
+        set_text_input("teacher_content_area_widget_key", "teacher_content_handle", "")
+        st.session_state.teacher_file_uploader_key += 1 # Reset uploader for next time
+
+def apply_job_result(kind, job):
+    """Moves a finished job's result into Session State; messages are shown after the rerun."""
+    notices = st.session_state.job_notices
+    notices.extend(job.notices)
+    label = JOB_LABELS.get(kind, kind)
+    if job.status == "cancelled":
+        notices.append(Notice("info", f"{label}: cancelled."))
+        return
+    if job.status == "failed":
+        notices.append(Notice("error", f"{label}: could not be generated: {job.error}"))
+        return
+    result = job.result
+    for branch, err in result.get("errors", {}).items():
+        notices.append(Notice("error", f"Could not generate the {branch}: {err}"))
+
+    if kind == "teacher_preview":
+        st.session_state.teacher_personalized_content_preview = result["content"]
+        # Likely next step: the quiz for the same content, prefetched at low priority.
+        if result["content"] and st.session_state.teacher_content_handle == result["source_handle"]:
+            submit_teacher_quiz_job(
+                st.session_state.job_owner, held_text("teacher_content_handle"),
+                st.session_state.get("teacher_num_q_widget_key", 3),
+                st.session_state.get("teacher_exact_count_mode", False), speculative=True
+            )
+    elif kind == "teacher_resources":
+        st.session_state.teacher_personalized_content_preview = result["content"]
+        st.session_state.teacher_generated_questions = result["questions"]
+        remember_bank_save(result["questions"], result["source_handle"])
+    elif kind == "teacher_quiz":
+        questions = result["questions"]
+        st.session_state.teacher_generated_questions = questions
+        st.session_state.teacher_quiz_generation_stats = result["stats"]
+        if questions: notices.append(Notice("info", f"{len(questions)} questions generated."))
+        else: notices.append(Notice("warning", "Could not generate questions. AI might need different text."))
+        remember_bank_save(questions, result["source_handle"])
+        st.session_state.teacher_personalized_content_preview = ""
+        clear_teacher_input_if_unchanged(result["source_handle"])
+    elif kind == "student_processing":
+        hold_handle("processed_text_handle", result["source_handle"])
+        st.session_state.simplified_student_text = result["explanation"]
+        st.session_state.student_custom_questions = result["questions"]
+        if not result["explanation"] and not result["questions"]:
+            notices.append(Notice("warning", "AI couldn't process the text well. Try different text or ensure good extraction."))
+        st.session_state.student_custom_answers = {}
+        st.session_state.student_custom_quiz_submitted = False
+        reset_conversation()
+        if st.session_state.student_main_input_handle == result["source_handle"]:
+            set_text_input("student_main_input_widget_key", "student_main_input_handle", "") # Clear for next input
+            st.session_state.student_file_uploader_key += 1 # Reset uploader for next time
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_status_panel():
+    """Polls this session's jobs, showing partial output; the page reruns once one finishes."""
+    finished = False
+    for kind, job_id in list(st.session_state.active_jobs.items()):
+        job = get_job(job_id)
+        if job is None or job.finished:
+            del st.session_state.active_jobs[kind]
+            if job is not None:
+                apply_job_result(kind, job)
+            finished = True
+            continue
+        label = JOB_LABELS.get(kind, kind)
+        if job.progress:
+            st.progress(job.progress, text=f"{label}: {job.message}")
+        else:
+            st.caption(f"⏳ {label}: {job.message or 'waiting for a worker...'}")
+        if job.partial.get("text"):
+            st.markdown(job.partial["text"])
+        for i, q in enumerate(job.partial.get("questions", [])):
+            st.markdown(f"**{i+1}. {q.get('question_text', '')}**")
+        if st.button("Cancel", key=f"cancel_job_{job_id}"):
+            cancel_job(job_id)
+    if finished:
+        sync_job_query_params()
+        st.rerun()
+
+def render_job_area():
+    """Messages from jobs finished since the last run, then the status of running ones."""
+    show_notices(st.session_state.job_notices)
+    st.session_state.job_notices = []
+    if st.session_state.active_jobs:
+        job_status_panel()
+
+@st.fragment
+def teacher_quiz_panel():
+    num_questions = st.number_input("Number of Quiz Questions:", min_value=1, max_value=10, value=3, key="teacher_num_q_widget_key")
+    exact_count_mode = st.checkbox(
+        "Guarantee exact question count (structured JSON mode)", key="teacher_exact_count_mode",
+        help="Validates each question and asks the AI only for the missing ones if it returns too few."
+    )
+    current_teacher_input = held_text("teacher_content_handle")
+
+    if st.button("📝 Generate Quiz from My Content", key="teacher_generate_quiz_bttn"):
+        if current_teacher_input.strip():
+            # Picks up the quiz prefetched after the preview when content and settings match.
+            track_job("teacher_quiz", submit_teacher_quiz_job(
+                st.session_state.job_owner, current_teacher_input, num_questions, exact_count_mode
+            ))
+            st.rerun() # Whole page: the job status area is drawn above this panel.
+        else:
+            st.warning("Please provide content to generate a quiz.")
+            st.session_state.teacher_generated_questions = []
+
+    if st.button("📚 Assemble Quiz from Question Bank (no AI call)", key="teacher_assemble_from_bank_bttn"):
+        questions = assemble_quiz_from_bank(
+            num_questions, st.session_state.get("teacher_subject_widget_key", ""), current_teacher_input
+        )
+        if questions:
+            st.session_state.teacher_generated_questions = questions
+            st.session_state.teacher_quiz_generation_stats = None
+            st.session_state.teacher_bank_message = f"Assembled {len(questions)} questions from the question bank."
+            st.rerun()
+
+    if st.session_state.get("teacher_bank_message"):
+        st.caption(st.session_state.teacher_bank_message)
+
+    if st.session_state.teacher_generated_questions:
+        stats = st.session_state.get("teacher_quiz_generation_stats")
+        if stats:
+            st.caption(
+                f"{stats['accepted']}/{stats['requested']} valid questions in {stats['round_trips']} "
+                f"round trip(s), ~{stats['total_tokens_est']:,} tokens."
+            )
+        with st.expander("View Generated Quiz", expanded=True):
+            for i, q in enumerate(st.session_state.teacher_generated_questions):
+                render_teacher_question(i, q)
+
+@st.fragment
+def class_grading_panel():
+    from class_grading import submissions_template_csv
+
+    questions = st.session_state.teacher_generated_questions
+    st.download_button(
+        "⬇️ Submissions template (CSV)", submissions_template_csv(questions),
+        file_name="class_submissions.csv", mime="text/csv", key="class_template_download"
+    )
+    submissions_file = st.file_uploader(
+        "Upload class submissions (CSV or JSONL, answers keyed by question id)",
+        type=["csv", "jsonl", "json"], key="class_submissions_uploader"
+    )
+    if submissions_file is None:
+        return
+    report = grade_class_submissions(submissions_file.getvalue(), submissions_file.name, questions)
+    if report is None:
+        return
+    summary = report.summary()
+    st.success(f"Graded {summary['students']} students · mean {summary['mean_score']:.1f}/{summary['questions']} "
+               f"({summary['mean_percent']:.0f}%) · median {summary['median_score']:.1f}")
+    st.dataframe(report.item_analysis(), use_container_width=True)
+    st.download_button("⬇️ Scores (CSV)", report.scores_csv(), file_name="class_scores.csv",
+                       mime="text/csv", key="class_scores_download")
+    student = st.selectbox("Feedback for student:", report.student_ids, index=None, key="class_feedback_student")
+    if student is not None:
+        for f_item in report.feedback(student): st.info(f_item)
+
+def render_chat_turn(q_text, a_text):
+    st.markdown(f"**You:** {q_text}")
+    st.markdown(f"**AI:** {a_text}")
+    st.markdown("---")
+
+@st.fragment
+def student_chat_panel():
+    chat_container = st.container()
+    with chat_container:
+        conversation = st.session_state.student_conversation
+        if conversation.hidden_turns:
+            st.caption(f"{conversation.hidden_turns} earlier question(s) hidden; the tutor keeps a summary of them.")
+        for q_text, a_text in conversation.display:
+            render_chat_turn(q_text, a_text)
+
+    with st.form(key="student_qna_form_key", clear_on_submit=True):
+        user_q_input_form = st.text_input("Your question:", key="student_qna_input_widget_key")
+        submit_q = st.form_submit_button("💬 Ask AI")
+    if submit_q:
+        if user_q_input_form.strip():
+            # Drawn straight into the history; no rerun needed to show the new turn.
+            with chat_container:
+                st.markdown(f"**You:** {user_q_input_form}")
+                try:
+                    a = st.write_stream(answer_follow_up_question(
+                        user_q_input_form, held_text("processed_text_handle"), stream=True,
+                        conversation=st.session_state.student_conversation
+                    ))
+                except Exception as e:
+                    st.error(f"Could not get an answer: {e}")
+                else:
+                    st.markdown("---")
+                    record_chat_turn(st.session_state.student_conversation, user_q_input_form, a)
+        else:
+            st.warning("Please type a question.")
+
+@st.fragment
+def student_quiz_panel():
+    if not st.session_state.student_custom_quiz_submitted:
+        quiz_form = st.empty()
+        with quiz_form.form(key="student_quiz_form_key"):
+            answers = {}
+            for i, q_data in enumerate(st.session_state.student_custom_questions):
+                q_id = q_data.get('id', f"s_q_{i}_{int(time.time())}") 
+                options = q_data.get("options", [])
+                if not isinstance(options, list): options = []
+                answers[q_id] = st.radio(
+                    f"{i+1}. {q_data.get('question_text', 'Missing question text')}",
+                    options, index=None, key=f"s_q_radio_{q_id}" 
+                )
+            if st.form_submit_button("Submit My Quiz"):
+                st.session_state.student_custom_answers = answers
+                st.session_state.student_custom_quiz_submitted = True
+        if st.session_state.student_custom_quiz_submitted:
+            quiz_form.empty()  # Swap the form for the results in this same run.
+    if st.session_state.student_custom_quiz_submitted:
+        score, total, feedback = grade_assessment(
+            st.session_state.student_custom_answers,
+            st.session_state.student_custom_questions
+        )
+        st.success(f"Your Quiz Submitted! Your Score: {score}/{total}")
+        with st.expander("View Detailed Feedback", expanded=True):
+            for f_item in feedback: st.info(f_item)
+
+        if st.button("Process New Text / Re-Quiz", key="student_new_text_bttn"):
+            set_text_input("student_main_input_widget_key", "student_main_input_handle", "")
+            hold_handle("processed_text_handle", None)
+            st.session_state.simplified_student_text = ""
+            st.session_state.student_custom_questions = []
+            st.session_state.student_custom_answers = {}
+            st.session_state.student_custom_quiz_submitted = False
+            reset_conversation()
+            st.session_state.student_file_uploader_key += 1 # Reset uploader
+            st.rerun()
+
 # --- Role Selection UI ---
 if not st.session_state.user_role:
     st.info("Welcome! Please select your role to begin.")
@@ -78,6 +479,7 @@ elif st.session_state.user_role == "Teacher":
     st.sidebar.header("Teacher Tools")
     if st.sidebar.button("Switch to Student View", key="teacher_switch_to_student_button"):
         switch_role("Student")
+    render_cache_stats_sidebar()
 
     st.header("Teacher Dashboard")
     st.subheader("1. Provide Content & Generate Resources")
@@ -99,86 +501,75 @@ elif st.session_state.user_role == "Teacher":
             key=f"teacher_file_uploader_widget_{st.session_state.teacher_file_uploader_key}" # Reset uploader
         )
         if uploaded_file_teacher is not None:
-            file_bytes = io.BytesIO(uploaded_file_teacher.getvalue())
+            file_bytes = uploaded_file_teacher.getvalue()
             file_type = uploaded_file_teacher.type
             
-            with st.spinner(f"Extracting text from {uploaded_file_teacher.name}..."):
-                if file_type == "application/pdf":
-                    teacher_text_from_file = extract_text_from_pdf(file_bytes)
-                elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    teacher_text_from_file = extract_text_from_docx(file_bytes)
+            progress = st.progress(0.0, text=f"Extracting text from {uploaded_file_teacher.name}...")
+            teacher_text_from_file = extract_text_from_upload(
+                file_bytes, file_type,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Extracting text... {done}/{total}")
+            )
             
             if teacher_text_from_file:
                 st.success("Text extracted successfully!")
-                st.session_state.teacher_content_input_value = teacher_text_from_file
-                # No rerun here, let text_area update and user proceed
+                # The text area below has not been drawn yet in this run, so it picks this up directly.
+                set_text_input("teacher_content_area_widget_key", "teacher_content_handle", teacher_text_from_file)
             else:
                 st.warning("Could not extract text. File might be empty, image-based (scanned), or corrupted.")
-            # To allow re-uploading the same file if needed after an action
+            # Fresh uploader on the next run, so the same file can be uploaded again
             st.session_state.teacher_file_uploader_key += 1
-            st.rerun() # Rerun to update text_area with extracted text and reset uploader
 
 
-    current_teacher_input = st.text_area(
+    current_teacher_input = text_input_area(
         "Educational content (paste or will be filled from upload):",
-        value=st.session_state.teacher_content_input_value,
-        height=200,
-        key="teacher_content_area_widget_key"
+        "teacher_content_area_widget_key", "teacher_content_handle"
     )
-    if current_teacher_input != st.session_state.teacher_content_input_value: # Sync if user types
-        st.session_state.teacher_content_input_value = current_teacher_input
+    st.text_input("Subject (files generated questions in the question bank):", key="teacher_subject_widget_key",
+                  placeholder="e.g. Biology")
 
 
+    difficulty_levels = st.multiselect(
+        "Difficulty level(s) for the preview:", ["easy", "medium", "hard"], default=["medium"],
+        key="teacher_difficulty_levels", help="Several levels are written together in one AI call."
+    )
     if st.button("✨ Preview Personalized Content", key="teacher_preview_button"):
         if current_teacher_input.strip():
-            with st.spinner("Generating personalized version..."):
-                content = generate_personalized_content_for_teacher(current_teacher_input)
-                st.session_state.teacher_personalized_content_preview = content
-            # Don't clear input_value here, teacher might want to generate quiz next
-            st.rerun()
+            # Don't clear the content here, teacher might want to generate quiz next
+            track_job("teacher_preview", submit_job(
+                "teacher_preview", current_teacher_input, tuple(difficulty_levels or ["medium"])
+            ))
         else:
             st.warning("Please provide content via paste or upload.")
             st.session_state.teacher_personalized_content_preview = ""
 
+    if st.button("⚡ Preview Content & Generate Quiz Together", key="teacher_preview_and_quiz_button"):
+        if current_teacher_input.strip():
+            track_job("teacher_resources", submit_job(
+                "teacher_resources", current_teacher_input, st.session_state.get("teacher_num_q_widget_key", 3)
+            ))
+        else:
+            st.warning("Please provide content via paste or upload.")
+
+    render_job_area()
+
     if st.session_state.teacher_personalized_content_preview:
         st.markdown("### Personalized Content Preview:")
         st.markdown(st.session_state.teacher_personalized_content_preview)
         st.markdown("---")
 
     st.subheader("2. Generate Quiz from Your Content")
-    num_questions = st.number_input("Number of Quiz Questions:", min_value=1, max_value=10, value=3, key="teacher_num_q_widget_key")
-    
-    if st.button("📝 Generate Quiz from My Content", key="teacher_generate_quiz_bttn"):
-        if current_teacher_input.strip():
-            with st.spinner("Generating quiz..."):
-                questions = generate_quiz_for_teacher(current_teacher_input, num_questions)
-                st.session_state.teacher_generated_questions = questions
-                if questions: st.success(f"{len(questions)} questions generated.")
-                else: st.warning("Could not generate questions. AI might need different text.")
-            
-            st.session_state.teacher_content_input_value = "" # Clear for next input
-            st.session_state.teacher_personalized_content_preview = "" 
-            st.session_state.teacher_file_uploader_key += 1 # Reset uploader for next time
-            st.rerun()
-        else:
-            st.warning("Please provide content to generate a quiz.")
-            st.session_state.teacher_generated_questions = []
+    teacher_quiz_panel()
 
     if st.session_state.teacher_generated_questions:
-        with st.expander("View Generated Quiz", expanded=True):
-            for i, q in enumerate(st.session_state.teacher_generated_questions):
-                st.markdown(f"**Q{i+1}: {q.get('question_text', 'N/A')}**")
-                if isinstance(q.get("options"), list):
-                    for opt_text in q["options"]: st.write(f"- {opt_text}")
-                else: st.warning(f"Options for Q{i+1} not in list format.")
-                st.write(f"✅ Correct Answer: {q.get('correct_answer', 'Not specified')}")
-                st.divider()
+        st.subheader("3. Grade a Whole Class")
+        class_grading_panel()
 
 # --- STUDENT VIEW ---
 elif st.session_state.user_role == "Student":
     st.sidebar.header("Student Tools")
     if st.sidebar.button("Switch to Teacher View", key="student_switch_button"):
         switch_role("Teacher")
+    render_cache_stats_sidebar()
 
     st.header("Explore, Understand, and Quiz Yourself!")
     
@@ -199,113 +590,49 @@ elif st.session_state.user_role == "Student":
             key=f"student_file_uploader_widget_{st.session_state.student_file_uploader_key}" # Reset uploader
         )
         if uploaded_file_student is not None:
-            file_bytes_student = io.BytesIO(uploaded_file_student.getvalue())
+            file_bytes_student = uploaded_file_student.getvalue()
             file_type_student = uploaded_file_student.type
 
-            with st.spinner(f"Extracting text from {uploaded_file_student.name}..."):
-                if file_type_student == "application/pdf":
-                    student_text_from_file = extract_text_from_pdf(file_bytes_student)
-                elif file_type_student == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-                    student_text_from_file = extract_text_from_docx(file_bytes_student)
+            progress = st.progress(0.0, text=f"Extracting text from {uploaded_file_student.name}...")
+            student_text_from_file = extract_text_from_upload(
+                file_bytes_student, file_type_student,
+                on_progress=lambda done, total: progress.progress(done / total, text=f"Extracting text... {done}/{total}")
+            )
             
             if student_text_from_file:
                 st.success("Text extracted successfully!")
-                st.session_state.student_main_input_text_value = student_text_from_file
+                set_text_input("student_main_input_widget_key", "student_main_input_handle", student_text_from_file)
             else:
                 st.warning("Could not extract text. File might be empty, image-based (scanned), or corrupted.")
             # Increment key to allow re-upload of the same file name triggering a change
             st.session_state.student_file_uploader_key += 1
-            st.rerun() # Rerun to update text_area and reset uploader widget
 
-    current_student_input = st.text_area(
+    current_student_input = text_input_area(
         "📚 Your text (paste here or will be filled from upload):",
-        value=st.session_state.student_main_input_text_value,
-        height=200,
-        key="student_main_input_widget_key"
+        "student_main_input_widget_key", "student_main_input_handle"
     )
-    if current_student_input != st.session_state.student_main_input_text_value: # Sync if user types
-        st.session_state.student_main_input_text_value = current_student_input
 
     if st.button("🧠 Process My Text (Explain & Create Quiz)", key="student_process_button"):
         if current_student_input.strip():
-            with st.spinner("Analyzing your text..."):
-                text_to_process = current_student_input
-                st.session_state.processed_text_for_qna_context = text_to_process
-                st.session_state.simplified_student_text = simplify_student_text(text_to_process)
-                st.session_state.student_custom_questions = generate_quiz_from_student_text(text_to_process, 3)
-                if not st.session_state.simplified_student_text and not st.session_state.student_custom_questions:
-                    st.warning("AI couldn't process the text well. Try different text or ensure good extraction.")
-            
-            st.session_state.student_custom_answers = {}
-            st.session_state.student_custom_quiz_submitted = False
-            st.session_state.student_conversation_history = []
-            st.session_state.student_main_input_text_value = "" # Clear for next input
-            st.session_state.student_file_uploader_key += 1 # Reset uploader for next time
-            st.rerun()
+            # Explanation and quiz run as one background job; the page stays usable meanwhile.
+            # Its index for follow-up chat is built there too (once per document).
+            track_job("student_processing", submit_job("student_processing", current_student_input, 3))
         else:
             st.warning("Please paste text or upload a file first.")
+
+    render_job_area()
     
     if st.session_state.simplified_student_text:
         st.markdown("---")
         st.markdown("### 💡 AI's Explanation of Your Text:")
         st.markdown(st.session_state.simplified_student_text)
 
-    if st.session_state.processed_text_for_qna_context: 
+    if st.session_state.processed_text_handle:
         st.markdown("---")
         st.subheader("💬 Chat with AI about Your Text")
-        chat_container = st.container()
-        with chat_container:
-            for q_text, a_text in st.session_state.student_conversation_history:
-                st.markdown(f"**You:** {q_text}")
-                st.markdown(f"**AI:** {a_text}")
-                st.markdown("---")
-
-        with st.form(key="student_qna_form_key"):
-            user_q_input_form = st.text_input("Your question:", key="student_qna_input_widget_key")
-            submit_q = st.form_submit_button("💬 Ask AI")
-            if submit_q:
-                if user_q_input_form.strip():
-                    with st.spinner("Thinking..."):
-                        a = answer_follow_up_question(user_q_input_form, st.session_state.processed_text_for_qna_context)
-                        st.session_state.student_conversation_history.append((user_q_input_form, a))
-                        st.rerun() 
-                else:
-                    st.warning("Please type a question.")
+        student_chat_panel()
 
     if st.session_state.student_custom_questions:
         st.markdown("---")
         st.subheader("📝 Quiz on Your Text")
-        if not st.session_state.student_custom_quiz_submitted:
-            with st.form(key="student_quiz_form_key"):
-                answers = {}
-                for i, q_data in enumerate(st.session_state.student_custom_questions):
-                    q_id = q_data.get('id', f"s_q_{i}_{int(time.time())}") 
-                    options = q_data.get("options", [])
-                    if not isinstance(options, list): options = []
-                    answers[q_id] = st.radio(
-                        f"{i+1}. {q_data.get('question_text', 'Missing question text')}",
-                        options, index=None, key=f"s_q_radio_{q_id}" 
-                    )
-                if st.form_submit_button("Submit My Quiz"):
-                    st.session_state.student_custom_answers = answers
-                    st.session_state.student_custom_quiz_submitted = True
-                    st.rerun()
-        else: 
-            score, total, feedback = grade_assessment(
-                st.session_state.student_custom_answers,
-                st.session_state.student_custom_questions
-            )
-            st.success(f"Your Quiz Submitted! Your Score: {score}/{total}")
-            with st.expander("View Detailed Feedback", expanded=True):
-                for f_item in feedback: st.info(f_item)
-
-            if st.button("Process New Text / Re-Quiz", key="student_new_text_bttn"):
-                st.session_state.student_main_input_text_value = "" 
-                st.session_state.processed_text_for_qna_context = ""
-                st.session_state.simplified_student_text = ""
-                st.session_state.student_custom_questions = []
-                st.session_state.student_custom_answers = {}
-                st.session_state.student_custom_quiz_submitted = False
-                st.session_state.student_conversation_history = []
-                st.session_state.student_file_uploader_key += 1 # Reset uploader
-                st.rerun()
\ No newline at end of file
+        student_quiz_panel()
@@ -0,0 +1,168 @@
+"""Headless batch generation: quizzes and simplified texts for a directory of PDF/DOCX files.
+
+    python batch_generate.py course_material/ -o course_quizzes.jsonl --num-questions 5
+
+One JSON line is appended per document as soon as it finishes, so an interrupted
+run can simply be started again: documents whose content hash already has an "ok"
+record in the output file are skipped. A throughput summary is printed at the end.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import tutor_core
+from telemetry import telemetry
+from text_chunking import estimate_tokens
+from text_extraction import PDF_MIME, DOCX_MIME, extract_document_text
+
+FILE_TYPES = {".pdf": PDF_MIME, ".docx": DOCX_MIME}
+
+
+def find_documents(input_dir):
+    """All PDF/DOCX files under `input_dir`, in a stable order."""
+    paths = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if os.path.splitext(name)[1].lower() in FILE_TYPES:
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def load_completed_hashes(output_path):
+    """Content hashes of documents that already have a successful record."""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by an interrupted run.
+            if record.get("status") == "ok":
+                done.add(record.get("source_sha256"))
+    return done
+
+
+def process_document(path, num_questions, simplify=True, structured=False, subject=None, completed=()):
+    """Reads, extracts, simplifies and quizzes one document; returns its JSONL record.
+
+    The file is read here, inside the worker, so only the documents being processed
+    are held in memory. Returns None if its content hash is in `completed`.
+    """
+    started = time.perf_counter()
+    with open(path, "rb") as f:
+        file_bytes = f.read()
+    source_sha256 = hashlib.sha256(file_bytes).hexdigest()
+    if source_sha256 in completed:
+        return None
+    notices = []
+    record = {
+        "path": path,
+        "source_sha256": source_sha256,
+        "status": "ok",
+    }
+    try:
+        text, _ = extract_document_text(file_bytes, FILE_TYPES[os.path.splitext(path)[1].lower()])
+        if not text:
+            raise ValueError("No text could be extracted (empty, scanned or corrupted file).")
+        if structured:
+            # Exact-count JSON mode; the explanation (if wanted) is a separate call.
+            questions, record["quiz_stats"] = tutor_core.generate_quiz_structured(text, num_questions, notices)
+            simplified, errors = (tutor_core.simplify_text(text) if simplify else ""), {}
+        elif simplify:
+            simplified, questions, errors = tutor_core.process_student_text(text, num_questions, notices)
+        else:
+            simplified, errors = "", {}
+            questions = tutor_core.generate_quiz_from_paragraph(text, num_questions, notices)
+        for branch, err in errors.items():
+            tutor_core.notify(notices, "error", f"{branch} failed: {err}")
+        if not questions and not simplified:
+            record["status"] = "error"
+        if subject is not None and questions:
+            record["bank_added"], record["bank_duplicates"] = tutor_core.save_questions_to_bank(
+                questions, subject, text, notices
+            )
+        record.update({
+            "simplified_text": simplified,
+            "questions": questions,
+            "input_tokens_est": estimate_tokens(text),
+            "output_tokens_est": estimate_tokens(simplified or "") + estimate_tokens(json.dumps(questions)),
+        })
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["notices"] = [notice._asdict() for notice in notices]
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def run_batch(input_dir, output_path, num_questions=5, concurrency=4, simplify=True, structured=False, subject=None):
+    """Processes every pending document in `input_dir`; returns the summary dict."""
+    documents = find_documents(input_dir)
+    completed = load_completed_hashes(output_path)
+
+    summary = {"documents": len(documents), "skipped": 0, "ok": 0, "failed": 0,
+               "input_tokens_est": 0, "output_tokens_est": 0}
+    write_lock = threading.Lock()
+    started = time.perf_counter()
+    with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Only paths are queued; each task reads and hashes its own file.
+        futures = {
+            pool.submit(process_document, path, num_questions, simplify, structured, subject, completed): path
+            for path in documents
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except OSError as e:
+                record = {"path": futures[future], "status": "error", "error": f"{type(e).__name__}: {e}", "seconds": 0.0}
+            if record is None:
+                summary["skipped"] += 1
+                continue
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+            summary["ok" if record["status"] == "ok" else "failed"] += 1
+            summary["input_tokens_est"] += record.get("input_tokens_est", 0)
+            summary["output_tokens_est"] += record.get("output_tokens_est", 0)
+            print(f"[{summary['ok'] + summary['failed'] + summary['skipped']}/{len(documents)}] {record['status']:5} "
+                  f"{record['seconds']:7.1f}s  {futures[future]}", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    processed = summary["ok"] + summary["failed"]
+    summary["elapsed_seconds"] = round(elapsed, 2)
+    summary["docs_per_minute"] = round(processed / elapsed * 60, 2) if elapsed else 0.0
+    summary["output_tokens_per_second"] = round(summary["output_tokens_est"] / elapsed, 2) if elapsed else 0.0
+    # Token counts reported by the API itself (the *_est fields above are local estimates).
+    summary["llm_usage_by_feature"] = telemetry.snapshot()["usage_by_feature"]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pre-generate quizzes and simplified texts for a folder of PDF/DOCX files.")
+    parser.add_argument("input_dir", help="Directory searched recursively for .pdf and .docx files")
+    parser.add_argument("-o", "--output", default="batch_output.jsonl", help="JSONL file to append results to")
+    parser.add_argument("-n", "--num-questions", type=int, default=5)
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="Documents processed at the same time")
+    parser.add_argument("--no-simplify", action="store_true", help="Only generate quizzes")
+    parser.add_argument("--structured", action="store_true",
+                        help="JSON quiz mode with top-up calls until exactly --num-questions are valid")
+    parser.add_argument("--subject", help="Also save the questions to the question bank under this subject")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    summary = run_batch(args.input_dir, args.output, args.num_questions, args.concurrency,
+                        not args.no_simplify, args.structured, args.subject)
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
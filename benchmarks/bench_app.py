@@ -0,0 +1,118 @@
+"""Cold-start and per-interaction server time of the Streamlit app, against the stub server.
+
+    python benchmarks/bench_app.py -o app_bench.json
+
+Uses streamlit.testing's AppTest, which executes the script exactly as the server
+would (minus the browser). Note that AppTest re-executes the whole script for
+every interaction, so fragment-scoped reruns show up here only through the work
+they avoid inside that full run; in a real session they are cheaper still.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import start_stub_server  # noqa: E402
+
+_COLD_START = """
+import time
+started = time.perf_counter()
+import utils
+imported = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+at.run()
+print(imported - started, time.perf_counter() - started)
+"""
+
+
+def cold_start(env, runs):
+    """(seconds to import utils, seconds to first render of the role screen) in fresh processes."""
+    imports, renders = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _COLD_START], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout.split()
+        imports.append(float(out[-2]))
+        renders.append(float(out[-1]))
+    return statistics.median(imports), statistics.median(renders)
+
+
+def timed_run(element_action):
+    started = time.perf_counter()
+    element_action().run()
+    return time.perf_counter() - started
+
+
+def interactions(runs):
+    """Median server time of common student interactions."""
+    from streamlit.testing.v1 import AppTest
+
+    samples = {"select_role": [], "process_text_submit": [], "process_text": [], "chat_message": [], "quiz_submit": [], "idle_rerun": []}
+    for _ in range(runs):
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        at.run()
+        samples["select_role"].append(timed_run(lambda: at.button(key="role_student_button").click()))
+        at.text_area(key="student_main_input_widget_key").set_value("Plants make sugar from light. " * 200)
+        started = time.perf_counter()
+        samples["process_text_submit"].append(timed_run(lambda: at.button(key="student_process_button").click()))
+        _wait_for_jobs(at)
+        samples["process_text"].append(time.perf_counter() - started)
+        for i in range(3):
+            at.text_input(key="student_qna_input_widget_key").set_value(f"What is point {i}?")
+            samples["chat_message"].append(timed_run(lambda: _submit(at, "student_qna_form_key")))
+        for radio in at.radio:
+            if radio.key and radio.key.startswith("s_q_radio_"):
+                radio.set_value(radio.options[0])
+        samples["quiz_submit"].append(timed_run(lambda: _submit(at, "student_quiz_form_key")))
+        samples["idle_rerun"].append(timed_run(lambda: at))
+    return {name: statistics.median(values) for name, values in samples.items() if values}
+
+
+def _wait_for_jobs(at, poll=0.05, timeout=120):
+    """Reruns the page (as the job status fragment would) until its background jobs are applied."""
+    deadline = time.monotonic() + timeout
+    while at.session_state.active_jobs and time.monotonic() < deadline:
+        time.sleep(poll)
+        at.run()
+
+
+def _submit(at, form_key):
+    for button in at.button:
+        if getattr(button, "form_id", None) == form_key:
+            return button.click()
+    raise LookupError(f"No submit button in form {form_key}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start and per-interaction timings of app.py.")
+    parser.add_argument("-o", "--output", default="app_bench.json")
+    parser.add_argument("-r", "--repeat", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub server seconds before each reply")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_stub_server(latency=args.latency)
+    env = dict(os.environ, OPENROUTER_BASE_URL=base_url, API_KEY=os.getenv("API_KEY", "stub"),
+               RESPONSE_CACHE_DISABLED="1", API_RATE_PER_SECOND="0")
+    os.environ.update(env)
+
+    import_seconds, first_render_seconds = cold_start(env, args.repeat)
+    report = {
+        "cold_start": {"import_utils_seconds": import_seconds, "first_render_seconds": first_render_seconds},
+        "interaction_seconds": interactions(args.repeat),
+        "stub_latency_seconds": args.latency,
+    }
+    server.shutdown()
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Deterministic fixture documents of increasing size for the benchmarks.
+
+Generated on demand (and cached under benchmarks/fixtures/) so no binary files are
+committed. PDFs are written by a tiny PDF 1.4 writer with one Helvetica text block
+per page; DOCX files use python-docx with paragraphs plus one table per ten pages.
+"""
+import io
+import os
+import random
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_PAGES = (1, 10, 50, 200)
+LINES_PER_PAGE = 40
+
+_WORDS = (
+    "cell energy light water carbon oxygen sugar plant leaf root membrane enzyme protein "
+    "reaction molecule atom electron cycle process system structure function growth"
+).split()
+
+
+def _page_lines(page, rng):
+    return [
+        f"Page {page + 1} line {line + 1}: " + " ".join(rng.choice(_WORDS) for _ in range(10)) + "."
+        for line in range(LINES_PER_PAGE)
+    ]
+
+
+def _escape_pdf_text(line):
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf_bytes(pages, seed=0):
+    """A valid `pages`-page PDF with LINES_PER_PAGE lines of text on each page."""
+    rng = random.Random(seed)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i in range(pages):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        text = " ".join(f"({_escape_pdf_text(line)}) Tj T*" for line in _page_lines(i, rng))
+        content = f"BT /F1 9 Tf 18 TL 40 760 Td {text} ET".encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    out += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def make_docx_bytes(pages, seed=0):
+    """A DOCX with the same text as make_pdf_bytes(pages), plus a small table every ten pages."""
+    import docx
+
+    rng = random.Random(seed)
+    document = docx.Document()
+    for page in range(pages):
+        for line in _page_lines(page, rng):
+            document.add_paragraph(line)
+        if page % 10 == 9:
+            table = document.add_table(rows=3, cols=3)
+            for r, row in enumerate(table.rows):
+                for c, cell in enumerate(row.cells):
+                    cell.text = f"r{r}c{c} {rng.choice(_WORDS)}"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def fixture_path(kind, pages):
+    """Path of the `kind` ("pdf" or "docx") fixture with `pages` pages, creating it if needed."""
+    path = os.path.join(FIXTURE_DIR, f"sample_{pages:04d}p.{kind}")
+    if not os.path.exists(path):
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        data = make_pdf_bytes(pages) if kind == "pdf" else make_docx_bytes(pages)
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def sample_paragraph(pages=1, seed=0):
+    """Plain text of a fixture, for benchmarks that take text rather than files."""
+    rng = random.Random(seed)
+    return "\n".join(line for page in range(pages) for line in _page_lines(page, rng))
@@ -0,0 +1,203 @@
+"""Offline benchmarks for EduTutor's hot paths; results are written as JSON.
+
+    python benchmarks/run_benchmarks.py -o bench_results.json
+    python benchmarks/run_benchmarks.py -o new.json --compare bench_results.json
+
+No network access or API quota is needed: LLM calls go to benchmarks/stub_server.py,
+started in-process, and the response cache is disabled so every call is measured.
+Fixture documents are generated on first use (see fixtures.py).
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fixtures import FIXTURE_PAGES, fixture_path, sample_paragraph  # noqa: E402
+from stub_server import canned_quiz_text, start_stub_server  # noqa: E402
+
+
+def measure(name, fn, repeat=5, warmup=1, **params):
+    """Runs `fn` `warmup + repeat` times; returns a result record for the timed runs."""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    record = {
+        "name": name,
+        "params": params,
+        "runs": repeat,
+        "min_seconds": samples[0],
+        "median_seconds": statistics.median(samples),
+        "mean_seconds": statistics.fmean(samples),
+        "max_seconds": samples[-1],
+    }
+    print(f"{name:42} {record['median_seconds'] * 1000:10.2f} ms  {params}", file=sys.stderr)
+    return record
+
+
+def bench_extraction(utils, repeat):
+    results = []
+    for pages in FIXTURE_PAGES:
+        with open(fixture_path("pdf", pages), "rb") as f:
+            pdf_bytes = f.read()
+        with open(fixture_path("docx", pages), "rb") as f:
+            docx_bytes = f.read()
+        runs = repeat if pages < 50 else max(1, repeat // 2)
+        results.append(measure(
+            "extract_text_from_pdf", lambda: utils.extract_text_from_pdf(io.BytesIO(pdf_bytes)),
+            repeat=runs, pages=pages, bytes=len(pdf_bytes),
+        ))
+        results.append(measure(
+            "extract_text_from_docx", lambda: utils.extract_text_from_docx(io.BytesIO(docx_bytes)),
+            repeat=runs, pages=pages, bytes=len(docx_bytes),
+        ))
+    return results
+
+
+def bench_quiz_parser(repeat):
+    from quiz_parser import QuizStreamParser, parse_quiz_text
+    from stub_server import split_into_tokens
+
+    results = []
+    for count in (5, 50, 500):
+        raw = canned_quiz_text(count)
+        tokens = split_into_tokens(raw)
+
+        def parse_streamed():
+            parser = QuizStreamParser()
+            for token in tokens:
+                parser.feed(token)
+            parser.close()
+
+        results.append(measure("parse_quiz_text", lambda: parse_quiz_text(raw), repeat=repeat * 4, questions=count))
+        results.append(measure("QuizStreamParser.feed", parse_streamed, repeat=repeat * 4, questions=count))
+    return results
+
+
+def bench_grading(utils, repeat):
+    from quiz_parser import parse_quiz_text
+
+    results = []
+    for count in (10, 100, 1000):
+        questions, _ = parse_quiz_text(canned_quiz_text(count))
+        answers = {q["id"]: q["options"][i % 4] for i, q in enumerate(questions)}
+        results.append(measure(
+            "grade_assessment", lambda: utils.grade_assessment(answers, questions),
+            repeat=repeat * 4, questions=len(questions),
+        ))
+
+    from class_grading import grade_class
+
+    questions, _ = parse_quiz_text(canned_quiz_text(50))
+    for students in (100, 10000):
+        submissions = [(f"s{s}", {q["id"]: "ABCD"[(s + i) % 4] for i, q in enumerate(questions)})
+                       for s in range(students)]
+        results.append(measure(
+            "grade_class", lambda: grade_class(questions, submissions),
+            repeat=repeat, students=students, questions=len(questions),
+        ))
+    return results
+
+
+def bench_end_to_end(utils, repeat, latency):
+    import api_service
+
+    def generate(paragraph):
+        api_service.response_cache.clear()  # The in-memory tier stays on even with the disk tier disabled.
+        return utils.generate_quiz_from_paragraph(paragraph, 5)
+
+    results = []
+    for pages in (1, 10):
+        paragraph = sample_paragraph(pages)
+        results.append(measure(
+            "generate_quiz_from_paragraph", lambda: generate(paragraph),
+            repeat=repeat, pages=pages, stub_latency_seconds=latency,
+        ))
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    """Prints the median-time ratio of every benchmark also present in the baseline file."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["name"], json.dumps(r["params"], sort_keys=True)): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {baseline_path}:", file=sys.stderr)
+    for record in results:
+        old = baseline.get((record["name"], json.dumps(record["params"], sort_keys=True)))
+        if old and old["median_seconds"]:
+            ratio = record["median_seconds"] / old["median_seconds"]
+            print(f"{record['name']:42} x{ratio:6.2f}  {record['params']}", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for extraction, parsing, grading and quiz generation.")
+    parser.add_argument("-o", "--output", default="bench_results.json", help="JSON file to write results to")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="Timed runs per benchmark")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub server seconds before each reply")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Stub server seconds between streamed tokens")
+    parser.add_argument("--only", choices=["extraction", "parser", "grading", "e2e"], action="append",
+                        help="Run only these groups (repeatable)")
+    parser.add_argument("--compare", help="Earlier results file to print speed ratios against")
+    args = parser.parse_args(argv)
+
+    server, base_url = start_stub_server(latency=args.latency, token_delay=args.token_delay)
+    # Must be set before api_service is imported: the client and the cache are module-level.
+    os.environ["OPENROUTER_BASE_URL"] = base_url
+    os.environ.setdefault("API_KEY", "stub")
+    os.environ["RESPONSE_CACHE_DISABLED"] = "1"
+    os.environ["API_RATE_PER_SECOND"] = "0"
+    import utils
+
+    groups = args.only or ["extraction", "parser", "grading", "e2e"]
+    results = []
+    if "extraction" in groups:
+        results += bench_extraction(utils, args.repeat)
+    if "parser" in groups:
+        results += bench_quiz_parser(args.repeat)
+    if "grading" in groups:
+        results += bench_grading(utils, args.repeat)
+    if "e2e" in groups:
+        results += bench_end_to_end(utils, args.repeat, args.latency)
+    server.shutdown()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "stub": {"latency_seconds": args.latency, "token_delay_seconds": args.token_delay,
+                     "requests": server.RequestHandlerClass.stats["requests"]},
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""Local OpenAI-compatible chat-completions server for offline benchmarks.
+
+    python benchmarks/stub_server.py --port 8765 --latency 0.2 --token-delay 0.005
+
+Point the app at it with OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1. Quiz prompts
+get canned questions in the format the prompt asks for (the "Q1:/ANSWER:" text format
+or the JSON format), combined explain+quiz and multi-level prompts get filler sections
+in their requested layout, everything else gets filler prose. Both plain and streamed
+(server-sent events) responses are supported, and a `usage` block is always reported.
+"""
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_QUESTION_COUNT = re.compile(r"Generate exactly (\d+) multiple-choice", re.IGNORECASE)
+_COMBINED_COUNT = re.compile(r"=== QUIZ === and after it exactly (\d+) multiple-choice", re.IGNORECASE)
+_LEVEL_HEADERS = re.compile(r"=== ([A-Z]+) ===")
+_FILLER = (
+    "Photosynthesis is how plants turn sunlight, water and carbon dioxide into sugar and oxygen. "
+    "The light reactions happen in the thylakoids, and the Calvin cycle builds sugar in the stroma. "
+)
+
+
+def canned_quiz_text(count, tag=""):
+    lines = []
+    for i in range(1, count + 1):
+        lines += [
+            f"Q{i}: Which statement about concept {i}{tag} is correct?",
+            f"A) Statement {i}a",
+            f"B) Statement {i}b",
+            f"C) Statement {i}c",
+            f"D) Statement {i}d",
+            f"ANSWER: {'ABCD'[i % 4]}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def canned_quiz_json(count, tag=""):
+    return json.dumps({"questions": [
+        {
+            "question": f"Which statement about concept {i}{tag} is correct?",
+            "options": [f"Statement {i}{s}" for s in "abcd"],
+            "answer": "ABCD"[i % 4],
+        }
+        for i in range(1, count + 1)
+    ]})
+
+
+def canned_reply(prompt, reply_words=120):
+    """The stub's answer to `prompt`."""
+    words = (_FILLER * (reply_words // 30 + 1)).split()
+    filler = " ".join(words[:reply_words])
+    tag = " in part " + hashlib.sha1(prompt.encode()).hexdigest()[:6]
+    match = _COMBINED_COUNT.search(prompt)
+    if match:  # Explanation, marker line, then the quiz.
+        return f"{filler}\n\n=== QUIZ ===\n{canned_quiz_text(int(match.group(1)), tag)}"
+    levels = [level for level in _LEVEL_HEADERS.findall(prompt) if level != "QUIZ"]
+    if levels:  # One headed version per difficulty level.
+        return "\n\n".join(f"=== {level} ===\n{filler}" for level in levels)
+    match = _QUESTION_COUNT.search(prompt)
+    if match:
+        # Tagged with the prompt's hash so quizzes for different sections don't look like duplicates.
+        count = int(match.group(1))
+        return canned_quiz_json(count, tag) if "JSON" in prompt else canned_quiz_text(count, tag)
+    return filler
+
+
+def split_into_tokens(text):
+    """Roughly token-sized pieces (a word plus its trailing whitespace)."""
+    return re.findall(r"\S+\s*|\s+", text)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = {"latency": 0.0, "token_delay": 0.0, "reply_words": 120, "model_latency": {}}
+    stats = {"requests": 0, "streamed": 0}
+    _stats_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean.
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        prompt = "\n".join(m.get("content") or "" for m in request.get("messages", []))
+        model = request.get("model", "stub")
+        stream = bool(request.get("stream"))
+        with self._stats_lock:
+            self.stats["requests"] += 1
+            self.stats["streamed"] += stream
+
+        reply = canned_reply(prompt, self.config["reply_words"])
+        usage = {
+            "prompt_tokens": len(prompt) // 4,
+            "completion_tokens": len(reply) // 4,
+            "total_tokens": (len(prompt) + len(reply)) // 4,
+        }
+        time.sleep(self.config["model_latency"].get(model, self.config["latency"]))
+        if stream:
+            try:
+                self._send_stream(model, reply, usage)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client stopped reading (an abandoned stream).
+        else:
+            self._send_json({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, model, reply, usage):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def event(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        base = {"id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        for piece in split_into_tokens(reply):
+            event(json.dumps(dict(base, choices=[{"index": 0, "delta": {"content": piece}, "finish_reason": None}])))
+            if self.config["token_delay"]:
+                time.sleep(self.config["token_delay"])
+        event(json.dumps(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}], usage=usage)))
+        event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+def start_stub_server(port=0, latency=0.0, token_delay=0.0, reply_words=120, model_latency=None):
+    """Starts the stub in a daemon thread; returns (server, base_url).
+
+    `model_latency` ({model: seconds}) overrides `latency` per requested model, e.g. to
+    simulate a slow primary model for hedging.
+    """
+    handler = type("ConfiguredStubHandler", (StubHandler,), {
+        "config": {"latency": latency, "token_delay": token_delay, "reply_words": reply_words,
+                   "model_latency": dict(model_latency or {})},
+        "stats": {"requests": 0, "streamed": 0},
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for offline benchmarks.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte of every reply")
+    parser.add_argument("--token-delay", type=float, default=0.005, help="Seconds between streamed tokens")
+    parser.add_argument("--reply-words", type=int, default=120, help="Length of non-quiz replies")
+    parser.add_argument("--model-latency", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="Per-model latency override (repeatable)")
+    args = parser.parse_args(argv)
+
+    model_latency = {model: float(seconds) for model, seconds in (item.rsplit("=", 1) for item in args.model_latency)}
+    server, base_url = start_stub_server(args.port, args.latency, args.token_delay, args.reply_words, model_latency)
+    print(f"Stub server listening on {base_url} (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
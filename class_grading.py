@@ -0,0 +1,169 @@
+import csv
+import io
+import json
+
+import numpy as np
+
+# Response codes in the answer matrix: 0-3 for options A-D, UNANSWERED otherwise.
+UNANSWERED = -1
+# Share of top- and bottom-scoring students compared by the discrimination index.
+DISCRIMINATION_GROUP = 0.27
+
+
+def load_submissions(data, file_name=""):
+    """Parses class submissions from CSV or JSONL bytes/text; returns [(student_id, {question_id: answer})].
+
+    CSV: a `student_id` column plus one column per question id.
+    JSONL: one {"student_id": ..., "answers": {question_id: answer}} object per line.
+    Answers may be the option letter ("B") or the full option text ("B) Paris").
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig")
+    if file_name.lower().endswith((".jsonl", ".json")) or data.lstrip().startswith("{"):
+        submissions = []
+        for line_no, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            submissions.append((str(record.get("student_id", f"row{line_no}")), record.get("answers") or {}))
+        return submissions
+
+    reader = csv.DictReader(io.StringIO(data))
+    submissions = []
+    for row_no, row in enumerate(reader, start=1):
+        student_id = row.pop("student_id", None) or f"row{row_no}"
+        submissions.append((student_id, {qid: answer for qid, answer in row.items() if answer}))
+    return submissions
+
+
+def _answer_codes(question):
+    """Every accepted spelling of each option of `question`, mapped to its 0-3 code."""
+    codes = {}
+    for index, option in enumerate(question.get("options") or []):
+        letter = "ABCD"[index]
+        codes[option] = codes[letter] = codes[letter.lower()] = index
+        codes[option.split(")", 1)[-1].strip()] = index  # Option text without its "B)" label.
+    return codes
+
+
+def encode_answers(questions, submissions):
+    """(student_ids, responses) where responses[s, q] is the 0-3 option code or UNANSWERED."""
+    student_ids = [student_id for student_id, _ in submissions]
+    responses = np.full((len(submissions), len(questions)), UNANSWERED, dtype=np.int8)
+    for q, question in enumerate(questions):
+        codes = _answer_codes(question)
+        qid = question.get("id")
+        column = [answers.get(qid) for _, answers in submissions]
+        responses[:, q] = [codes.get(answer.strip() if isinstance(answer, str) else answer, UNANSWERED)
+                           for answer in column]
+    return student_ids, responses
+
+
+def answer_key(questions):
+    """0-3 code of each question's correct option (UNANSWERED if it matches none)."""
+    return np.array([_answer_codes(q).get(q.get("correct_answer"), UNANSWERED) for q in questions], dtype=np.int8)
+
+
+class ClassGradeReport:
+    """Scores and item analysis for one quiz taken by a whole class.
+
+    Everything is computed with array operations over the (students x questions)
+    response matrix; per-student feedback text is only built by feedback().
+    """
+
+    def __init__(self, questions, student_ids, responses):
+        self.questions = questions
+        self.student_ids = student_ids
+        self.responses = responses
+        self._rows = None
+        self.key = answer_key(questions)
+        self.correct = (responses == self.key) & (self.key != UNANSWERED)  # (students, questions) bool
+        self.scores = self.correct.sum(axis=1)
+        # Difficulty index: share of the class answering each question correctly.
+        self.difficulty = self.correct.mean(axis=0) if len(student_ids) else np.zeros(len(questions))
+        self.discrimination = self._discrimination()
+        # Counts per option A-D plus a last column for unanswered.
+        codes = np.where(responses == UNANSWERED, 4, responses).astype(np.intp)
+        offsets = codes + 5 * np.arange(len(questions))
+        self.option_counts = np.bincount(offsets.ravel(), minlength=5 * len(questions)).reshape(len(questions), 5)
+
+    def _discrimination(self):
+        """Upper-group minus lower-group proportion correct, per question."""
+        n = len(self.student_ids)
+        group = max(1, int(round(n * DISCRIMINATION_GROUP)))
+        if n < 2:
+            return np.zeros(len(self.questions))
+        order = np.argsort(self.scores, kind="stable")
+        lower, upper = self.correct[order[:group]], self.correct[order[-group:]]
+        return upper.mean(axis=0) - lower.mean(axis=0)
+
+    @property
+    def distractor_frequencies(self):
+        """Share of the class choosing each wrong option, per question: [{letter: share}]."""
+        total = max(1, len(self.student_ids))
+        return [
+            {"ABCD"[o]: float(self.option_counts[q, o] / total) for o in range(4) if o != self.key[q]}
+            for q in range(len(self.questions))
+        ]
+
+    def item_analysis(self):
+        """One row per question: difficulty, discrimination, option counts and unanswered."""
+        rows = []
+        for q, question in enumerate(self.questions):
+            row = {
+                "question": question.get("question_text", "N/A"),
+                "difficulty": round(float(self.difficulty[q]), 3),
+                "discrimination": round(float(self.discrimination[q]), 3),
+            }
+            row.update({"ABCD"[o]: int(self.option_counts[q, o]) for o in range(4)})
+            row["unanswered"] = int(self.option_counts[q, 4])
+            rows.append(row)
+        return rows
+
+    def summary(self):
+        total = len(self.questions)
+        return {
+            "students": len(self.student_ids),
+            "questions": total,
+            "mean_score": float(self.scores.mean()) if len(self.scores) else 0.0,
+            "median_score": float(np.median(self.scores)) if len(self.scores) else 0.0,
+            "mean_percent": float(self.scores.mean() / total * 100) if len(self.scores) and total else 0.0,
+        }
+
+    def scores_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["student_id", "score", "total"])
+        for student_id, score in zip(self.student_ids, self.scores.tolist()):
+            writer.writerow([student_id, score, len(self.questions)])
+        return out.getvalue()
+
+    def feedback(self, student_id):
+        """Per-question feedback for one student, in the same wording as grade_assessment."""
+        if self._rows is None:
+            self._rows = {sid: row for row, sid in enumerate(self.student_ids)}
+        s = self._rows[student_id]
+        lines = []
+        for q, question in enumerate(self.questions):
+            text = question.get("question_text", "N/A")
+            correct_text = question.get("correct_answer")
+            code = int(self.responses[s, q])
+            if self.correct[s, q]:
+                lines.append(f"Q: {text} — ✅ Correct!")
+            elif code == UNANSWERED:
+                lines.append(f"Q: {text} — ❌ Not answered. The correct answer was: {correct_text}")
+            else:
+                lines.append(f"Q: {text} — ❌ Your answer: {question['options'][code]}. The correct answer was: {correct_text}")
+        return lines
+
+
+def submissions_template_csv(questions):
+    """Empty submissions CSV whose header lists the quiz's question ids."""
+    return ",".join(["student_id"] + [str(q.get("id")) for q in questions if isinstance(q, dict)]) + "\n"
+
+
+def grade_class(questions, submissions):
+    """Grades every submission against `questions` (dicts with id, options, correct_answer)."""
+    questions = [q for q in questions if isinstance(q, dict) and q.get("id") is not None]
+    student_ids, responses = encode_answers(questions, submissions)
+    return ClassGradeReport(questions, student_ids, responses)
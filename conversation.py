@@ -0,0 +1,107 @@
+import os
+from collections import deque
+
+from jobs import DONE
+from token_budget import count_tokens
+
+# Turns kept verbatim for the prompt; older ones are folded into a running summary.
+CHAT_RECENT_TURNS = int(os.getenv("CHAT_RECENT_TURNS", "4"))
+# Older turns are summarized in batches of at least this many (one background call per batch).
+CHAT_COMPACT_BATCH = int(os.getenv("CHAT_COMPACT_BATCH", "2"))
+# Unsummarized turns beyond this many tokens are compacted early, whatever their count.
+CHAT_RECENT_TOKENS = int(os.getenv("CHAT_RECENT_TOKENS", "1200"))
+# Turns rendered on the page; earlier ones live on only in the summary.
+CHAT_DISPLAY_TURNS = int(os.getenv("CHAT_DISPLAY_TURNS", "20"))
+
+
+def turn_tokens(turn) -> int:
+    question, answer = turn
+    return count_tokens(question) + count_tokens(answer)
+
+
+class Conversation:
+    """One student's chat: a running summary, the turns not yet in it, and a display window.
+
+    Memory stays bounded however long the session runs: the prompt side holds the
+    summary plus a few recent turns, the page side the last CHAT_DISPLAY_TURNS turns.
+    Older turns are summarized by a background job (see tutor_core.chat_summary_job);
+    `compaction_batch()` says which turns to send, `start_compaction(job, count)` records
+    the job, and `refresh()` folds its result in once it is done. Not thread-safe: use it
+    from the session that owns it; the job only sees copies of the turns.
+    """
+
+    def __init__(self, recent_turns=CHAT_RECENT_TURNS, compact_batch=CHAT_COMPACT_BATCH,
+                 recent_tokens=CHAT_RECENT_TOKENS, display_turns=CHAT_DISPLAY_TURNS):
+        self.recent_turns = recent_turns
+        self.compact_batch = compact_batch
+        self.recent_tokens = recent_tokens
+        self.summary = ""
+        self.turns = []                       # (question, answer) not yet in the summary
+        self.display = deque(maxlen=display_turns)
+        self.total_turns = 0
+        self.summarized_turns = 0
+        self.dropped_turns = 0
+        self._job = None
+        self._job_count = 0
+
+    def add_turn(self, question, answer):
+        self.refresh()
+        self.turns.append((question, answer))
+        self.display.append((question, answer))
+        self.total_turns += 1
+        # Summaries keep failing: let the oldest turns go rather than grow without bound.
+        overflow = len(self.turns) - 3 * (self.recent_turns + self.compact_batch)
+        if overflow > 0 and self._job is None:
+            del self.turns[:overflow]
+            self.dropped_turns += overflow
+
+    @property
+    def compacting(self) -> bool:
+        return self._job is not None
+
+    def compaction_batch(self) -> list:
+        """The oldest turns to summarize now, or [] if none are due (or a job is running)."""
+        self.refresh()
+        if self._job is not None:
+            return []
+        excess = len(self.turns) - self.recent_turns
+        if excess >= self.compact_batch:
+            return self.turns[:excess]
+        if excess > 0 and sum(turn_tokens(turn) for turn in self.turns) > self.recent_tokens:
+            return self.turns[:excess]
+        return []
+
+    def start_compaction(self, job, count):
+        """Records the background job summarizing the oldest `count` turns."""
+        self._job, self._job_count = job, count
+
+    def refresh(self):
+        """Folds in a finished compaction job; a failed one is retried with the next batch."""
+        job = self._job
+        if job is None or not job.finished:
+            return
+        self._job, count, self._job_count = None, self._job_count, 0
+        if job.status == DONE and job.result:
+            self.summary = job.result
+            del self.turns[:count]
+            self.summarized_turns += count
+
+    def cancel_compaction(self):
+        if self._job is not None:
+            self._job.cancel_event.set()
+            self._job = None
+
+    @property
+    def hidden_turns(self) -> int:
+        """Turns no longer rendered on the page."""
+        return self.total_turns - len(self.display)
+
+    def stats(self) -> dict:
+        return {
+            "turns": self.total_turns,
+            "summarized_turns": self.summarized_turns,
+            "pending_turns": len(self.turns),
+            "dropped_turns": self.dropped_turns,
+            "summary_tokens": count_tokens(self.summary),
+            "compacting": self.compacting,
+        }
@@ -0,0 +1,214 @@
+import hashlib
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+DOCUMENT_STORE_MEMORY_MB = float(os.getenv("DOCUMENT_STORE_MEMORY_MB", "64"))
+DOCUMENT_STORE_DISK_MB = float(os.getenv("DOCUMENT_STORE_DISK_MB", "1024"))
+# Referenced documents untouched for this long are treated as abandoned (e.g. a closed
+# browser tab never releases its handles) and may be evicted when over budget.
+DOCUMENT_STORE_STALE_SECONDS = float(os.getenv("DOCUMENT_STORE_STALE_SECONDS", str(24 * 3600)))
+
+
+def document_handle(text):
+    """Content hash used as the document's handle."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True  # Exists, but belongs to another user.
+    return True
+
+
+class DocumentStore:
+    """Process-wide store keeping each distinct text once, looked up by content hash.
+
+    Texts are stored zlib-compressed in SQLite (on disk, or in memory with `path=None`);
+    a bounded LRU keeps recently used texts decompressed. Sessions keep only the
+    handle returned by put() and acquire() / release() it. References are counted per
+    owning process (host and PID), so several processes (app workers, the batch CLI)
+    can share one file without touching each other's counts; counts left behind by
+    processes that are no longer running on this host are cleared on open. Once over
+    `max_disk_bytes`, unreferenced documents are evicted least-recently-used first,
+    then referenced ones idle for longer than `stale_seconds`. Safe to share between
+    Streamlit sessions (threads) in one process.
+    """
+
+    def __init__(self, path=None, max_memory_bytes=int(DOCUMENT_STORE_MEMORY_MB * 1024 * 1024),
+                 max_disk_bytes=int(DOCUMENT_STORE_DISK_MB * 1024 * 1024), stale_seconds=DOCUMENT_STORE_STALE_SECONDS):
+        self.path = path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.stale_seconds = stale_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._memory = OrderedDict()  # handle -> (text, size)
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "deduplicated_puts": 0,
+                       "memory_evictions": 0, "disk_evictions": 0}
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            " handle TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " raw_size INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_documents_last_access ON documents(last_access)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS document_refs ("
+            " handle TEXT NOT NULL,"
+            " owner TEXT NOT NULL,"
+            " refcount INTEGER NOT NULL,"
+            " PRIMARY KEY (handle, owner))"
+        )
+        self._clear_dead_owners()
+        self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()[0]
+
+    def _clear_dead_owners(self):
+        """Drops references held by earlier processes on this host that have exited."""
+        host, _ = self.owner.rsplit(":", 1)
+        for (owner,) in self._db.execute("SELECT DISTINCT owner FROM document_refs").fetchall():
+            owner_host, pid = owner.rsplit(":", 1)
+            if owner_host == host and owner != self.owner and not _process_alive(int(pid)):
+                self._db.execute("DELETE FROM document_refs WHERE owner = ?", (owner,))
+
+    # --- DISK TIER ---
+    def _trim_disk(self, keep):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        stale_before = time.time() - self.stale_seconds
+        rows = self._db.execute(
+            "SELECT handle, size, referenced FROM ("
+            " SELECT handle, size, last_access,"
+            " EXISTS (SELECT 1 FROM document_refs r WHERE r.handle = d.handle) AS referenced"
+            " FROM documents d WHERE handle != ?)"
+            " WHERE referenced = 0 OR last_access < ?"
+            " ORDER BY referenced, last_access ASC", (keep, stale_before)
+        ).fetchall()
+        for handle, size, referenced in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM documents WHERE handle = ?", (handle,))
+            if referenced:
+                self._db.execute("DELETE FROM document_refs WHERE handle = ?", (handle,))
+            self._disk_bytes -= size
+            self._stats["disk_evictions"] += 1
+            if handle in self._memory:
+                self._forget(handle)
+
+    # --- MEMORY TIER ---
+    def _forget(self, handle):
+        _, size = self._memory.pop(handle)
+        self._memory_bytes -= size
+
+    def _remember(self, handle, text, size):
+        if handle in self._memory or size > self.max_memory_bytes:
+            return
+        self._memory[handle] = (text, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            self._forget(next(iter(self._memory)))
+            self._stats["memory_evictions"] += 1
+
+    # --- PUBLIC API ---
+    def put(self, text):
+        """Stores `text` unless an identical one is already stored; returns its handle."""
+        handle = document_handle(text)
+        raw = text.encode("utf-8")
+        now = time.time()
+        with self._lock:
+            self._stats["puts"] += 1
+            cur = self._db.execute("UPDATE documents SET last_access = ? WHERE handle = ?", (now, handle))
+            if cur.rowcount:
+                self._stats["deduplicated_puts"] += 1
+                self._remember(handle, text, len(raw))
+                return handle
+        data = zlib.compress(raw, 6)  # Outside the lock: other sessions keep reading meanwhile.
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO documents (handle, data, size, raw_size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (handle, data, len(data), len(raw), now),
+            )
+            if cur.rowcount:
+                self._disk_bytes += len(data)
+                self._trim_disk(keep=handle)
+            self._remember(handle, text, len(raw))
+        return handle
+
+    def get(self, handle):
+        """The text for `handle`, or None if it is unknown or was evicted."""
+        if not handle:
+            return None
+        with self._lock:
+            entry = self._memory.get(handle)
+            if entry is not None:
+                self._memory.move_to_end(handle)
+                self._stats["memory_hits"] += 1
+                return entry[0]
+            row = self._db.execute("SELECT data, raw_size FROM documents WHERE handle = ?", (handle,)).fetchone()
+            if row is None:
+                self._stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE documents SET last_access = ? WHERE handle = ?", (time.time(), handle))
+            text = zlib.decompress(row[0]).decode("utf-8")
+            self._remember(handle, text, row[1])
+            self._stats["disk_hits"] += 1
+            return text
+
+    def acquire(self, handle):
+        if handle:
+            with self._lock:
+                cur = self._db.execute("UPDATE documents SET last_access = ? WHERE handle = ?", (time.time(), handle))
+                if cur.rowcount:
+                    self._db.execute(
+                        "INSERT INTO document_refs (handle, owner, refcount) VALUES (?, ?, 1)"
+                        " ON CONFLICT (handle, owner) DO UPDATE SET refcount = refcount + 1", (handle, self.owner)
+                    )
+
+    def release(self, handle):
+        if handle:
+            with self._lock:
+                self._db.execute("UPDATE document_refs SET refcount = refcount - 1 WHERE handle = ? AND owner = ?",
+                                 (handle, self.owner))
+                self._db.execute("DELETE FROM document_refs WHERE handle = ? AND owner = ? AND refcount <= 0",
+                                 (handle, self.owner))
+
+    def stats(self) -> dict:
+        """Hit/eviction counters plus memory and disk usage."""
+        with self._lock:
+            documents, raw_bytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0) FROM documents"
+            ).fetchone()
+            referenced = self._db.execute("SELECT COUNT(DISTINCT handle) FROM document_refs").fetchone()[0]
+            return dict(
+                self._stats,
+                documents=documents,
+                referenced_documents=referenced,
+                memory_items=len(self._memory),
+                memory_bytes=self._memory_bytes,
+                disk_bytes=self._disk_bytes,
+                raw_bytes=raw_bytes,
+                compression_ratio=raw_bytes / self._disk_bytes if self._disk_bytes else 0.0,
+            )
+
+
+document_store = DocumentStore(
+    path=None if os.getenv("DOCUMENT_STORE_DISABLED") else os.getenv("DOCUMENT_STORE_PATH", ".cache/documents.sqlite3"),
+)
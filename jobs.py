@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs kept for pick-up (e.g. after a reconnect); the oldest are dropped first.
+JOB_MAX_FINISHED = int(os.getenv("JOB_MAX_FINISHED", "500"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job function once its job has been cancelled."""
+
+
+class Job:
+    """A unit of background work with progress, cancellation and a stored result."""
+
+    def __init__(self, kind, key=None, speculative=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.speculative = speculative
+        self.status = QUEUED
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.partial = {}       # Output so far (streamed text, parsed questions) for polling views.
+        self.notices = []       # tutor_core notices raised while the job ran.
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def report(self, progress=None, message=None):
+        """Called by the job function to publish progress (0-1) and a short status line."""
+        if progress is not None:
+            self.progress = max(0.0, min(1.0, progress))
+        if message is not None:
+            self.message = message
+        self.raise_if_cancelled()
+
+    def raise_if_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.id)
+
+
+class JobQueue:
+    """Per-process worker pool running Jobs; safe to share between Streamlit sessions.
+
+    `submit(kind, fn, *args, **kwargs)` runs `fn(job, *args, **kwargs)` on the pool and
+    returns the Job at once. A `key` makes the submission idempotent: while a job with
+    the same key is queued, running or done, that job is returned instead of a new one
+    (so a speculative prefetch is picked up by the real request).
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, max_finished=JOB_MAX_FINISHED):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = OrderedDict()   # id -> Job, in submission order
+        self._by_key = {}
+        self._max_finished = max_finished
+        self._lock = threading.Lock()
+        self.stats = {"submitted": 0, "reused": 0, "done": 0, "failed": 0, "cancelled": 0, "speculative": 0}
+
+    def submit(self, kind, fn, *args, key=None, speculative=False, **kwargs):
+        with self._lock:
+            existing = self._by_key.get(key) if key is not None else None
+            if existing is not None and existing.status in (QUEUED, RUNNING, DONE):
+                self.stats["reused"] += 1
+                if not speculative:
+                    existing.speculative = False  # Someone is now waiting on it for real.
+                return existing
+            job = Job(kind, key, speculative)
+            self._jobs[job.id] = job
+            if key is not None:
+                self._by_key[key] = job
+            self.stats["submitted"] += 1
+            self.stats["speculative"] += speculative
+            self._trim()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        if job.cancelled:
+            self._finish(job, CANCELLED)
+            return
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            job.result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            job.error = e
+            self._finish(job, FAILED)
+        else:
+            job.progress = 1.0
+            self._finish(job, CANCELLED if job.cancelled else DONE)
+
+    def _finish(self, job, status):
+        with self._lock:
+            job.status = status
+            job.finished_at = time.time()
+            self.stats[status] += 1
+            if status != DONE and self._by_key.get(job.key) is job:
+                del self._by_key[job.key]  # Only successful results are reused.
+
+    def _trim(self):
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished[:max(0, len(finished) - self._max_finished)]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id) -> bool:
+        """Asks a job to stop; it ends as soon as its function next checks for cancellation."""
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_event.set()
+        return True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.finished]
+            return dict(self.stats, active=len(active), stored=len(self._jobs))
+
+
+job_queue = JobQueue()
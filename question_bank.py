@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+# MinHash signature length and LSH banding: 16 bands of 4 rows put the
+# candidate threshold around Jaccard 0.5; candidates are then checked against
+# QUESTION_BANK_DUPLICATE_THRESHOLD using the full signatures.
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_PERMUTATIONS // LSH_BANDS
+QUESTION_BANK_DUPLICATE_THRESHOLD = float(os.getenv("QUESTION_BANK_DUPLICATE_THRESHOLD", "0.7"))
+
+_MERSENNE_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(20240613)  # Fixed: signatures are stored, so the permutations must never change.
+_PERM_A = _rng.randint(1, _MERSENNE_PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+_PERM_B = _rng.randint(0, _MERSENNE_PRIME, size=MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def _shingles(text):
+    """Words and word pairs of the lower-cased text."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def minhash_signature(text):
+    """MINHASH_PERMUTATIONS-long uint64 MinHash of `text`'s shingles."""
+    shingles = _shingles(text)
+    if not shingles:
+        return np.full(MINHASH_PERMUTATIONS, _MERSENNE_PRIME, dtype=np.uint64)
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=4).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # (a * x + b) mod p for every permutation and shingle; all values stay below 2**63.
+    permuted = (np.outer(_PERM_A, hashes) + _PERM_B[:, None]) % _MERSENNE_PRIME
+    return permuted.min(axis=1)
+
+
+def estimated_similarity(sig_a, sig_b):
+    """Share of matching MinHash slots: an estimate of the Jaccard similarity."""
+    return float(np.mean(sig_a == sig_b))
+
+
+def _band_keys(signature):
+    """One signed 64-bit bucket key per LSH band."""
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS].tobytes()
+        keys.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little", signed=True))
+    return keys
+
+
+def _dedup_text(question):
+    return f"{question.get('question_text', '')} {question.get('correct_answer', '')}"
+
+
+def source_hash(text):
+    """Content hash identifying the document a question was generated from."""
+    return hashlib.sha256((text or "").strip().encode("utf-8")).hexdigest()
+
+
+class QuestionBank:
+    """Persistent, indexed store of generated questions with near-duplicate detection.
+
+    Questions are looked up by subject and by source-document hash (both indexed).
+    Each question's MinHash signature is split into LSH bands stored in their own
+    indexed table, so finding near-duplicates of a new question touches only the
+    few rows that share a band bucket instead of the whole bank.
+    Safe to share between Streamlit sessions (threads) in one process.
+    """
+
+    def __init__(self, path=None, duplicate_threshold=QUESTION_BANK_DUPLICATE_THRESHOLD):
+        self.path = path
+        self.duplicate_threshold = duplicate_threshold
+        self._lock = threading.RLock()
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " id INTEGER PRIMARY KEY,"
+            " subject TEXT NOT NULL,"
+            " source_hash TEXT NOT NULL,"
+            " question_text TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " correct_answer TEXT NOT NULL,"
+            " signature BLOB NOT NULL,"
+            " times_used INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_questions_subject ON questions(subject)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_questions_source_hash ON questions(source_hash)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS lsh_buckets ("
+            " band INTEGER NOT NULL,"
+            " bucket INTEGER NOT NULL,"
+            " question_id INTEGER NOT NULL REFERENCES questions(id))"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_lsh_band_bucket ON lsh_buckets(band, bucket)")
+        self._stats = {"added": 0, "duplicates": 0, "assembled_quizzes": 0}
+
+    @staticmethod
+    def _normalize_subject(subject):
+        return (subject or "").strip().lower()
+
+    def _near_duplicate_ids(self, signature, band_keys):
+        candidates = set()
+        for band, bucket in enumerate(band_keys):
+            rows = self._db.execute(
+                "SELECT question_id FROM lsh_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+            ).fetchall()
+            candidates.update(row[0] for row in rows)
+        matches = []
+        for question_id in candidates:
+            row = self._db.execute("SELECT signature FROM questions WHERE id = ?", (question_id,)).fetchone()
+            if row and estimated_similarity(signature, np.frombuffer(row[0], dtype=np.uint64)) >= self.duplicate_threshold:
+                matches.append(question_id)
+        return matches
+
+    def find_near_duplicates(self, question):
+        """Ids of stored questions that are near-duplicates of `question`."""
+        signature = minhash_signature(_dedup_text(question))
+        with self._lock:
+            return self._near_duplicate_ids(signature, _band_keys(signature))
+
+    def add_questions(self, questions, subject="", source_hash=""):
+        """Stores the questions that are not near-duplicates of ones already banked.
+
+        Returns (added, skipped_duplicates).
+        """
+        subject = self._normalize_subject(subject)
+        added = skipped = 0
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                for question in questions:
+                    if not isinstance(question, dict) or not question.get("question_text") or not question.get("correct_answer"):
+                        continue
+                    signature = minhash_signature(_dedup_text(question))
+                    band_keys = _band_keys(signature)
+                    if self._near_duplicate_ids(signature, band_keys):
+                        skipped += 1
+                        continue
+                    cur = self._db.execute(
+                        "INSERT INTO questions (subject, source_hash, question_text, options, correct_answer, signature, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (subject, source_hash, question["question_text"], json.dumps(question.get("options") or []),
+                         question["correct_answer"], signature.tobytes(), time.time()),
+                    )
+                    self._db.executemany(
+                        "INSERT INTO lsh_buckets (band, bucket, question_id) VALUES (?, ?, ?)",
+                        [(band, bucket, cur.lastrowid) for band, bucket in enumerate(band_keys)],
+                    )
+                    added += 1
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+            self._stats["added"] += added
+            self._stats["duplicates"] += skipped
+        return added, skipped
+
+    def _where(self, subject, source_hash):
+        clauses, params = [], []
+        if subject:
+            clauses.append("subject = ?")
+            params.append(self._normalize_subject(subject))
+        if source_hash:
+            clauses.append("source_hash = ?")
+            params.append(source_hash)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def count(self, subject=None, source_hash=None):
+        where, params = self._where(subject, source_hash)
+        with self._lock:
+            return self._db.execute(f"SELECT COUNT(*) FROM questions{where}", params).fetchone()[0]
+
+    def subjects(self):
+        """(subject, question count) pairs, largest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT subject, COUNT(*) FROM questions WHERE subject != '' GROUP BY subject ORDER BY COUNT(*) DESC"
+            ).fetchall()
+
+    def assemble_quiz(self, num_questions, subject=None, source_hash=None):
+        """An N-question quiz drawn from the bank, least-used questions first (random among ties).
+
+        Returns None if fewer than `num_questions` questions match.
+        """
+        where, params = self._where(subject, source_hash)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT id, question_text, options, correct_answer FROM questions{where}"
+                f" ORDER BY times_used, RANDOM() LIMIT ?",
+                params + [num_questions],
+            ).fetchall()
+            if len(rows) < num_questions:
+                return None
+            self._db.executemany("UPDATE questions SET times_used = times_used + 1 WHERE id = ?",
+                                 [(row[0],) for row in rows])
+            self._stats["assembled_quizzes"] += 1
+        return [
+            {"question_text": text, "options": json.loads(options), "correct_answer": answer, "id": f"bank_{row_id}"}
+            for row_id, text, options, answer in rows
+        ]
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, questions=self.count())
+
+
+question_bank = QuestionBank(
+    path=None if os.getenv("QUESTION_BANK_DISABLED") else os.getenv("QUESTION_BANK_PATH", "data/question_bank.sqlite3"),
+)
@@ -0,0 +1,199 @@
+import json
+import re
+import time
+
+# Tolerant line patterns for the "Q1: ... / A) ... / ANSWER: C" format we prompt for.
+# Markdown emphasis is stripped before matching, so "**Q1:**" and "**ANSWER:** C" work too.
+_QUESTION_LINE = re.compile(r"^\s*Q(?:uestion)?\s*(\d+)\s*[:.)]\s*(.*)$", re.IGNORECASE)
+# "1. ..." without the Q prefix starts a question only when none is open; inside a
+# question it is a numbered line of the stem (e.g. a list of steps).
+_NUMBERED_LINE = re.compile(r"^\s*(\d+)\s*[:.)]\s*(.*)$")
+_OPTION_LINE = re.compile(r"^\s*\(?([A-D])\s*[).:]\s*(.*)$", re.IGNORECASE)
+_ANSWER_LINE = re.compile(r"^\s*(?:correct\s+)?answer\s*[:\-]\s*\(?([A-D])\b", re.IGNORECASE)
+_MARKDOWN = re.compile(r"\*\*|__|`")
+# An unfinished line that may still grow into a question line ("Q", "**Quest", "Q 12", ...).
+_QUESTION_LINE_PREFIX = re.compile(
+    r"^[\s*_`]*(?:Q(?:u(?:e(?:s(?:t(?:i(?:o(?:n)?)?)?)?)?)?)?\s*(?:\d+\s*)?)?$", re.IGNORECASE
+)
+
+
+def is_question_line(line: str) -> bool:
+    """True if `line` starts a new "Q1: ..." question."""
+    return bool(_QUESTION_LINE.match(_MARKDOWN.sub("", line)))
+
+
+def may_start_question_line(partial_line: str) -> bool:
+    """True if an unfinished line could still turn out to start a question."""
+    return bool(_QUESTION_LINE_PREFIX.match(partial_line)) or is_question_line(partial_line)
+
+
+class QuizStreamParser:
+    """Incrementally parses streamed quiz text into question dicts.
+
+    Feed it text chunks as they arrive; each question is returned as soon as its
+    ANSWER line is complete. A question with a missing option or answer is dropped
+    on its own (counted in `dropped`) instead of invalidating the whole response.
+    """
+
+    def __init__(self, id_prefix="q"):
+        self.id_prefix = id_prefix
+        self.emitted = 0
+        self.dropped = 0
+        self._stamp = int(time.time())
+        self._buffer = ""
+        self._current = None   # {"text": [...], "options": {letter: [...]}, "field": ...}
+
+    def feed(self, chunk: str) -> list:
+        """Consumes a chunk of model output; returns the questions completed by it."""
+        self._buffer += chunk
+        *lines, self._buffer = self._buffer.split("\n")
+        completed = []
+        for line in lines:
+            question = self._consume_line(line)
+            if question is not None:
+                completed.append(question)
+        return completed
+
+    def close(self) -> list:
+        """Flushes the final unterminated line; returns any question it completes."""
+        line, self._buffer = self._buffer, ""
+        question = self._consume_line(line) if line.strip() else None
+        if self._current is not None:
+            self.dropped += 1  # Trailing question that never got its ANSWER line.
+            self._current = None
+        return [question] if question is not None else []
+
+    def _consume_line(self, raw_line):
+        line = _MARKDOWN.sub("", raw_line).strip()
+        if not line:
+            return None
+
+        match = _ANSWER_LINE.match(line)
+        if match:
+            return self._finish(match.group(1).upper())
+
+        match = _OPTION_LINE.match(line)
+        if match and self._current is not None:
+            letter = match.group(1).upper()
+            self._current["options"][letter] = [match.group(2).strip()]
+            self._current["field"] = letter
+            return None
+
+        match = _QUESTION_LINE.match(line) or (_NUMBERED_LINE.match(line) if self._current is None else None)
+        if match:
+            if self._current is not None:
+                self.dropped += 1  # Previous question never got its ANSWER line.
+            self._current = {"text": [match.group(2).strip()], "options": {}, "field": "text"}
+            return None
+
+        if self._current is not None:
+            # Continuation of a multi-line question or option.
+            field = self._current["field"]
+            target = self._current["text"] if field == "text" else self._current["options"][field]
+            target.append(line)
+        return None
+
+    def _finish(self, letter):
+        current, self._current = self._current, None
+        if current is None:
+            return None
+        text = " ".join(part for part in current["text"] if part).strip()
+        options = current["options"]
+        if not text or any(not options.get(l) for l in "ABCD"):
+            self.dropped += 1
+            return None
+
+        options_list = [f"{l}) {' '.join(options[l]).strip()}" for l in "ABCD"]
+        self.emitted += 1
+        return {
+            "question_text": text,
+            "options": options_list,
+            "correct_answer": options_list["ABCD".index(letter)],
+            "id": f"{self.id_prefix}_{self.emitted}_{self._stamp}",
+        }
+
+
+def parse_quiz_text(raw_output: str):
+    """Parses a complete response; returns (questions, dropped_count)."""
+    parser = QuizStreamParser()
+    questions = parser.feed(raw_output or "")
+    questions += parser.close()
+    return questions, parser.dropped
+
+
+# --- JSON (STRUCTURED) OUTPUT ---
+_OPTION_LABEL = re.compile(r"^\s*\(?[A-D]\s*[).:]\s*", re.IGNORECASE)
+_CODE_FENCE = re.compile(r"```(?:json)?", re.IGNORECASE)
+
+
+def _extract_json(raw_output: str):
+    """Decodes the first JSON object/array in `raw_output`, ignoring prose and code fences."""
+    text = _CODE_FENCE.sub("", raw_output or "")
+    decoder = json.JSONDecoder()
+    for i, ch in enumerate(text):
+        if ch in "{[":
+            try:
+                return decoder.raw_decode(text, i)[0]
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def validate_quiz_item(item):
+    """Checks one item against the quiz schema; returns a question dict (without id) or None.
+
+    Schema: {"question": str, "options": [4 distinct non-empty str], "answer": "A"-"D"}.
+    The answer may also be given as the full text of one of the options.
+    """
+    if not isinstance(item, dict):
+        return None
+    text = item.get("question")
+    options = item.get("options")
+    answer = item.get("answer")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if not isinstance(options, list) or len(options) != 4 or not all(isinstance(o, str) and o.strip() for o in options):
+        return None
+    options = [_OPTION_LABEL.sub("", o).strip() for o in options]
+    if len({o.lower() for o in options}) != 4:
+        return None
+    if not isinstance(answer, str):
+        return None
+    answer = answer.strip()
+    if len(answer) == 1 and answer.upper() in "ABCD":
+        index = "ABCD".index(answer.upper())
+    else:
+        bare = _OPTION_LABEL.sub("", answer).strip().lower()
+        matches = [i for i, o in enumerate(options) if o.lower() == bare]
+        if not matches:
+            match = re.match(r"^\(?([A-D])\b", answer, re.IGNORECASE)
+            if not match:
+                return None
+            matches = ["ABCD".index(match.group(1).upper())]
+        index = matches[0]
+
+    options_list = [f"{l}) {o}" for l, o in zip("ABCD", options)]
+    return {
+        "question_text": text.strip(),
+        "options": options_list,
+        "correct_answer": options_list[index],
+    }
+
+
+def parse_quiz_json(raw_output: str):
+    """Parses a JSON quiz response; returns (valid_questions, invalid_count).
+
+    Accepts {"questions": [...]} or a bare list. Each item is validated on its own,
+    so one bad item does not discard the others. Returned dicts have no "id" yet.
+    """
+    data = _extract_json(raw_output)
+    if isinstance(data, dict):
+        data = data.get("questions")
+    if not isinstance(data, list):
+        return [], 1 if (raw_output or "").strip() else 0
+    valid = []
+    for item in data:
+        question = validate_quiz_item(item)
+        if question is not None:
+            valid.append(question)
+    return valid, len(data) - len(valid)
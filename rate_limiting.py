@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+
+class TokenBucket:
+    """Process-wide request rate limiter: `rate` requests per second, bursts up to `burst`."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Blocks until a token is available; returns False if `timeout` runs out first."""
+        if self.rate <= 0:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class FairScheduler:
+    """Concurrency cap whose waiting callers are served weighted round-robin across lanes.
+
+    Each lane (e.g. "interactive" for student chat, "batch" for bulk quiz sections) has
+    its own FIFO queue, so a burst of queued batch work cannot starve interactive
+    requests: with weights {"interactive": 3, "batch": 1} up to three interactive
+    callers are admitted for every batch caller while both are waiting.
+    """
+
+    def __init__(self, max_concurrent: int, weights: dict = None):
+        self.max_concurrent = max_concurrent
+        self._weights = dict(weights or {})
+        self._queues = {}
+        self._cycle = []
+        self._cursor = 0
+        self._active = 0
+        self._cond = threading.Condition()
+        self.stats = {"admitted": 0, "timed_out": 0, "max_queue_depth": 0}
+        for lane in self._weights:
+            self._add_lane(lane)
+
+    def _add_lane(self, lane):
+        self._queues[lane] = deque()
+        self._cycle.extend([lane] * max(1, self._weights.get(lane, 1)))
+
+    def _head(self):
+        """(cycle position, ticket) of the caller that should be admitted next."""
+        for step in range(len(self._cycle)):
+            pos = (self._cursor + step) % len(self._cycle)
+            queue = self._queues[self._cycle[pos]]
+            if queue:
+                return pos, queue[0]
+        return None, None
+
+    def acquire(self, lane: str = "interactive", timeout: float = None) -> bool:
+        ticket = object()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            if lane not in self._queues:
+                self._add_lane(lane)
+            queue = self._queues[lane]
+            queue.append(ticket)
+            depth = sum(len(q) for q in self._queues.values())
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], depth)
+            while True:
+                pos, head = self._head()
+                if head is ticket and self._active < self.max_concurrent:
+                    queue.popleft()
+                    self._active += 1
+                    self._cursor = (pos + 1) % len(self._cycle)
+                    self.stats["admitted"] += 1
+                    self._cond.notify_all()
+                    return True
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    queue.remove(ticket)
+                    self.stats["timed_out"] += 1
+                    self._cond.notify_all()
+                    return False
+                self._cond.wait(remaining)
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, lane: str = "interactive", timeout: float = None):
+        if not self.acquire(lane, timeout):
+            raise TimeoutError(f"No free API slot for lane '{lane}' within {timeout}s")
+        try:
+            yield
+        finally:
+            self.release()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return dict(
+                self.stats,
+                active=self._active,
+                queued={lane: len(q) for lane, q in self._queues.items()},
+            )
@@ -0,0 +1,102 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+from scipy import sparse
+
+from text_chunking import split_into_sections
+
+PASSAGE_TOKENS = int(os.getenv("QNA_PASSAGE_TOKENS", "200"))
+MAX_CACHED_INDEXES = int(os.getenv("QNA_MAX_CACHED_INDEXES", "32"))
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have how i in is it its of on or that the "
+    "this to was were what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased word tokens with common stopwords removed."""
+    return [t for t in _TOKEN.findall(text.lower()) if t not in _STOPWORDS]
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of passages, stored as a SciPy sparse matrix.
+
+    All per-(passage, term) weights are computed once at build time, so a query is a
+    column slice plus a row sum. Runs entirely locally; no network or GPU needed.
+    """
+
+    def __init__(self, passages: list, k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        vocab = {}
+        rows, cols, counts = [], [], []
+        for i, passage in enumerate(passages):
+            for term, count in Counter(tokenize(passage)).items():
+                rows.append(i)
+                cols.append(vocab.setdefault(term, len(vocab)))
+                counts.append(count)
+        self.vocab = vocab
+        n_docs, n_terms = len(passages), len(vocab)
+        tf = sparse.csr_matrix(
+            (np.asarray(counts, dtype=np.float32), (rows, cols)), shape=(n_docs, n_terms)
+        )
+
+        doc_len = np.asarray(tf.sum(axis=1)).ravel()
+        avg_len = doc_len.mean() if n_docs and doc_len.mean() > 0 else 1.0
+        df = np.bincount(tf.indices, minlength=n_terms)
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        row_of_entry = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        norm = k1 * (1 - b + b * doc_len / avg_len)
+        weights = tf.data * (k1 + 1) / (tf.data + norm[row_of_entry]) * idf[tf.indices]
+        # CSC makes the per-query column slice cheap.
+        self._weights = sparse.csr_matrix((weights, tf.indices, tf.indptr), shape=tf.shape).tocsc()
+
+    @classmethod
+    def from_text(cls, text: str, passage_tokens: int = PASSAGE_TOKENS):
+        return cls(split_into_sections(text, passage_tokens))
+
+    def search(self, query: str, k: int = 4) -> list:
+        """Returns up to `k` (passage_index, score) pairs with a positive score, best first."""
+        term_ids = sorted({self.vocab[t] for t in tokenize(query) if t in self.vocab})
+        if not term_ids or not self.passages:
+            return []
+        scores = np.asarray(self._weights[:, term_ids].sum(axis=1)).ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(i), float(scores[i])) for i in top if scores[i] > 0]
+
+    def top_passages(self, query: str, k: int = 4) -> list:
+        """The `k` most relevant passages in document order (the first `k` if nothing matches)."""
+        hits = self.search(query, k)
+        indices = sorted(i for i, _ in hits) if hits else range(min(k, len(self.passages)))
+        return [self.passages[i] for i in indices]
+
+
+# --- PROCESS-WIDE INDEX CACHE ---
+# Indexes are keyed by a hash of the text, so each document is indexed once and
+# shared by every session that processed the same text.
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(text: str) -> BM25Index:
+    """Returns the BM25 index for `text`, building and caching it on first use."""
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+    index = BM25Index.from_text(text)
+    with _indexes_lock:
+        _indexes[key] = index
+        while len(_indexes) > MAX_CACHED_INDEXES:
+            _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,150 @@
+import threading
+import time
+from concurrent.futures import CancelledError
+
+
+class Flight:
+    """One in-flight upstream request whose output is shared by every caller waiting on it.
+
+    The producer publishes text chunks and then finishes (optionally with an error).
+    Each subscriber reads from the start at its own pace and with its own timeout
+    and cancellation; leaving early only drops that subscriber.
+    """
+
+    def __init__(self, detach=None):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancelled = False
+        self._detach = detach  # Called under the owner's lock once the flight is abandoned.
+        self._cond = threading.Condition()
+
+    @property
+    def abandoned(self) -> bool:
+        """True once every subscriber has gone; the producer may stop early.
+
+        Once this has returned True the flight takes no new subscribers and finishes
+        with CancelledError, so nobody mistakes its partial output for a full reply.
+        """
+        if self.cancelled:
+            return True
+        if self.subscribers or self.done:  # Unlocked fast path: a reader was still there a moment ago.
+            return self.subscribers == 0
+        if self._detach is not None:
+            return self._detach(self)
+        with self._cond:
+            self.cancelled = self.subscribers == 0
+            return self.cancelled
+
+    def publish(self, chunk):
+        with self._cond:
+            self.chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        with self._cond:
+            self.done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def _unsubscribe(self):
+        with self._cond:
+            self.subscribers -= 1
+
+    def _wait(self, have, deadline, cancel):
+        """Blocks until there are more than `have` chunks or the flight is done."""
+        while len(self.chunks) <= have and not self.done:
+            if cancel is not None and cancel.is_set():
+                raise CancelledError("Request cancelled by the caller")
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError("Timed out waiting for the AI response")
+            # Wake up periodically to notice a cancellation.
+            self._cond.wait(remaining if cancel is None else min(0.1, remaining or 0.1))
+
+    def iter_chunks(self, timeout=None, cancel=None):
+        """Yields every chunk, past and future; `timeout` bounds the whole wait (seconds)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        position = 0
+        try:
+            while True:
+                with self._cond:
+                    self._wait(position, deadline, cancel)
+                    new = self.chunks[position:]
+                    finished, error = self.done, self.error
+                position += len(new)
+                yield from new
+                if finished and position >= len(self.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._unsubscribe()
+
+    def result(self, timeout=None, cancel=None) -> str:
+        """The full text once the flight is done."""
+        return "".join(self.iter_chunks(timeout, cancel))
+
+
+class SingleFlight:
+    """Runs at most one request per key at a time; concurrent callers share it.
+
+    `join(key, produce)` returns `(flight, leader)`. The first caller for a key starts
+    `produce(flight)` on `executor`, so the request outlives any single caller; later
+    callers attach to the same flight until it finishes. The caller is counted as a
+    subscriber from the moment it joins.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.stats = {"flights": 0, "coalesced": 0}
+
+    def join(self, key, produce):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight(detach=lambda abandoned: self._detach_if_abandoned(key, abandoned))
+                self._flights[key] = flight
+                self.stats["flights"] += 1
+            else:
+                self.stats["coalesced"] += 1
+            with flight._cond:
+                flight.subscribers += 1
+        if leader:
+            self._executor.submit(self._run, key, flight, produce)
+        return flight, leader
+
+    def _detach_if_abandoned(self, key, flight) -> bool:
+        """Atomically with join(): unregisters `flight` if nobody is subscribed to it."""
+        with self._lock:
+            with flight._cond:
+                if flight.subscribers:
+                    return False
+                flight.cancelled = True
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            return True
+
+    def _run(self, key, flight, produce):
+        error = None
+        try:
+            produce(flight)
+        except BaseException as e:
+            error = e
+        finally:
+            # Unregister before finishing: the result is already cached by now, so
+            # callers arriving from here on are served by the cache instead.
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            if flight.cancelled and error is None:
+                error = CancelledError("Every caller left before the request finished")
+            flight.finish(error)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
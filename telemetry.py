@@ -0,0 +1,230 @@
+import bisect
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Prometheus-style latency buckets (seconds); percentiles come from a window of raw samples.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TELEMETRY_WINDOW = int(os.getenv("TELEMETRY_WINDOW", "1000"))
+# Fraction of extraction/parse timings that are recorded; LLM calls are always recorded.
+TELEMETRY_SAMPLE_RATE = float(os.getenv("TELEMETRY_SAMPLE_RATE", "1.0"))
+# Optional {"model": [prompt_usd_per_million, completion_usd_per_million]} for cost estimates.
+MODEL_PRICES = json.loads(os.getenv("MODEL_PRICES_JSON", "{}"))
+
+
+def percentile(sorted_samples, q):
+    """Linear-interpolated q-th percentile (0-100) of an already sorted list."""
+    if not sorted_samples:
+        return None
+    pos = (len(sorted_samples) - 1) * q / 100
+    low = int(pos)
+    high = min(low + 1, len(sorted_samples) - 1)
+    return sorted_samples[low] + (sorted_samples[high] - sorted_samples[low]) * (pos - low)
+
+
+class Histogram:
+    """Cumulative bucket counts for export plus a sliding window of samples for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=TELEMETRY_WINDOW):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf.
+        self.count = 0
+        self.sum = 0.0
+        self._window = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self._window.append(value)
+
+    def summary(self):
+        samples = sorted(self._window)
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": percentile(samples, 50),
+            "p95": percentile(samples, 95),
+            "p99": percentile(samples, 99),
+        }
+
+
+class Telemetry:
+    """Process-wide metrics for LLM calls (per feature) and sampled local timings."""
+
+    def __init__(self, sample_rate=TELEMETRY_SAMPLE_RATE, prices=None, history=500):
+        self.sample_rate = sample_rate
+        self.prices = MODEL_PRICES if prices is None else prices
+        self._lock = threading.Lock()
+        self._histograms = defaultdict(Histogram)   # (metric, label) -> Histogram
+        self._counters = defaultdict(float)         # (metric, feature, label) -> value
+        self._label_names = {"llm_calls_total": "cache"}  # Counter -> name of its second label.
+        self.recent_calls = deque(maxlen=history)
+
+    def record_call(self, feature, model, cached, streamed, wall_seconds, ttft_seconds,
+                    prompt_tokens=None, completion_tokens=None, retries=0):
+        """Records one LLM call; token counts come from the response's `usage` (None if not reported)."""
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        call = {
+            "feature": feature,
+            "model": model,
+            "cached": cached,
+            "streamed": streamed,
+            "wall_seconds": wall_seconds,
+            "ttft_seconds": ttft_seconds,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": retries,
+            "cost_usd": cost,
+            "finished_at": time.time(),
+        }
+        cache_status = "hit" if cached else "miss"
+        with self._lock:
+            self.recent_calls.append(call)
+            self._counters[("llm_calls_total", feature, cache_status)] += 1
+            self._counters[("llm_retries_total", feature, model)] += retries
+            if not cached:
+                self._histograms[("llm_call_seconds", feature)].observe(wall_seconds)
+                if ttft_seconds is not None:
+                    self._histograms[("llm_ttft_seconds", feature)].observe(ttft_seconds)
+                self._counters[("llm_prompt_tokens_total", feature, model)] += prompt_tokens or 0
+                self._counters[("llm_completion_tokens_total", feature, model)] += completion_tokens or 0
+                self._counters[("llm_cost_usd_total", feature, model)] += cost or 0.0
+        return call
+
+    def recent(self) -> list:
+        """The most recent calls (as recorded by record_call), oldest first."""
+        with self._lock:
+            return list(self.recent_calls)
+
+    def increment(self, metric, feature, label, value=1, label_name="model"):
+        """Adds to a counter exported as `edututor_<metric>{feature=..., <label_name>=label}`."""
+        with self._lock:
+            self._counters[(metric, feature, label)] += value
+            self._label_names[metric] = label_name
+
+    def latency_percentile(self, metric, label, q, min_samples=1):
+        """q-th percentile of the recent samples of one histogram, or None with fewer than `min_samples`."""
+        with self._lock:
+            histogram = self._histograms.get((metric, label))
+            samples = sorted(histogram._window) if histogram is not None else []
+        return percentile(samples, q) if len(samples) >= min_samples else None
+
+    def estimate_cost(self, model, prompt_tokens, completion_tokens):
+        price = self.prices.get(model)
+        if not price or prompt_tokens is None or completion_tokens is None:
+            return None
+        return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+
+    def observe(self, name, seconds):
+        """Records a local timing (extraction, parsing, ...) if it falls in the sample."""
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        with self._lock:
+            self._histograms[("operation_seconds", name)].observe(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        """`with telemetry.timed("extract_pdf"): ...` records the block's duration (sampled)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self) -> dict:
+        """JSON-friendly view: latency percentiles per feature/operation and token/cost totals."""
+        with self._lock:
+            latency = defaultdict(dict)
+            for (metric, label), histogram in self._histograms.items():
+                latency[metric][label] = histogram.summary()
+            usage = defaultdict(lambda: defaultdict(float))
+            for (metric, feature, _), value in self._counters.items():
+                usage[feature][metric] += value
+            return {
+                "latency": {metric: dict(labels) for metric, labels in latency.items()},
+                "usage_by_feature": {feature: dict(values) for feature, values in usage.items()},
+                "sample_rate": self.sample_rate,
+            }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            label_names = dict(self._label_names)
+        for metric in sorted({m for (m, _) in (key for key, _ in histograms)}):
+            lines.append(f"# TYPE edututor_{metric} histogram")
+            label_name = "operation" if metric == "operation_seconds" else "feature"
+            for (name, label), histogram in histograms:
+                if name != metric:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'edututor_{metric}_bucket{{{label_name}="{label}",le="{bound}"}} {cumulative}')
+                lines.append(f'edututor_{metric}_sum{{{label_name}="{label}"}} {histogram.sum}')
+                lines.append(f'edututor_{metric}_count{{{label_name}="{label}"}} {histogram.count}')
+        for metric in sorted({key[0] for key, _ in counters}):
+            lines.append(f"# TYPE edututor_{metric} counter")
+            second_label = label_names.get(metric, "model")
+            for (name, feature, other), value in counters:
+                if name == metric:
+                    lines.append(f'edututor_{metric}{{feature="{feature}",{second_label}="{other}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+telemetry = Telemetry()
+
+
+# --- EXPORT ENDPOINT ---
+# Streamlit cannot serve extra routes, so metrics are exposed by a small side server
+# (GET /metrics for Prometheus, GET /metrics.json) when TELEMETRY_PORT is set. It
+# listens on localhost unless TELEMETRY_HOST says otherwise (e.g. 0.0.0.0 for a scraper
+# on another machine), since the metrics include per-feature usage and cost.
+TELEMETRY_HOST = os.getenv("TELEMETRY_HOST", "127.0.0.1")
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = telemetry.to_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(telemetry.snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=None, host=None):
+    """Starts the export endpoint once per process; returns its port, or None if disabled."""
+    global _server
+    port = port if port is not None else int(os.getenv("TELEMETRY_PORT", "0") or 0)
+    host = host or TELEMETRY_HOST
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                return None  # Already served by another process (e.g. a second Streamlit worker).
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, daemon=True, name="metrics-server").start()
+        return _server.server_address[1]
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+# Module-level settings are read at import time: no disk caches, no rate limit, no real key.
+for name, value in {
+    "API_KEY": "test",
+    "RESPONSE_CACHE_DISABLED": "1",
+    "DOCUMENT_STORE_DISABLED": "1",
+    "EXTRACTION_CACHE_DISABLED": "1",
+    "QUESTION_BANK_DISABLED": "1",
+    "API_RATE_PER_SECOND": "0",
+    "API_MAX_RETRIES": "0",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture(scope="session")
+def stub_server():
+    """The benchmarks' OpenAI-compatible stub; every API call in the test session goes to it."""
+    from stub_server import start_stub_server
+
+    server, url = start_stub_server(latency=0.0)
+    os.environ["OPENROUTER_BASE_URL"] = url
+    yield server.RequestHandlerClass  # Its `config` and `stats` are per server.
+    server.shutdown()
+
+
+@pytest.fixture
+def stub(stub_server):
+    """The stub with default settings; tests may change `stub.config` for their own run."""
+    saved = dict(stub_server.config)
+    yield stub_server
+    stub_server.config.clear()
+    stub_server.config.update(saved)
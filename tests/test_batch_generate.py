@@ -0,0 +1,23 @@
+import json
+
+from fixtures import make_pdf_bytes
+
+import batch_generate
+
+
+def test_batch_writes_records_and_skips_finished_documents_on_rerun(stub, tmp_path):
+    docs = tmp_path / "docs"
+    (docs / "unit2").mkdir(parents=True)
+    (docs / "unit1.pdf").write_bytes(make_pdf_bytes(1, seed=1))
+    (docs / "unit2" / "unit2.pdf").write_bytes(make_pdf_bytes(1, seed=2))
+    (docs / "notes.txt").write_text("not a document")
+    output = tmp_path / "out.jsonl"
+
+    summary = batch_generate.run_batch(str(docs), str(output), num_questions=3, concurrency=2)
+    assert (summary["documents"], summary["ok"], summary["skipped"]) == (2, 2, 0)
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert all(len(record["questions"]) == 3 and record["simplified_text"] for record in records)
+
+    again = batch_generate.run_batch(str(docs), str(output), num_questions=3)
+    assert (again["ok"], again["skipped"]) == (0, 2)
+    assert len(output.read_text().splitlines()) == 2
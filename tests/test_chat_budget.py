@@ -0,0 +1,63 @@
+import time
+
+import tutor_core
+from conversation import Conversation
+from fixtures import sample_paragraph
+from jobs import JobQueue
+from token_budget import count_tokens, take_within, trim_to_tokens
+
+
+def test_trim_to_tokens_keeps_start_or_end_within_budget():
+    text = " ".join(f"word{n}" for n in range(200))
+    assert trim_to_tokens("short text", 50) == "short text"
+    start = trim_to_tokens(text, 20)
+    end = trim_to_tokens(text, 20, keep="end")
+    assert count_tokens(start) <= 20 and start.startswith("word0 ") and start.endswith(" ...")
+    assert count_tokens(end) <= 20 and end.startswith("... ") and end.endswith("word199")
+
+
+def test_take_within_returns_the_longest_fitting_prefix():
+    assert take_within(["aaaa", "bbbb", "cccc"], 2) == ["aaaa", "bbbb"]
+    assert take_within(["a" * 40, "b"], 2) == []
+
+
+def test_chat_prompt_without_conversation_matches_the_stateless_prompt():
+    prompt = tutor_core.build_chat_prompt("What is a cell?", "Cells are the units of life.")
+    assert prompt == (
+        "You are a helpful AI Tutor. Based on the following context text provided by a student:\n\n"
+        "--- CONTEXT START ---\nCells are the units of life.\n--- CONTEXT END ---\n\n"
+        "Please answer the student's follow-up question concisely and clearly: 'What is a cell?'"
+    )
+
+
+def test_chat_prompt_stays_within_budget_with_long_history_and_document():
+    document = sample_paragraph(20, seed=5)
+    turns = [(f"Question {n} " + "why " * 5, f"Answer {n} " + "because " * 10) for n in range(30)]
+    summary = "earlier notes " * 500
+    budget = 800
+    prompt = tutor_core.build_chat_prompt("How do enzymes work?", document, summary, turns, budget=budget)
+    assert count_tokens(prompt) <= budget
+    assert "How do enzymes work?" in prompt
+    assert "Answer 29" in prompt  # The newest turn is kept; the oldest ones are not.
+    assert "Answer 0 " not in prompt
+
+
+def test_conversation_is_compacted_by_the_summary_job(stub):
+    queue = JobQueue(max_workers=1)
+    conversation = Conversation(recent_turns=2, compact_batch=2, display_turns=3)
+    for n in range(4):
+        conversation.add_turn(f"question {n}", f"answer {n}")
+    batch = conversation.compaction_batch()
+    assert batch == [("question 0", "answer 0"), ("question 1", "answer 1")]
+    conversation.start_compaction(queue.submit("chat_summary", tutor_core.chat_summary_job,
+                                               conversation.summary, batch), len(batch))
+    assert conversation.compaction_batch() == []  # One job at a time.
+    deadline = time.monotonic() + 5
+    while conversation.compacting and time.monotonic() < deadline:
+        time.sleep(0.02)
+        conversation.refresh()
+    assert conversation.summary
+    assert conversation.turns == [("question 2", "answer 2"), ("question 3", "answer 3")]
+    stats = conversation.stats()
+    assert (stats["turns"], stats["summarized_turns"], stats["pending_turns"]) == (4, 2, 2)
+    assert conversation.hidden_turns == 1
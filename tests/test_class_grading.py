@@ -0,0 +1,42 @@
+import random
+
+import tutor_core
+from class_grading import grade_class, load_submissions, submissions_template_csv
+
+
+def _quiz(n):
+    questions = []
+    for i in range(n):
+        options = [f"{letter}) Option {i}{letter.lower()}" for letter in "ABCD"]
+        questions.append({"id": f"q{i}", "question_text": f"Question {i}?", "options": options,
+                          "correct_answer": options[i % 4]})
+    return questions
+
+
+def test_scores_and_feedback_match_grade_assessment():
+    questions = _quiz(6)
+    rng = random.Random(3)
+    submissions = []
+    for s in range(40):
+        answers = {q["id"]: rng.choice(q["options"]) for q in questions if rng.random() > 0.2}
+        submissions.append((f"s{s}", answers))
+    report = grade_class(questions, submissions)
+    for (student_id, answers), score in zip(submissions, report.scores.tolist()):
+        expected_score, total, expected_feedback = tutor_core.grade_assessment(answers, questions)
+        assert (score, len(questions)) == (expected_score, total)
+        assert report.feedback(student_id) == expected_feedback
+
+
+def test_letters_and_bare_option_text_are_accepted():
+    questions = _quiz(2)
+    csv_text = submissions_template_csv(questions) + "ann,A,Option 1b\nbob,a,\n"
+    report = grade_class(questions, load_submissions(csv_text, "class.csv"))
+    assert report.student_ids == ["ann", "bob"]
+    assert report.scores.tolist() == [2, 1]
+
+
+def test_item_analysis_counts_options():
+    questions = _quiz(1)
+    submissions = [("a", {"q0": "A"}), ("b", {"q0": "B"}), ("c", {"q0": "A"}), ("d", {})]
+    row = grade_class(questions, submissions).item_analysis()[0]
+    assert (row["A"], row["B"], row["unanswered"], row["difficulty"]) == (2, 1, 1, 0.5)
@@ -0,0 +1,97 @@
+import time
+
+import tutor_core
+from fixtures import sample_paragraph
+from stub_server import canned_quiz_text
+from jobs import DONE, JobQueue
+from telemetry import telemetry
+
+
+def test_explain_and_quiz_is_one_request(stub):
+    before = stub.stats["requests"]
+    explanation, questions = tutor_core.explain_and_quiz(sample_paragraph(1, seed=21), num_questions=3)
+    assert explanation and "=== QUIZ ===" not in explanation
+    assert len(questions) == 3
+    assert all(q["question_text"] and q["correct_answer"] for q in questions)
+    assert stub.stats["requests"] - before == 1
+
+
+def test_personalized_versions_are_one_request(stub):
+    before = stub.stats["requests"]
+    seen = []
+    versions = tutor_core.generate_personalized_versions(sample_paragraph(1, seed=22), on_text=seen.append)
+    assert set(versions) == {"easy", "medium", "hard"}
+    assert all(versions.values())
+    assert seen and seen[-1].startswith("=== EASY ===")
+    assert stub.stats["requests"] - before == 1
+
+
+def test_split_level_sections_ignores_unrequested_and_empty_levels():
+    raw = "=== EASY ===\nsimple\n=== EXPERT ===\nhard words\n=== MEDIUM ===\n\n"
+    assert tutor_core.split_level_sections(raw, ["easy", "medium"]) == {"easy": "simple"}
+
+
+def _reply_in_chunks(monkeypatch, reply, size=3):
+    monkeypatch.setattr(tutor_core, "call_openrouter_api",
+                        lambda prompt, **kwargs: iter([reply[i:i + size] for i in range(0, len(reply), size)]))
+
+
+def test_first_question_line_ends_the_explanation_without_a_marker(monkeypatch):
+    explanation_text = "Plants turn light into sugar.\nQuite simply, leaves are solar panels.\n\n"
+    _reply_in_chunks(monkeypatch, explanation_text + "**" + canned_quiz_text(3))
+    explanation, questions = tutor_core.explain_and_quiz("Photosynthesis.", num_questions=3)
+    assert explanation == explanation_text.strip()
+    assert [q["correct_answer"] for q in questions] == ["B) Statement 1b", "C) Statement 2c", "D) Statement 3d"]
+
+
+def test_question_mentioned_mid_line_stays_in_the_explanation(monkeypatch):
+    explanation_text = "As in Q1: of the workbook, plants make sugar.\n=== QUIZ ===\n"
+    _reply_in_chunks(monkeypatch, explanation_text + canned_quiz_text(3), size=50)
+    explanation, questions = tutor_core.explain_and_quiz("Photosynthesis.", num_questions=3)
+    assert explanation == "As in Q1: of the workbook, plants make sugar."
+    assert len(questions) == 3
+
+
+def _failing_feature(monkeypatch, feature, after_chunks=()):
+    """Makes streamed calls for `feature` yield `after_chunks` and then fail like a 503."""
+    real_call = tutor_core.call_openrouter_api
+
+    def call(prompt, *args, **kwargs):
+        if kwargs.get("feature") != feature:
+            return real_call(prompt, *args, **kwargs)
+
+        def failing():
+            yield from after_chunks
+            raise RuntimeError("503 Service Unavailable")
+        return failing()
+
+    monkeypatch.setattr(tutor_core, "call_openrouter_api", call)
+
+
+def _run_student_job(text):
+    queue = JobQueue(max_workers=1)
+    job = queue.submit("student_processing", tutor_core.student_processing_job, text, 3)
+    deadline = time.monotonic() + 10
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return job
+
+
+def test_student_job_falls_back_to_separate_calls(stub, monkeypatch):
+    _failing_feature(monkeypatch, "explain_quiz")
+    job = _run_student_job(sample_paragraph(1, seed=23))
+    assert job.status == DONE
+    assert job.result["explanation"]
+    assert len(job.result["questions"]) == 3
+    assert job.result["errors"] == {}
+    assert any("Combined generation failed" in notice.message for notice in job.notices)
+    exported = telemetry.to_prometheus()
+    assert 'edututor_combined_fallback_calls_total{feature="explain_quiz",part="quiz"}' in exported
+
+
+def test_student_job_keeps_the_quiz_when_the_explanation_breaks_midway(stub, monkeypatch):
+    _failing_feature(monkeypatch, "explain_quiz", after_chunks=["Plants use light "])
+    job = _run_student_job(sample_paragraph(1, seed=24))
+    assert job.status == DONE
+    assert set(job.result["errors"]) == {"explanation"}
+    assert len(job.result["questions"]) == 3
@@ -0,0 +1,58 @@
+import random
+import string
+
+from document_store import DocumentStore, document_handle
+
+
+def _text(seed, size=20000):
+    rng = random.Random(seed)
+    return "".join(rng.choice(string.ascii_letters + " ") for _ in range(size))
+
+
+def test_identical_texts_are_stored_once(tmp_path):
+    store = DocumentStore(str(tmp_path / "docs.sqlite3"))
+    text = "Photosynthesis happens in chloroplasts. " * 500
+    handle = store.put(text)
+    assert store.put(text) == handle == document_handle(text)
+    store._memory.clear()
+    store._memory_bytes = 0
+    assert store.get(handle) == text  # From the compressed disk copy.
+    stats = store.stats()
+    assert (stats["documents"], stats["deduplicated_puts"], stats["disk_hits"]) == (1, 1, 1)
+    assert stats["compression_ratio"] > 10
+
+
+def test_memory_tier_is_bounded():
+    store = DocumentStore(max_memory_bytes=50000)
+    for seed in range(5):
+        store.put(_text(seed))
+    assert store.stats()["memory_bytes"] <= 50000
+
+
+def test_unreferenced_documents_are_evicted_first(tmp_path):
+    store = DocumentStore(str(tmp_path / "docs.sqlite3"), max_disk_bytes=40000)
+    kept = store.put(_text(0))
+    store.acquire(kept)
+    dropped = store.put(_text(1))
+    store.put(_text(2))  # Over budget: the unreferenced, older document goes.
+    store._memory.clear()
+    store._memory_bytes = 0
+    assert store.get(kept) is not None
+    assert store.get(dropped) is None
+
+
+def test_opening_the_store_keeps_other_processes_references(tmp_path):
+    path = str(tmp_path / "docs.sqlite3")
+    first = DocumentStore(path)
+    handle = first.put("shared text")
+    first.acquire(handle)
+    # A dead process on this host left a reference behind.
+    first._db.execute("INSERT INTO document_refs VALUES (?, ?, 1)", ("dead", first.owner.rsplit(":", 1)[0] + ":999999999"))
+
+    second = DocumentStore(path)
+    second.owner += "-second"  # Another live process using the same file.
+    assert second.stats()["referenced_documents"] == 1  # Only the dead owner's row was cleared.
+    second.acquire(handle)
+    second.release(handle)
+    first_refs = first._db.execute("SELECT refcount FROM document_refs WHERE owner = ?", (first.owner,)).fetchall()
+    assert first_refs == [(1,)]
@@ -0,0 +1,20 @@
+from fixtures import make_pdf_bytes
+
+from text_extraction import DOCX_MIME, PDF_MIME, extract_document_text, extraction_cache_key
+
+
+def test_repeat_upload_is_served_from_the_cache_without_parsing():
+    pdf = make_pdf_bytes(2, seed=7)
+    progress = []
+    text, hit = extract_document_text(pdf, PDF_MIME, lambda done, total: progress.append((done, total)))
+    assert not hit and progress == [(1, 2), (2, 2)]
+
+    progress.clear()
+    again, hit = extract_document_text(bytes(pdf), PDF_MIME, lambda done, total: progress.append((done, total)))
+    assert hit and again == text and progress == []
+
+
+def test_key_depends_on_content_and_type():
+    assert extraction_cache_key(b"abc", PDF_MIME) == extraction_cache_key(b"abc", PDF_MIME)
+    assert extraction_cache_key(b"abc", PDF_MIME) != extraction_cache_key(b"abd", PDF_MIME)
+    assert extraction_cache_key(b"abc", PDF_MIME) != extraction_cache_key(b"abc", DOCX_MIME)
@@ -0,0 +1,69 @@
+import threading
+import time
+
+import api_service
+import tutor_core
+from jobs import CANCELLED, DONE, FAILED, JobQueue
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_job_result_and_progress():
+    queue = JobQueue(max_workers=2)
+
+    def work(job, x):
+        job.report(0.5, "halfway")
+        return x * 2
+
+    job = queue.submit("double", work, 21)
+    assert _wait_until(lambda: job.finished)
+    assert (job.status, job.result, job.progress) == (DONE, 42, 1.0)
+
+
+def test_failed_job_keeps_its_error():
+    queue = JobQueue(max_workers=1)
+    job = queue.submit("boom", lambda job: 1 / 0)
+    assert _wait_until(lambda: job.finished)
+    assert job.status == FAILED and isinstance(job.error, ZeroDivisionError)
+
+
+def test_same_key_reuses_the_job():
+    queue = JobQueue(max_workers=1)
+    release = threading.Event()
+    first = queue.submit("slow", lambda job: release.wait(5), key="k", speculative=True)
+    second = queue.submit("slow", lambda job: None, key="k")
+    release.set()
+    assert second is first and not first.speculative
+    assert queue.snapshot()["reused"] == 1
+
+
+def test_cancel_stops_a_running_job():
+    queue = JobQueue(max_workers=1)
+
+    def loop(job):
+        while True:
+            job.report(message="working")
+            time.sleep(0.01)
+
+    job = queue.submit("loop", loop)
+    assert _wait_until(lambda: job.status == "running")
+    assert queue.cancel(job.id)
+    assert _wait_until(lambda: job.finished)
+    assert job.status == CANCELLED
+
+
+def test_cancelled_student_job_releases_its_upstream_request(stub):
+    stub.config.update(token_delay=0.02, reply_words=500)  # About 10 s of streaming.
+    queue = JobQueue(max_workers=1)
+    job = queue.submit("student_processing", tutor_core.student_processing_job, "Plants make sugar. " * 50, 3)
+    assert _wait_until(lambda: api_service.in_flight.in_flight() == 1)
+    queue.cancel(job.id)
+    assert _wait_until(lambda: job.finished)
+    assert _wait_until(lambda: api_service.in_flight.in_flight() == 0, timeout=2.0)
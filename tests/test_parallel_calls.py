@@ -0,0 +1,33 @@
+import threading
+import time
+
+from api_service import run_in_parallel
+
+
+def test_failed_branch_leaves_the_other_result_usable():
+    results, errors = run_in_parallel({
+        "explanation": lambda: "simpler text",
+        "quiz": lambda: 1 / 0,
+    })
+    assert results == {"explanation": "simpler text"}
+    assert set(errors) == {"quiz"} and isinstance(errors["quiz"], ZeroDivisionError)
+
+
+def test_slow_branch_times_out_without_holding_back_the_other():
+    release = threading.Event()
+    started = time.perf_counter()
+    results, errors = run_in_parallel({
+        "preview": lambda: "preview text",
+        "quiz": lambda: release.wait(5),
+    }, timeout=0.2)
+    release.set()
+    assert time.perf_counter() - started < 1.0
+    assert results == {"preview": "preview text"}
+    assert isinstance(errors["quiz"], TimeoutError)
+
+
+def test_branches_run_concurrently():
+    started = time.perf_counter()
+    results, errors = run_in_parallel({name: (lambda: time.sleep(0.3) or "ok") for name in ("a", "b", "c")})
+    assert results == {"a": "ok", "b": "ok", "c": "ok"} and errors == {}
+    assert time.perf_counter() - started < 0.8
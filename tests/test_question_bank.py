@@ -0,0 +1,40 @@
+from question_bank import QuestionBank, source_hash
+
+
+def _question(text, answer="A"):
+    return {"question_text": text, "options": ["A) x", "B) y", "C) z", "D) w"], "correct_answer": answer}
+
+
+PHOTOSYNTHESIS = "Which pigment in plant cells absorbs the light energy used during photosynthesis in the leaf?"
+
+
+def test_near_duplicates_are_skipped_and_distinct_questions_kept():
+    bank = QuestionBank()
+    assert bank.add_questions([_question(PHOTOSYNTHESIS)], subject="Biology") == (1, 0)
+    near = _question(PHOTOSYNTHESIS.replace("the leaf?", "the leaf ?"))
+    distinct = _question("In what year did the French Revolution begin with the storming of the Bastille?", "B")
+    assert bank.add_questions([near, distinct], subject="Biology") == (1, 1)
+    assert bank.find_near_duplicates(near)
+    assert bank.stats()["duplicates"] == 1
+    assert bank.count(subject=" biology ") == 2
+
+
+def test_malformed_questions_are_ignored():
+    bank = QuestionBank()
+    assert bank.add_questions([{"question_text": "no answer"}, "not a dict"]) == (0, 0)
+
+
+def test_assemble_quiz_filters_by_source_and_prefers_least_used(tmp_path):
+    bank = QuestionBank(path=str(tmp_path / "bank.sqlite3"))
+    doc = source_hash("some document")
+    bank.add_questions([_question(f"Question number {n} about topic {n * 7} in chapter {n}?") for n in range(3)],
+                       subject="History", source_hash=doc)
+    bank.add_questions([_question("An unrelated question from another source document entirely?")],
+                       subject="History", source_hash=source_hash("other"))
+    assert bank.assemble_quiz(4, source_hash=doc) is None
+    first = bank.assemble_quiz(2, source_hash=doc)
+    second = bank.assemble_quiz(1, source_hash=doc)
+    assert len(first) == 2 and len(second) == 1
+    # The one question not used yet comes first.
+    assert second[0]["id"] not in {q["id"] for q in first}
+    assert bank.subjects() == [("history", 4)]
@@ -0,0 +1,41 @@
+from fixtures import sample_paragraph
+
+import tutor_core
+
+
+def _question(text, options, answer):
+    return {"question_text": text, "options": options, "correct_answer": answer}
+
+
+ORGANELLES = ["A) Mitochondria", "B) Ribosome", "C) Nucleus", "D) Vacuole"]
+
+
+def test_one_word_apart_with_different_answers_are_kept():
+    energy = _question("Which of these organelles is responsible for producing energy in a plant cell?",
+                       ORGANELLES, "A) Mitochondria")
+    proteins = _question("Which of these organelles is responsible for producing proteins in a plant cell?",
+                         ORGANELLES, "B) Ribosome")
+    assert tutor_core.deduplicate_questions([energy, proteins]) == [energy, proteins]
+
+
+def test_same_question_with_shuffled_options_is_dropped():
+    first = _question("What produces energy in a plant cell?", ORGANELLES, "A) Mitochondria")
+    shuffled = _question("What produces energy in a plant cell ?",
+                         ["A) Vacuole", "B) Nucleus", "C) Mitochondria", "D) Ribosome"], "C) Mitochondria")
+    assert tutor_core.deduplicate_questions([first, shuffled]) == [first]
+
+
+def test_document_quiz_returns_requested_count(stub):
+    notices = []
+    questions = tutor_core.generate_quiz_from_document(sample_paragraph(10), 5, notices=notices)
+    assert len(questions) == 5
+    assert notices == []
+
+
+def test_short_document_quiz_is_reported(monkeypatch):
+    same = _question("What produces energy in a plant cell?", ORGANELLES, "A) Mitochondria")
+    monkeypatch.setattr(tutor_core, "generate_quiz_single_call", lambda *args, **kwargs: [dict(same)])
+    notices = []
+    questions = tutor_core.generate_quiz_from_document(sample_paragraph(10), 5, notices=notices)
+    assert len(questions) == 1
+    assert any("Only 1 of 5" in notice.message for notice in notices)
@@ -0,0 +1,69 @@
+from quiz_parser import QuizStreamParser, is_question_line, may_start_question_line, parse_quiz_json, parse_quiz_text
+
+QUIZ = """Q1: What do plants make?
+A) Sugar
+B) Salt
+C) Iron
+D) Sand
+ANSWER: A
+
+**Q2:** Where does photosynthesis happen?
+A) Roots
+B) Chloroplasts
+C) Bark
+D) Seeds
+**ANSWER:** B
+"""
+
+
+def test_parses_the_prompted_format():
+    questions, dropped = parse_quiz_text(QUIZ)
+    assert dropped == 0
+    assert [q["question_text"] for q in questions] == ["What do plants make?", "Where does photosynthesis happen?"]
+    assert questions[1]["correct_answer"] == "B) Chloroplasts"
+
+
+def test_numbered_lines_inside_a_stem_do_not_start_a_question():
+    text = (
+        "Q1: Compute the total by following these steps:\n1. add the numbers\n2. check the result\n"
+        "A) 1\nB) 2\nC) 3\nD) 4\nANSWER: C\n\n"
+        "Q2: What comes next?\nA) x\nB) y\nC) z\nD) w\nANSWER: D\n"
+    )
+    questions, dropped = parse_quiz_text(text)
+    assert dropped == 0 and len(questions) == 2
+    assert questions[0]["question_text"] == ("Compute the total by following these steps: "
+                                             "1. add the numbers 2. check the result")
+
+
+def test_bare_numbers_still_start_questions_between_questions():
+    text = "1. First?\nA) a\nB) b\nC) c\nD) d\nANSWER: A\n2) Second?\nA) a\nB) b\nC) c\nD) d\nANSWER: B\n"
+    questions, _ = parse_quiz_text(text)
+    assert [q["question_text"] for q in questions] == ["First?", "Second?"]
+
+
+def test_malformed_question_is_dropped_alone():
+    text = "Q1: Missing D?\nA) a\nB) b\nC) c\nANSWER: A\n" + QUIZ.split("\n\n")[1]
+    questions, dropped = parse_quiz_text(text)
+    assert dropped == 1 and len(questions) == 1
+
+
+def test_stream_yields_each_question_when_its_answer_arrives():
+    parser = QuizStreamParser()
+    completed = []
+    for i in range(0, len(QUIZ), 7):
+        completed.append(len(parser.feed(QUIZ[i:i + 7])))
+    assert sum(completed) + len(parser.close()) == 2
+    assert completed.index(1) < len(completed) - 1  # The first question came before the stream ended.
+
+
+def test_json_items_are_validated_one_by_one():
+    raw = '```json\n{"questions": [{"question": "Q?", "options": ["a", "b", "c", "d"], "answer": "c"},' \
+          ' {"question": "Bad", "options": ["a", "a", "b", "c"], "answer": "A"}]}\n```'
+    valid, invalid = parse_quiz_json(raw)
+    assert invalid == 1 and valid[0]["correct_answer"] == "C) c"
+
+
+def test_question_line_prefixes():
+    assert all(may_start_question_line(p) for p in ["", "  ", "Q", "**Quest", "Question 1", "Q1: Which"])
+    assert not any(may_start_question_line(p) for p in ["Quite", "Plants", "Q1 is"])
+    assert is_question_line("**Q2.** Which one?") and not is_question_line("Quiz time")
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import openai
+import pytest
+
+import api_service
+from rate_limiting import FairScheduler, TokenBucket
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    bucket = TokenBucket(rate=20, burst=3)
+    started = time.monotonic()
+    for _ in range(4):
+        assert bucket.acquire()
+    assert time.monotonic() - started >= 0.04  # The 4th token waits ~1/20 s.
+    empty = TokenBucket(rate=0.1, burst=1)
+    empty.acquire()
+    assert empty.acquire(timeout=0.01) is False
+
+
+def test_interactive_callers_are_admitted_ahead_of_batch():
+    scheduler = FairScheduler(max_concurrent=1, weights={"interactive": 3, "batch": 1})
+    scheduler.acquire("interactive")
+    order, threads = [], []
+
+    def worker(lane):
+        scheduler.acquire(lane)
+        order.append(lane)
+        scheduler.release()
+
+    for lane in ["batch", "batch"] + ["interactive"] * 4:
+        thread = threading.Thread(target=worker, args=(lane,))
+        thread.start()
+        threads.append(thread)
+        while sum(scheduler.snapshot()["queued"].values()) < len(threads):
+            time.sleep(0.001)
+    scheduler.release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "interactive", "batch", "interactive", "interactive", "batch"]
+    assert scheduler.snapshot()["active"] == 0
+
+
+def test_slot_times_out():
+    scheduler = FairScheduler(max_concurrent=1)
+    scheduler.acquire()
+    with pytest.raises(TimeoutError):
+        with scheduler.slot(timeout=0.01):
+            pass
+
+
+class _Response:
+    """Just enough of an HTTP response for openai's error classes."""
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+        self.request = None
+
+
+def _rate_limited(retry_after="0"):
+    return openai.RateLimitError("busy", response=_Response(429, {"retry-after": retry_after}), body=None)
+
+
+def test_retry_after_header_is_honoured():
+    assert api_service._retry_after_seconds(_rate_limited("2.5")) == 2.5
+    assert api_service._backoff_delay(0, _rate_limited("1000")) == api_service.API_BACKOFF_CAP_SECONDS
+
+
+def test_rate_limited_requests_are_retried_then_reported(monkeypatch):
+    calls = []
+
+    class FakeCompletions:
+        def create(self, **request):
+            calls.append(request)
+            raise _rate_limited()
+
+    class FakeClient:
+        chat = type("Chat", (), {"completions": FakeCompletions()})()
+
+    monkeypatch.setattr(api_service, "get_client", lambda: FakeClient())
+    monkeypatch.setattr(api_service, "API_MAX_RETRIES", 2)
+    with pytest.raises(api_service.ApiBusyError):
+        api_service._send_with_retries("interactive", model="m", messages=[])
+    assert len(calls) == 3
+    assert api_service.scheduler.snapshot()["active"] == 0  # Every attempt gave its slot back.
@@ -0,0 +1,30 @@
+from retrieval_index import BM25Index, get_index, tokenize
+
+PASSAGES = [
+    "Mitochondria produce energy for the cell through respiration.",
+    "Ribosomes build proteins from amino acids.",
+    "Chloroplasts capture light for photosynthesis in plant cells.",
+    "The nucleus stores the cell's genetic material.",
+]
+
+
+def test_tokenize_drops_stopwords():
+    assert tokenize("What is the role of the Nucleus?") == ["role", "nucleus"]
+
+
+def test_best_matching_passage_ranks_first():
+    index = BM25Index(PASSAGES)
+    hits = index.search("which organelle builds proteins", k=2)
+    assert hits[0][0] == 1
+    assert all(score > 0 for _, score in hits)
+
+
+def test_top_passages_are_in_document_order_with_fallback():
+    index = BM25Index(PASSAGES)
+    assert index.top_passages("light and genetic material", k=2) == [PASSAGES[2], PASSAGES[3]]
+    assert index.top_passages("zebra", k=2) == PASSAGES[:2]  # Nothing matches: the start of the text.
+
+
+def test_index_is_built_once_per_text():
+    text = "\n\n".join(PASSAGES * 20)
+    assert get_index(text) is get_index(text)
@@ -0,0 +1,92 @@
+import time
+
+import api_service
+
+
+def _wait_for(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_route_for_uses_feature_then_default(monkeypatch):
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {
+        "chat": {"model": "fast", "hedge_model": "backup"},
+        "default": {"model": "general"},
+    })
+    assert api_service.route_for("chat") == ("fast", "backup")
+    assert api_service.route_for("quiz") == ("general", None)
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {})
+    assert api_service.route_for("quiz") == (api_service.DEFAULT_MODEL, None)
+
+
+def test_slow_primary_loses_to_the_hedge(stub, monkeypatch):
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {"hedge_test": {"model": "slow", "hedge_model": "quick"}})
+    monkeypatch.setattr(api_service, "HEDGE_DEFAULT_DELAY_SECONDS", 0.1)
+    monkeypatch.setattr(api_service, "HEDGE_MAX_RATIO", 1.0)
+    monkeypatch.setitem(stub.config, "model_latency", {"slow": 2.0, "quick": 0.0})
+    before = api_service.get_routing_stats()
+
+    started = time.perf_counter()
+    reply = "".join(api_service.call_openrouter_api("Hedging test prompt", stream=True, feature="hedge_test"))
+    elapsed = time.perf_counter() - started
+
+    after = api_service.get_routing_stats()
+    assert reply
+    assert elapsed < 1.5
+    assert after["hedged"] - before["hedged"] == 1
+    assert after["hedge_wins"] - before["hedge_wins"] == 1
+    # The losing attempt gives its scheduler slot back once its request returns,
+    # and its tokens are recorded as a hedge_loser call.
+    assert _wait_for(lambda: api_service.scheduler.snapshot()["active"] == 0)
+    assert _wait_for(lambda: any(call["feature"] == "hedge_loser" and call["model"] == "slow"
+                                 for call in api_service.get_recent_call_timings()))
+    loser = [call for call in api_service.get_recent_call_timings() if call["feature"] == "hedge_loser"][-1]
+    assert loser["prompt_tokens"] > 0
+
+
+def test_empty_reply_is_returned_without_waiting_for_the_hedge(stub, monkeypatch):
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {"hedge_test": {"model": "slow", "hedge_model": "quick"}})
+    monkeypatch.setattr(api_service, "HEDGE_DEFAULT_DELAY_SECONDS", 2.0)
+    monkeypatch.setattr(api_service, "HEDGE_MAX_RATIO", 1.0)
+    monkeypatch.setitem(stub.config, "reply_words", 0)
+    before = api_service.get_routing_stats()["hedged"]
+    started = time.perf_counter()
+    assert "".join(api_service.call_openrouter_api("Empty hedged prompt", stream=True, feature="hedge_test")) == ""
+    assert time.perf_counter() - started < 1.0
+    assert api_service.get_routing_stats()["hedged"] == before
+
+
+def test_attempt_no_longer_wanted_is_not_sent(stub):
+    before = stub.stats["requests"]
+    response, retries = api_service._send_with_retries(
+        "interactive", still_wanted=lambda: False, model="stub", messages=[{"role": "user", "content": "x"}]
+    )
+    assert (response, retries) == (None, 0)
+    assert stub.stats["requests"] == before
+    assert api_service.scheduler.snapshot()["active"] == 0
+
+
+def test_non_interactive_lane_is_not_hedged(stub, monkeypatch):
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {"hedge_test": {"model": "slow", "hedge_model": "quick"}})
+    monkeypatch.setattr(api_service, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    monkeypatch.setattr(api_service, "HEDGE_MAX_RATIO", 1.0)
+    monkeypatch.setitem(stub.config, "model_latency", {"slow": 0.2})
+    before = api_service.get_routing_stats()["hedged"]
+    assert api_service.call_openrouter_api("Batch lane prompt", lane="batch", feature="hedge_test")
+    assert api_service.get_routing_stats()["hedged"] == before
+
+
+def test_combined_features_use_their_parent_route(monkeypatch):
+    monkeypatch.setattr(api_service, "MODEL_ROUTES", {
+        "simplify": {"model": "explainer"},
+        "quiz": {"model": "quizzer"},
+        "quiz_structured": {"model": "json-model"},
+        "default": {"model": "general"},
+    })
+    assert api_service.route_for("explain_quiz").model == "explainer"
+    assert api_service.route_for("quiz_structured").model == "json-model"  # Its own route wins.
+    assert api_service.route_for("chat_summary").model == "general"
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+
+import api_service
+from single_flight import Flight, SingleFlight
+
+
+def test_concurrent_callers_share_one_producer():
+    single = SingleFlight(ThreadPoolExecutor(max_workers=2))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def produce(flight):
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        flight.publish("hello ")
+        flight.publish("world")
+
+    first, leader = single.join("k", produce)
+    assert leader and started.wait(5)
+    second, follower_leads = single.join("k", produce)
+    assert second is first and not follower_leads
+    release.set()
+    assert first.result(timeout=5) == "hello world"
+    assert second.result(timeout=5) == "hello world"
+    assert len(calls) == 1
+    assert single.stats == {"flights": 1, "coalesced": 1}
+    assert single.in_flight() == 0 and first.abandoned
+
+
+def test_producer_error_reaches_every_subscriber():
+    single = SingleFlight(ThreadPoolExecutor(max_workers=1))
+
+    def produce(flight):
+        flight.publish("partial")
+        raise RuntimeError("upstream failed")
+
+    flight, _ = single.join("k", produce)
+    with pytest.raises(RuntimeError, match="upstream failed"):
+        flight.result(timeout=5)
+
+
+def test_timeout_and_cancel_only_drop_that_subscriber():
+    flight = Flight()
+    flight.subscribers = 2
+    with pytest.raises(TimeoutError):
+        flight.result(timeout=0.05)
+    cancel = threading.Event()
+    cancel.set()
+    with pytest.raises(CancelledError):
+        flight.result(cancel=cancel)
+    assert flight.abandoned and not flight.done
+
+
+def test_abandoned_flight_is_cancelled_and_never_joined():
+    single = SingleFlight(ThreadPoolExecutor(max_workers=2))
+    stopped, resume = threading.Event(), threading.Event()
+
+    def produce(flight):
+        flight.publish("partial")
+        while not flight.abandoned:
+            time.sleep(0.01)
+        stopped.set()
+        resume.wait(5)  # Widens the gap between stopping and the flight being unregistered.
+
+    first, _ = single.join("k", produce)
+    reader = first.iter_chunks(timeout=5)
+    assert next(reader) == "partial"
+    reader.close()  # The only subscriber leaves.
+    assert stopped.wait(5)
+    second, leader = single.join("k", lambda flight: flight.publish("full reply"))
+    assert leader and second is not first
+    resume.set()
+    assert second.result(timeout=5) == "full reply"
+    with first._cond:
+        first._cond.wait_for(lambda: first.done, 5)
+    assert isinstance(first.error, CancelledError)
+    assert single.in_flight() == 0
+
+
+def test_identical_api_calls_are_coalesced_into_one_request(stub):
+    stub.config.update(latency=0.3)
+    before_requests = stub.stats["requests"]
+    before_coalesced = api_service.in_flight.stats["coalesced"]
+    prompt = "Coalescing test prompt"
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        replies = list(pool.map(lambda _: api_service.call_openrouter_api(prompt), range(4)))
+    assert len(set(replies)) == 1 and replies[0]
+    assert stub.stats["requests"] - before_requests == 1
+    assert api_service.in_flight.stats["coalesced"] - before_coalesced == 3
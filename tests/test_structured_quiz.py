@@ -0,0 +1,31 @@
+import json
+
+import tutor_core
+
+
+def _reply(start, count):
+    return json.dumps({"questions": [
+        {"question": f"Which organelle handles task {i}?", "options": [f"Organelle {i}{s}" for s in "abcd"], "answer": "A"}
+        for i in range(start, start + count)
+    ]})
+
+
+def test_short_round_is_topped_up_to_the_exact_count(monkeypatch):
+    replies = iter([_reply(1, 2), _reply(3, 3)])
+    prompts = []
+    monkeypatch.setattr(tutor_core, "call_openrouter_api", lambda prompt, **kwargs: prompts.append(prompt) or next(replies))
+    before = tutor_core.get_quiz_generation_metrics()
+
+    questions, stats = tutor_core.generate_quiz_structured("Cells have organelles.", 5)
+
+    assert len(questions) == 5 and stats["round_trips"] == 2
+    assert "Generate exactly 3 multiple-choice" in prompts[1]  # Only the missing count.
+    assert "Which organelle handles task 1?" in prompts[1]     # Accepted questions are excluded.
+    after = tutor_core.get_quiz_generation_metrics()
+    assert after["quizzes"] == before["quizzes"] + 1
+    assert after["round_trips"] == before["round_trips"] + 2
+
+
+def test_stub_quiz_reaches_the_exact_count(stub):
+    questions, stats = tutor_core.generate_quiz_structured("Plants make sugar. " * 200, 5)
+    assert len(questions) == 5 and stats["accepted"] == 5
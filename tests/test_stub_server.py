@@ -0,0 +1,23 @@
+from quiz_parser import parse_quiz_json, parse_quiz_text
+from stub_server import canned_reply
+
+import tutor_core
+
+
+def test_quiz_prompts_get_parseable_quizzes():
+    questions, dropped = parse_quiz_text(canned_reply(tutor_core.build_quiz_prompt("Cells.", 4)))
+    assert len(questions) == 4 and dropped == 0
+    valid, invalid = parse_quiz_json(canned_reply(tutor_core.build_json_quiz_prompt("Cells.", 3)))
+    assert len(valid) == 3 and invalid == 0
+
+
+def test_other_prompts_get_filler_of_the_requested_length():
+    assert len(canned_reply("Explain osmosis.", reply_words=40).split()) == 40
+
+
+def test_server_counts_requests(stub):
+    import api_service
+
+    before = stub.stats["requests"]
+    "".join(api_service.call_openrouter_api("Stub stream check.", stream=True, bypass_cache=True))
+    assert stub.stats["requests"] == before + 1 and stub.stats["streamed"] >= 1
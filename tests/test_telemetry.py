@@ -0,0 +1,48 @@
+import socket
+import urllib.request
+
+import api_service
+import telemetry as telemetry_module
+from telemetry import Telemetry, telemetry
+
+
+def test_percentiles_and_prometheus_export():
+    t = Telemetry()
+    for seconds in (0.1, 0.2, 0.3, 0.4, 1.0):
+        t.record_call("quiz", "m", False, True, seconds, seconds / 2, 10, 5)
+    t.record_call("quiz", "m", True, True, 0.001, 0.001)
+    assert t.latency_percentile("llm_call_seconds", "quiz", 50) == 0.3  # Cache hits are not timed.
+    assert t.latency_percentile("llm_call_seconds", "quiz", 50, min_samples=6) is None
+    exported = t.to_prometheus()
+    assert 'edututor_llm_calls_total{feature="quiz",cache="hit"} 1.0' in exported
+    assert 'edututor_llm_prompt_tokens_total{feature="quiz",model="m"} 50.0' in exported
+
+
+def test_counters_export_their_own_label_name():
+    t = Telemetry()
+    t.increment("llm_routed_calls_total", "quiz", "m")
+    t.increment("structured_quizzes_total", "quiz_structured", "batch", label_name="lane")
+    exported = t.to_prometheus()
+    assert 'edututor_llm_routed_calls_total{feature="quiz",model="m"} 1.0' in exported
+    assert 'edututor_structured_quizzes_total{feature="quiz_structured",lane="batch"} 1.0' in exported
+
+
+def test_only_streamed_calls_feed_time_to_first_token(stub):
+    api_service.call_openrouter_api("Say hello (plain).", feature="ttft_plain", bypass_cache=True)
+    assert telemetry.recent()[-1]["ttft_seconds"] is None
+    assert telemetry.latency_percentile("llm_ttft_seconds", "ttft_plain", 50) is None
+    assert telemetry.latency_percentile("llm_call_seconds", "ttft_plain", 50) is not None
+
+    "".join(api_service.call_openrouter_api("Say hello (streamed).", stream=True, feature="ttft_stream", bypass_cache=True))
+    assert telemetry.recent()[-1]["ttft_seconds"] is not None
+    assert telemetry.latency_percentile("llm_ttft_seconds", "ttft_stream", 50) is not None
+
+
+def test_metrics_server_listens_on_localhost_by_default():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    assert telemetry_module.start_metrics_server(port) == port
+    assert telemetry_module._server.server_address[0] == "127.0.0.1"
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics") as response:
+        assert response.status == 200
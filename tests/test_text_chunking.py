@@ -0,0 +1,28 @@
+from text_chunking import CHARS_PER_TOKEN, estimate_tokens, pick_evenly, split_into_sections
+
+
+def test_estimate_rounds_up():
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("abc") == 1
+    assert estimate_tokens("a" * (CHARS_PER_TOKEN * 10 + 1)) == 11
+
+
+def test_sections_respect_the_budget_and_keep_all_text():
+    paragraphs = [f"Paragraph {i}. " + "Some sentence here. " * (i % 7 + 1) for i in range(40)]
+    text = "\n\n".join(paragraphs)
+    sections = split_into_sections(text, max_tokens=100)
+    assert all(estimate_tokens(section) <= 100 for section in sections)
+    assert "".join(sections).replace("\n", "").replace(" ", "") == text.replace("\n", "").replace(" ", "")
+
+
+def test_oversized_paragraph_is_split_on_sentences():
+    paragraph = " ".join(f"Sentence number {i} ends here." for i in range(100))
+    sections = split_into_sections(paragraph, max_tokens=50)
+    assert len(sections) > 1
+    assert all(section.endswith(".") for section in sections)
+
+
+def test_pick_evenly_keeps_order_and_ends():
+    assert pick_evenly(list(range(10)), 3) == [0, 4, 9]
+    assert pick_evenly([1, 2], 5) == [1, 2]
+    assert pick_evenly([1, 2, 3], 0) == []
@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fixtures import make_docx_bytes, make_pdf_bytes
+
+import text_extraction
+from text_extraction import iter_docx_blocks, iter_pdf_pages, join_chunks
+
+
+def test_parallel_pdf_extraction_matches_sequential_in_page_order():
+    pdf = make_pdf_bytes(30)  # Above PDF_PARALLEL_MIN_PAGES, so ranges run on the process pool.
+    sequential = list(iter_pdf_pages(pdf, parallel=False))
+    parallel = list(iter_pdf_pages(pdf))
+    assert [chunk.index for chunk in parallel] == list(range(1, 31))
+    assert [chunk.text for chunk in parallel] == [chunk.text for chunk in sequential]
+    assert parallel[29].text.startswith("Page 30 line 1:")
+
+
+def test_pdf_limits_stop_early():
+    pdf = make_pdf_bytes(10)
+    assert len(list(iter_pdf_pages(pdf, max_pages=3))) == 3
+    text = join_chunks(iter_pdf_pages(pdf, max_chars=500))
+    assert len(text) <= 500
+
+
+def test_docx_includes_paragraphs_and_tables():
+    chunks = list(iter_docx_blocks(make_docx_bytes(10)))
+    text = join_chunks(chunks)
+    assert text.startswith("Page 1 line 1:")
+    assert "r0c0" in text and "r2c2" in text  # The table after page 10.
+
+
+def test_concurrent_callers_share_one_process_pool(monkeypatch):
+    created = []
+
+    class SlowPool:
+        def __init__(self, **kwargs):
+            time.sleep(0.05)  # Wide window for a second caller to slip in.
+            created.append(self)
+
+    monkeypatch.setattr(text_extraction, "_process_pool", None)
+    monkeypatch.setattr(text_extraction, "ProcessPoolExecutor", SlowPool)
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        pools = list(pool.map(lambda _: text_extraction._get_process_pool(), range(4)))
+    assert len(created) == 1 and all(p is created[0] for p in pools)
@@ -0,0 +1,49 @@
+import time
+
+from tiered_cache import TieredCache, make_cache_key
+
+
+def test_key_is_stable_and_order_independent_for_dicts():
+    assert make_cache_key("p", {"a": 1, "b": 2}) == make_cache_key("p", {"b": 2, "a": 1})
+    assert make_cache_key("p", "m1") != make_cache_key("p", "m2")
+
+
+def test_memory_lru_evicts_oldest_and_disk_still_hits(tmp_path):
+    cache = TieredCache(str(tmp_path / "cache.sqlite3"), max_memory_items=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "a" is now the most recent.
+    cache.set("c", "3")           # Evicts "b" from memory only.
+    assert set(cache._memory) == {"a", "c"}
+    assert cache.get("b") == "2"
+    stats = cache.stats()
+    assert (stats["memory_hits"], stats["disk_hits"], stats["memory_evictions"]) == (1, 1, 2)
+
+
+def test_disk_survives_restart_and_is_trimmed_lru(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = TieredCache(path, max_disk_bytes=10)
+    cache.set("old", "xxxxx")
+    cache.set("new", "yyyyy")
+    cache.set("newest", "zzzzz")  # 15 bytes > 10: the least recently used entry goes.
+    reopened = TieredCache(path)
+    assert reopened.get("old") is None
+    assert reopened.get("newest") == "zzzzz"
+
+
+def test_entries_expire(tmp_path):
+    cache = TieredCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=0.05)
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_repeated_prompt_is_served_from_the_response_cache(stub):
+    import api_service
+
+    before = stub.stats["requests"]
+    first = api_service.call_openrouter_api("Cache me: what is osmosis?", feature="cache_test")
+    assert api_service.call_openrouter_api("Cache me: what is osmosis?  \r\n", feature="cache_test") == first
+    assert stub.stats["requests"] == before + 1  # Trailing whitespace and line endings share the entry.
@@ -0,0 +1,75 @@
+import re
+
+# Rough chars-per-token ratio for English text with Llama/GPT style tokenizers.
+# Good enough for budgeting prompts without shipping a tokenizer.
+CHARS_PER_TOKEN = 4
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local estimate of how many tokens `text` costs in a prompt."""
+    if not text:
+        return 0
+    return max(1, -(-len(text) // CHARS_PER_TOKEN))
+
+
+def _split_oversized(piece: str, max_tokens: int) -> list:
+    """Breaks one paragraph that is over budget into sentence groups, then hard slices."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    parts, current = [], ""
+    for sentence in _SENTENCE_END.split(piece):
+        while len(sentence) > max_chars:
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(sentence[:max_chars])
+            sentence = sentence[max_chars:]
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            parts.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        parts.append(current)
+    return parts
+
+
+def split_into_sections(text: str, max_tokens: int = 1500) -> list:
+    """Splits `text` into consecutive sections of at most `max_tokens` (estimated) each.
+
+    Paragraph boundaries are kept where possible; paragraphs that are too long on
+    their own are split on sentence boundaries.
+    """
+    if not text or not text.strip():
+        return []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    sections, current = [], []
+    current_len = 0
+    for paragraph in _PARAGRAPH_BREAK.split(text.strip()):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        pieces = [paragraph] if len(paragraph) <= max_chars else _split_oversized(paragraph, max_tokens)
+        for piece in pieces:
+            if current and current_len + 2 + len(piece) > max_chars:
+                sections.append("\n\n".join(current))
+                current, current_len = [], 0
+            current.append(piece)
+            current_len += len(piece) + 2
+    if current:
+        sections.append("\n\n".join(current))
+    return sections
+
+
+def pick_evenly(items: list, count: int) -> list:
+    """Returns `count` items spread evenly from start to end of `items`, in order."""
+    if count >= len(items):
+        return list(items)
+    if count <= 0:
+        return []
+    if count == 1:
+        return [items[len(items) // 2]]
+    step = (len(items) - 1) / (count - 1)
+    return [items[round(i * step)] for i in range(count)]
@@ -0,0 +1,234 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# pdfplumber and python-docx are imported inside the extractors: they are slow to
+# import and most page loads (role selection, chat) never parse a file.
+from tiered_cache import TieredCache, make_cache_key
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# PDFs shorter than this are extracted in-process; the pool start-up would cost more.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# One extracted unit of a document: a PDF page or a DOCX paragraph/table.
+# `index` is 1-based and `total` is the number of units that will be produced.
+ExtractedChunk = namedtuple("ExtractedChunk", ["index", "total", "text"])
+
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        with _process_pool_lock:
+            if _process_pool is None:
+                # "spawn" avoids forking a multi-threaded Streamlit server.
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=EXTRACTION_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+    return _process_pool
+
+
+def _as_bytes(source) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+def _extract_pdf_page_range(pdf_path, start, stop):
+    """Worker: extracts pages [start, stop) of the PDF at `pdf_path`."""
+    import pdfplumber
+
+    texts = []
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in range(start, stop):
+            page = pdf.pages[i]
+            texts.append(page.extract_text() or "")
+            page.close()  # Drop pdfplumber's per-page object cache.
+    return texts
+
+
+class _CharBudget:
+    """Tracks an optional character limit across yielded chunks."""
+
+    def __init__(self, max_chars):
+        self.remaining = max_chars
+
+    def take(self, text):
+        if self.remaining is None:
+            return text
+        text = text[:self.remaining]
+        self.remaining -= len(text)
+        return text
+
+    @property
+    def exhausted(self):
+        return self.remaining is not None and self.remaining <= 0
+
+
+def iter_pdf_pages(source, max_pages=None, max_chars=None, parallel=True):
+    """Yields an ExtractedChunk per PDF page, in page order, as soon as each is ready.
+
+    Large PDFs are split into page ranges that run on a process pool; results still
+    come out in order so the caller can show progress and start downstream work
+    early. Stops after `max_pages` pages or `max_chars` characters.
+    """
+    import pdfplumber
+
+    pdf_bytes = _as_bytes(source)
+    budget = _CharBudget(max_chars)
+    with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
+        total = len(pdf.pages) if max_pages is None else min(max_pages, len(pdf.pages))
+        if not parallel or total < PDF_PARALLEL_MIN_PAGES or EXTRACTION_WORKERS < 2:
+            for i in range(total):
+                page = pdf.pages[i]
+                text = budget.take(page.extract_text() or "")
+                page.close()
+                yield ExtractedChunk(i + 1, total, text)
+                if budget.exhausted:
+                    return
+            return
+
+    # Workers read the PDF from a temp file rather than each receiving a pickled copy.
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as tmp:
+        tmp.write(pdf_bytes)
+    pool = _get_process_pool()
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, total)) for s in range(0, total, PDF_PAGES_PER_TASK)]
+    window = EXTRACTION_WORKERS * 2  # Bounded look-ahead so an early exit wastes little work.
+    pending = []
+    try:
+        next_range = 0
+        while next_range < len(ranges) or pending:
+            while next_range < len(ranges) and len(pending) < window:
+                start, stop = ranges[next_range]
+                pending.append((start, pool.submit(_extract_pdf_page_range, pdf_path, start, stop)))
+                next_range += 1
+            start, future = pending.pop(0)
+            for offset, text in enumerate(future.result()):
+                yield ExtractedChunk(start + offset + 1, total, budget.take(text))
+                if budget.exhausted:
+                    return
+    finally:
+        for _, future in pending:
+            future.cancel()
+        for _, future in pending:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        os.remove(pdf_path)
+
+
+def _table_text(table) -> str:
+    """Renders a DOCX table as one line per row, cells separated by ' | '."""
+    lines = []
+    for row in table.rows:
+        cells, seen = [], set()
+        for cell in row.cells:
+            if id(cell._tc) in seen:  # Merged cells repeat the same element.
+                continue
+            seen.add(id(cell._tc))
+            cells.append(cell.text.strip())
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return "\n".join(lines)
+
+
+def _iter_docx_blocks(doc):
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    if hasattr(doc, "iter_inner_content"):
+        yield from doc.iter_inner_content()
+        return
+    for child in doc.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            yield Paragraph(child, doc)
+        elif tag == "tbl":
+            yield Table(child, doc)
+
+
+def iter_docx_blocks(source, max_blocks=None, max_chars=None):
+    """Yields an ExtractedChunk per DOCX paragraph or table, in document order."""
+    from docx import Document
+    from docx.table import Table
+
+    doc = Document(io.BytesIO(_as_bytes(source)))
+    blocks = list(_iter_docx_blocks(doc))
+    total = len(blocks) if max_blocks is None else min(max_blocks, len(blocks))
+    budget = _CharBudget(max_chars)
+    for i, block in enumerate(blocks[:total]):
+        text = _table_text(block) if isinstance(block, Table) else block.text
+        yield ExtractedChunk(i + 1, total, budget.take(text))
+        if budget.exhausted:
+            return
+
+
+def iter_document_chunks(source, file_type, max_units=None, max_chars=None):
+    """Dispatches to the PDF or DOCX extractor by MIME type."""
+    if file_type == PDF_MIME:
+        return iter_pdf_pages(source, max_pages=max_units, max_chars=max_chars)
+    if file_type == DOCX_MIME:
+        return iter_docx_blocks(source, max_blocks=max_units, max_chars=max_chars)
+    raise ValueError(f"Unsupported file type: {file_type}")
+
+
+def join_chunks(chunks):
+    """Joins extracted chunks with newlines in one pass; returns None if nothing was extracted."""
+    text = "\n".join(chunk.text for chunk in chunks if chunk.text).strip()
+    return text or None
+
+
+# --- EXTRACTION CACHE ---
+# Bump when extraction output changes so stale cached text is not served.
+EXTRACTION_VERSION = 1
+
+# Shared by every session in the process and persisted across restarts, so a
+# handout uploaded by a whole class is parsed once.
+extraction_cache = TieredCache(
+    path=None if os.getenv("EXTRACTION_CACHE_DISABLED") else os.getenv("EXTRACTION_CACHE_PATH", ".cache/extractions.sqlite3"),
+    max_memory_items=int(os.getenv("EXTRACTION_CACHE_MEMORY_ITEMS", "64")),
+    max_memory_bytes=int(os.getenv("EXTRACTION_CACHE_MEMORY_MB", "64")) * 1024 * 1024,
+    max_disk_bytes=int(os.getenv("EXTRACTION_CACHE_MAX_MB", "512")) * 1024 * 1024,
+)
+
+
+def extraction_cache_key(file_bytes: bytes, file_type: str) -> str:
+    return make_cache_key("extract", EXTRACTION_VERSION, file_type, hashlib.sha256(file_bytes).hexdigest())
+
+
+def extract_document_text(file_bytes: bytes, file_type: str, on_progress=None):
+    """Full-document extraction, served from the content-hash cache when possible.
+
+    Returns `(text, cache_hit)`; text is None if nothing could be extracted (such
+    results are not cached, so a retry re-parses). `on_progress(done, total)` is only
+    called when the document is actually parsed.
+    """
+    key = extraction_cache_key(file_bytes, file_type)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return cached, True
+    chunks = []
+    for chunk in iter_document_chunks(file_bytes, file_type):
+        chunks.append(chunk)
+        if on_progress:
+            on_progress(chunk.index, chunk.total)
+    text = join_chunks(chunks)
+    if text:
+        extraction_cache.set(key, text)
+    return text, False
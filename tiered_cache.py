@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_cache_key(*parts) -> str:
+    """Builds a stable content hash from any JSON-serialisable parts."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TieredCache:
+    """String cache with an in-memory LRU tier in front of an on-disk SQLite tier.
+
+    Entries expire after `ttl_seconds` (None = never). The memory tier holds at most
+    `max_memory_items` entries (and, if set, `max_memory_bytes` of values); the disk tier is trimmed least-recently-used first
+    once its values exceed `max_disk_bytes`. Pass `path=None` for a memory-only cache.
+    Safe to share between Streamlit sessions (threads) in one process.
+    """
+
+    def __init__(self, path=None, max_memory_items=256, max_disk_bytes=256 * 1024 * 1024, ttl_seconds=None,
+                 max_memory_bytes=None):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()  # key -> (value, expires_at, size)
+        self._memory_bytes = 0
+        self._lock = threading.RLock()
+        self._stats = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0,
+            "expirations": 0,
+        }
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            self._open_db(path)
+
+    # --- DISK TIER ---
+    def _open_db(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " expires_at REAL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_entries_expires_at ON entries(expires_at)")
+        self._purge_expired_on_disk()
+        row = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+        self._disk_bytes = row[0]
+
+    def _purge_expired_on_disk(self):
+        cur = self._db.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+        )
+        self._stats["expirations"] += max(cur.rowcount, 0)
+
+    def _delete_from_disk(self, key):
+        if self._db is None:
+            return
+        row = self._db.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._disk_bytes -= row[0]
+
+    def _trim_disk(self):
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM entries ORDER BY last_access ASC").fetchall()
+        for key, size in rows:
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._disk_bytes -= size
+            self._stats["disk_evictions"] += 1
+
+    # --- MEMORY TIER ---
+    def _forget(self, key):
+        _, _, size = self._memory.pop(key)
+        self._memory_bytes -= size
+
+    def _remember(self, key, value, expires_at):
+        size = len(value.encode("utf-8"))
+        if key in self._memory:
+            self._forget(key)
+        if self.max_memory_bytes is not None and size > self.max_memory_bytes:
+            return
+        self._memory[key] = (value, expires_at, size)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_memory_items or (
+            self.max_memory_bytes is not None and self._memory_bytes > self.max_memory_bytes
+        ):
+            self._forget(next(iter(self._memory)))
+            self._stats["memory_evictions"] += 1
+
+    # --- PUBLIC API ---
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return value
+                self._forget(key)
+                self._delete_from_disk(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, size, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, size, expires_at = row
+                    if expires_at is None or expires_at > now:
+                        self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                        self._remember(key, value, expires_at)
+                        self._stats["disk_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._disk_bytes -= size
+                    self._stats["expirations"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Stores `value` in both tiers, evicting old entries if over budget."""
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with self._lock:
+            self._remember(key, value, expires_at)
+            self._stats["sets"] += 1
+            if self._db is None:
+                return
+            self._delete_from_disk(key)
+            size = len(value.encode("utf-8"))
+            if size > self.max_disk_bytes:
+                return  # Too large to ever fit; keep it in memory only.
+            self._db.execute(
+                "INSERT INTO entries (key, value, size, created_at, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, value, size, now, expires_at, now),
+            )
+            self._disk_bytes += size
+            self._trim_disk()
+
+    def clear(self):
+        """Drops every entry from both tiers (counters are kept)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries")
+                self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters plus current tier sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["hits"] = stats["memory_hits"] + stats["disk_hits"]
+            stats["evictions"] = stats["memory_evictions"] + stats["disk_evictions"] + stats["expirations"]
+            lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+            stats["memory_items"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_bytes"] = self._disk_bytes
+            return stats
@@ -0,0 +1,45 @@
+import json
+import os
+
+from text_chunking import CHARS_PER_TOKEN, estimate_tokens
+
+# Per-feature prompt budgets (estimated tokens), e.g. {"chat": 3000}. Prompts assembled
+# for a feature are fitted into its budget; features without one are left alone.
+DEFAULT_PROMPT_BUDGETS = {"chat": 3000, "chat_summary": 1500}
+PROMPT_BUDGETS = dict(DEFAULT_PROMPT_BUDGETS, **json.loads(os.getenv("PROMPT_BUDGETS_JSON", "{}")))
+
+
+def count_tokens(text: str) -> int:
+    """Local token count used for budgeting (no tokenizer download, no API call)."""
+    return estimate_tokens(text)
+
+
+def prompt_budget(feature: str):
+    """The prompt budget for `feature`, or None if it has none."""
+    return PROMPT_BUDGETS.get(feature)
+
+
+def trim_to_tokens(text: str, max_tokens: int, keep="start") -> str:
+    """`text` cut to at most `max_tokens`, on a word boundary, keeping its start or its end."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max(0, max_tokens * CHARS_PER_TOKEN - 4)
+    if keep == "end":
+        cut = text[len(text) - max_chars:]
+        space = cut.find(" ")
+        return "... " + (cut[space + 1:] if 0 <= space < len(cut) // 4 else cut)
+    cut = text[:max_chars]
+    space = cut.rfind(" ")
+    return (cut[:space] if space > len(cut) * 3 // 4 else cut) + " ..."
+
+
+def take_within(items, max_tokens, size=count_tokens):
+    """The longest prefix of `items` whose total size fits in `max_tokens`."""
+    taken, used = [], 0
+    for item in items:
+        cost = size(item)
+        if used + cost > max_tokens:
+            break
+        taken.append(item)
+        used += cost
+    return taken
@@ -0,0 +1,890 @@
+"""Streamlit-free generation, parsing and grading logic.
+
+Everything here is safe to call from worker threads, worker processes and the batch
+CLI. Instead of writing to the page, functions report soft problems by appending
+`Notice(level, message)` tuples to an optional `notices` list; the Streamlit layer
+(utils.py) renders them, the CLI stores them. Without a list they go to logging.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from api_service import call_openrouter_api, run_in_parallel, iterate_in_background
+from document_store import document_handle
+from quiz_parser import QuizStreamParser, is_question_line, may_start_question_line, parse_quiz_text, parse_quiz_json
+from text_chunking import estimate_tokens, split_into_sections, pick_evenly
+from token_budget import DEFAULT_PROMPT_BUDGETS, count_tokens, prompt_budget, take_within, trim_to_tokens
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+# level is one of "info", "warning", "error".
+Notice = namedtuple("Notice", ["level", "message"])
+
+_LOG_LEVELS = {"info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+
+
+def notify(notices, level, message):
+    """Records a notice in `notices`, or logs it when no list was supplied."""
+    if notices is not None:
+        notices.append(Notice(level, message))
+    else:
+        logger.log(_LOG_LEVELS.get(level, logging.INFO), message)
+
+
+# --- TEXT GENERATION ---
+def generate_personalized_content(topic_content, difficulty="medium", stream=False):
+    prompt = f"Rewrite the following content for a {difficulty} level student. Make it engaging and include analogies or relevant examples if possible:\n\n{topic_content}"
+    return call_openrouter_api(prompt, stream=stream, feature="personalize")
+
+
+def simplify_text_prompt(original_text):
+    return f"Please explain this text in simpler terms, suitable for a student who might be finding it difficult. Break down complex ideas and use clear language:\n\n{original_text}"
+
+
+def simplify_text(original_text, stream=False):
+    return call_openrouter_api(simplify_text_prompt(original_text), stream=stream, feature="simplify")
+
+
+# Documents up to this size are sent whole; longer ones go through the retrieval index.
+QNA_FULL_CONTEXT_TOKENS = int(os.getenv("QNA_FULL_CONTEXT_TOKENS", "1500"))
+QNA_TOP_K = int(os.getenv("QNA_TOP_K", "4"))
+
+
+def build_qna_index(context_text):
+    """Indexes a long document once so follow-up questions only send relevant passages."""
+    if estimate_tokens(context_text) > QNA_FULL_CONTEXT_TOKENS:
+        from retrieval_index import get_index  # numpy/scipy load only once a long document shows up.
+        get_index(context_text)
+
+
+# Share of the chat prompt budget the conversation (summary + recent turns) may use;
+# the document context gets the rest.
+CHAT_HISTORY_SHARE = float(os.getenv("CHAT_HISTORY_SHARE", "0.35"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+
+
+def _format_turn(turn):
+    question, answer = turn
+    return f"Student: {question}\nTutor: {answer}"
+
+
+def _fit_chat_history(summary, turns, max_tokens):
+    """Conversation block for the prompt: the summary plus as many recent turns as fit."""
+    if not summary and not turns:
+        return ""
+    summary = trim_to_tokens(summary, min(CHAT_SUMMARY_TOKENS, max_tokens // 2)) if summary else ""
+    lines = [f"Summary of the earlier conversation: {summary}"] if summary else []
+    recent = take_within([_format_turn(turn) for turn in reversed(turns)], max_tokens - count_tokens(summary))
+    lines += reversed(recent)
+    if not lines:
+        return ""
+    return "--- CONVERSATION SO FAR ---\n" + "\n\n".join(lines) + "\n--- CONVERSATION END ---\n\n"
+
+
+def _fit_chat_context(student_question, context_text, max_tokens):
+    """The whole document when it is short and fits, else the top passages for the question that fit."""
+    if count_tokens(context_text) <= min(QNA_FULL_CONTEXT_TOKENS, max_tokens):
+        return context_text
+    from retrieval_index import get_index  # numpy/scipy load only once a long document shows up.
+    passages = get_index(context_text).top_passages(student_question, QNA_TOP_K)
+    separator = "\n\n[...]\n\n"
+    fitted = take_within(passages, max_tokens, lambda passage: count_tokens(passage + separator))
+    if not fitted and passages:
+        fitted = [trim_to_tokens(passages[0], max_tokens)]
+    return separator.join(fitted)
+
+
+def build_chat_prompt(student_question, context_text, summary="", turns=(), budget=None):
+    """Follow-up question prompt fitted into the "chat" prompt budget.
+
+    Without a conversation the prompt is the same as the stateless one, so cached
+    answers still match. The question is always sent whole; the conversation gets up
+    to CHAT_HISTORY_SHARE of what is left, newest turns first, and the document
+    context (whole or retrieved passages) the remainder.
+    """
+    budget = budget or prompt_budget("chat") or DEFAULT_PROMPT_BUDGETS["chat"]
+    head = "You are a helpful AI Tutor. Based on the following context text provided by a student:\n\n--- CONTEXT START ---\n"
+    question = f"Please answer the student's follow-up question concisely and clearly: '{student_question}'"
+    available = max(0, budget - count_tokens(head + "\n--- CONTEXT END ---\n\n" + question))
+    history = _fit_chat_history(summary, turns, int(available * CHAT_HISTORY_SHARE))
+    context = _fit_chat_context(student_question, context_text, available - count_tokens(history))
+    return f"{head}{context}\n--- CONTEXT END ---\n\n{history}{question}"
+
+
+def answer_follow_up_question(student_question, context_text, stream=False, summary="", turns=()):
+    """Answers within the chat budget; `summary` and `turns` carry the conversation so far."""
+    prompt = build_chat_prompt(student_question, context_text, summary, turns)
+    return call_openrouter_api(prompt, stream=stream, feature="chat")
+
+
+def build_chat_summary_prompt(summary, turns, budget=None):
+    budget = budget or prompt_budget("chat_summary") or DEFAULT_PROMPT_BUDGETS["chat_summary"]
+    words = CHAT_SUMMARY_TOKENS * 3 // 4
+    head = (
+        "You are keeping notes on a tutoring conversation so that it can continue without the full transcript.\n"
+        "Update the summary below with the new exchanges. Keep the topics the student asked about, what was "
+        "explained, and any misunderstandings or open questions. "
+        f"Reply with the updated summary only, in at most {words} words.\n\n"
+        f"--- CURRENT SUMMARY ---\n{summary or '(none yet)'}\n--- NEW EXCHANGES ---\n"
+    )
+    tail = "\n--- END ---"
+    per_turn = max(1, (budget - count_tokens(head + tail)) // max(1, len(turns)))
+    exchanges = "\n\n".join(trim_to_tokens(_format_turn(turn), per_turn) for turn in turns)
+    return head + exchanges + tail
+
+
+def summarize_conversation(summary, turns, lane="batch"):
+    """The running `summary` extended with `turns`, trimmed to CHAT_SUMMARY_TOKENS."""
+    raw_output = call_openrouter_api(build_chat_summary_prompt(summary, turns), lane=lane, feature="chat_summary")
+    return trim_to_tokens((raw_output or "").strip(), CHAT_SUMMARY_TOKENS)
+
+
+# --- QUIZ GENERATION ---
+# Format instructions shared by every prompt that asks for Q/A)-D)/ANSWER quiz text.
+QUIZ_TEXT_FORMAT = (
+    "For each question:\n"
+    "1. Provide the question text.\n"
+    "2. Provide 4 distinct answer options, labeled A), B), C), and D).\n"
+    "3. IMPORTANT: On a new line immediately after the D) option, specify the correct answer by writing 'ANSWER: ' followed by the letter of the correct option (e.g., 'ANSWER: C').\n\n"
+    "Example Format for ONE question:\n"
+    "Q1: What is the primary color made by mixing red and yellow?\n"
+    "A) Blue\n"
+    "B) Green\n"
+    "C) Orange\n"
+    "D) Purple\n"
+    "ANSWER: C\n\n"
+)
+
+
+def build_quiz_prompt(paragraph, num_questions):
+    return (
+        f"Generate exactly {num_questions} multiple-choice questions based on the following paragraph.\n"
+        + QUIZ_TEXT_FORMAT +
+        f"Now, generate the questions from this paragraph:\n"
+        f"--- PARAGRAPH START ---\n{paragraph}\n--- PARAGRAPH END ---"
+    )
+
+
+def _report_parse_result(questions, dropped, raw_output, notices):
+    if dropped and questions:
+        notify(notices, "warning", f"Skipped {dropped} malformed question(s) in the AI's response; kept {len(questions)}.")
+    if not questions and raw_output:
+        notify(notices, "info", f"No questions could be parsed from the AI's response. Please try rephrasing your input text or try again. The AI said: {raw_output[:300]}...")
+
+
+def parse_quiz_output(raw_output, notices=None):
+    """Turns the model's Q/A)-D)/ANSWER text into question dicts.
+
+    Well-formed questions are kept even when others in the same response are malformed.
+    """
+    with telemetry.timed("parse_quiz"):
+        questions, dropped = parse_quiz_text(raw_output)
+    _report_parse_result(questions, dropped, raw_output, notices)
+    return questions
+
+
+def iter_quiz_from_paragraph(paragraph, num_questions=5, notices=None, lane="interactive"):
+    """Yields each question as soon as the streamed completion finishes its ANSWER line.
+
+    Long documents go through the map-reduce pipeline and are yielded once it is done.
+    """
+    if estimate_tokens(paragraph) > QUIZ_SECTION_TOKENS:
+        yield from generate_quiz_from_document(paragraph, num_questions, notices=notices)
+        return
+    parser = QuizStreamParser()
+    raw_parts = []
+    questions = []
+    for chunk in call_openrouter_api(build_quiz_prompt(paragraph, num_questions), stream=True, lane=lane, feature="quiz"):
+        raw_parts.append(chunk)
+        for question in parser.feed(chunk):
+            questions.append(question)
+            yield question
+    for question in parser.close():
+        questions.append(question)
+        yield question
+    _report_parse_result(questions, parser.dropped, "".join(raw_parts), notices)
+
+
+def generate_quiz_single_call(paragraph, num_questions=5, notices=None, lane="interactive"):
+    """One prompt, one completion, parsed into question dicts."""
+    raw_output = call_openrouter_api(build_quiz_prompt(paragraph, num_questions), lane=lane, feature="quiz")
+    return parse_quiz_output(raw_output, notices)
+
+
+def generate_quiz_from_paragraph(paragraph, num_questions=5, notices=None):
+    """Generates a quiz, switching to the sectioned pipeline for long documents."""
+    if estimate_tokens(paragraph) > QUIZ_SECTION_TOKENS:
+        return generate_quiz_from_document(paragraph, num_questions, notices=notices)
+    return generate_quiz_single_call(paragraph, num_questions, notices)
+
+
+# --- MAP-REDUCE QUIZ GENERATION FOR LARGE DOCUMENTS ---
+QUIZ_SECTION_TOKENS = int(os.getenv("QUIZ_SECTION_TOKENS", "2000"))
+QUIZ_MAX_SECTIONS = int(os.getenv("QUIZ_MAX_SECTIONS", "6"))
+# Two questions are duplicates only if their stems are near-identical (word Jaccard),
+# their options mostly overlap and their correct answers match. Stems alone are not
+# enough: "...producing energy...?" and "...producing proteins...?" differ by one word.
+QUIZ_DUPLICATE_THRESHOLD = 0.9
+QUIZ_DUPLICATE_OPTIONS_THRESHOLD = 0.8
+
+# Separate from the api_service pool: quiz generation itself may already be running
+# on that pool (e.g. process_student_text), and waiting on it from inside would deadlock.
+_section_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("QUIZ_SECTION_CONCURRENCY", str(QUIZ_MAX_SECTIONS))),
+    thread_name_prefix="quiz-section",
+)
+
+
+def _words(text):
+    return set(re.findall(r"[a-z0-9]+", text.lower()))
+
+
+def _answer_text(answer):
+    return re.sub(r"^\s*[A-Da-d][).:]\s*", "", answer or "").strip().lower()
+
+
+def _duplicate_key(question):
+    options = question.get("options") or []
+    return (_words(question.get("question_text", "")),
+            _words(" ".join(_answer_text(o) for o in options if isinstance(o, str))),
+            _answer_text(question.get("correct_answer")))
+
+
+def _jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def _is_duplicate(key, other, threshold):
+    return (key[2] == other[2]
+            and _jaccard(key[0], other[0]) >= threshold
+            and _jaccard(key[1], other[1]) >= QUIZ_DUPLICATE_OPTIONS_THRESHOLD)
+
+
+def deduplicate_questions(questions, threshold=QUIZ_DUPLICATE_THRESHOLD):
+    """Drops questions that repeat an earlier one: same answer, near-identical stem and options."""
+    kept, kept_keys = [], []
+    for q in questions:
+        key = _duplicate_key(q)
+        if not key[0]:
+            continue
+        if any(_is_duplicate(key, other, threshold) for other in kept_keys):
+            continue
+        kept.append(q)
+        kept_keys.append(key)
+    return kept
+
+
+def generate_quiz_from_document(document_text, num_questions=5, section_tokens=QUIZ_SECTION_TOKENS,
+                                max_sections=QUIZ_MAX_SECTIONS, notices=None):
+    """Map-reduce quiz generation for documents too long for one prompt.
+
+    The text is split into token-bounded sections and at most `max_sections` of them,
+    spread evenly over the document, are quizzed in parallel. Candidates are
+    de-duplicated and then picked round-robin across sections, so the final quiz
+    covers the whole document and latency stays roughly one LLM call regardless of
+    document size. A short pool is topped up with one more call; a quiz that is
+    still short is reported through `notices`.
+    """
+    sections = pick_evenly(split_into_sections(document_text, section_tokens), max_sections)
+    if not sections:
+        return []
+    per_section = max(1, -(-num_questions * 3 // (2 * len(sections))))  # ~1.5x over-generation
+
+    futures = [
+        # Sections go in the "batch" lane so a big document cannot crowd out chat requests.
+        _section_executor.submit(generate_quiz_single_call, section, per_section, notices, "batch")
+        for section in sections
+    ]
+    candidates_by_section = []
+    for future in futures:
+        try:
+            candidates_by_section.append(future.result())
+        except Exception as e:
+            notify(notices, "warning", f"Skipping one document section; quiz generation failed: {e}")
+            candidates_by_section.append([])
+
+    # Tag with the section index, de-duplicate across the whole pool, then regroup.
+    tagged = [dict(q, _section=i) for i, qs in enumerate(candidates_by_section) for q in qs]
+    unique = deduplicate_questions(tagged)
+    buckets = [[q for q in unique if q["_section"] == i] for i in range(len(sections))]
+
+    selected = []
+    while len(selected) < num_questions and any(buckets):
+        for bucket in buckets:
+            if bucket and len(selected) < num_questions:
+                selected.append(bucket.pop(0))
+
+    if len(selected) < num_questions:
+        # One top-up call over excerpts of the whole document for the missing count.
+        context = _condense_for_prompt(document_text, section_tokens)
+        try:
+            extra = generate_quiz_single_call(context, num_questions - len(selected), notices, "batch")
+        except Exception as e:
+            notify(notices, "warning", f"Could not generate the missing questions: {e}")
+            extra = []
+        selected = deduplicate_questions(selected + extra)[:num_questions]
+    if len(selected) < num_questions:
+        notify(notices, "warning", f"Only {len(selected)} of {num_questions} distinct questions could be generated from this document.")
+
+    stamp = int(time.time())
+    for i, q in enumerate(selected):
+        q.pop("_section", None)
+        q["id"] = f"q_{i+1}_{stamp}"
+    return selected
+
+
+# --- STRUCTURED (JSON) QUIZ GENERATION WITH TOP-UP ---
+QUIZ_MAX_TOP_UP_ROUNDS = int(os.getenv("QUIZ_MAX_TOP_UP_ROUNDS", "2"))
+
+
+def build_json_quiz_prompt(paragraph, num_questions, exclude=()):
+    prompt = (
+        f"Generate exactly {num_questions} multiple-choice questions based on the paragraph below.\n"
+        f"Respond with ONLY a JSON object, no other text, in this format:\n"
+        f'{{"questions": [{{"question": "...", "options": ["...", "...", "...", "..."], "answer": "A"}}]}}\n'
+        f"Each question must have exactly 4 distinct options (without A)/B) labels) and an answer letter A-D.\n"
+    )
+    if exclude:
+        listed = "\n".join(f"- {q}" for q in exclude)
+        prompt += f"Do NOT repeat or paraphrase any of these existing questions:\n{listed}\n"
+    return prompt + f"\n--- PARAGRAPH START ---\n{paragraph}\n--- PARAGRAPH END ---"
+
+
+def _condense_for_prompt(text, max_tokens):
+    """Evenly spaced excerpts of `text` that fit in `max_tokens`, for single-prompt modes."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    excerpts = pick_evenly(split_into_sections(text, max_tokens // 4), 4)
+    return "\n\n[...]\n\n".join(excerpts)
+
+
+def generate_quiz_structured(paragraph, num_questions=5, notices=None, max_top_up_rounds=QUIZ_MAX_TOP_UP_ROUNDS,
+                             lane="interactive"):
+    """JSON-mode quiz generation that tops up until exactly `num_questions` are valid.
+
+    Every schema-valid question from every round is kept. When a round comes back
+    short, a follow-up call asks only for the missing count and lists the accepted
+    questions to exclude, instead of regenerating the whole quiz. Returns
+    (questions, stats) where stats counts round trips and estimated tokens spent.
+    """
+    context = _condense_for_prompt(paragraph, QUIZ_SECTION_TOKENS)
+    accepted = []
+    stats = {"requested": num_questions, "round_trips": 0, "invalid_items": 0,
+             "prompt_tokens_est": 0, "completion_tokens_est": 0}
+    for _ in range(max_top_up_rounds + 1):
+        missing = num_questions - len(accepted)
+        if missing <= 0:
+            break
+        prompt = build_json_quiz_prompt(context, missing, [q["question_text"] for q in accepted])
+        raw_output = call_openrouter_api(prompt, lane=lane, feature="quiz_structured") or ""
+        stats["round_trips"] += 1
+        stats["prompt_tokens_est"] += estimate_tokens(prompt)
+        stats["completion_tokens_est"] += estimate_tokens(raw_output)
+        valid, invalid = parse_quiz_json(raw_output)
+        stats["invalid_items"] += invalid
+        accepted = deduplicate_questions(accepted + valid)
+
+    questions = accepted[:num_questions]
+    stamp = int(time.time())
+    for i, q in enumerate(questions):
+        q["id"] = f"q_{i+1}_{stamp}"
+    stats["accepted"] = len(questions)
+    stats["total_tokens_est"] = stats["prompt_tokens_est"] + stats["completion_tokens_est"]
+    if len(questions) < num_questions:
+        notify(notices, "warning", f"Only {len(questions)} of {num_questions} valid questions after {stats['round_trips']} attempts.")
+
+    telemetry.increment("structured_quizzes_total", "quiz_structured", lane, label_name="lane")
+    telemetry.increment("structured_quizzes_short_total", "quiz_structured", lane, len(questions) < num_questions, label_name="lane")
+    telemetry.increment("structured_quiz_round_trips_total", "quiz_structured", lane, stats["round_trips"], label_name="lane")
+    telemetry.increment("structured_quiz_tokens_est_total", "quiz_structured", lane, stats["total_tokens_est"], label_name="lane")
+    return questions, stats
+
+
+def get_quiz_generation_metrics() -> dict:
+    """Totals for structured quiz generation (from telemetry), incl. averages per quiz."""
+    usage = telemetry.snapshot()["usage_by_feature"].get("quiz_structured", {})
+    quizzes = usage.get("structured_quizzes_total", 0)
+    round_trips = usage.get("structured_quiz_round_trips_total", 0)
+    tokens = usage.get("structured_quiz_tokens_est_total", 0)
+    return {
+        "quizzes": quizzes,
+        "short_quizzes": usage.get("structured_quizzes_short_total", 0),
+        "round_trips": round_trips,
+        "tokens_est": tokens,
+        "avg_round_trips": round_trips / quizzes if quizzes else 0.0,
+        "avg_tokens_est": tokens / quizzes if quizzes else 0.0,
+    }
+
+
+# --- QUESTION BANK ---
+# question_bank pulls in numpy, so it is imported on first use rather than at start-up.
+def save_questions_to_bank(questions, subject="", source_text="", notices=None):
+    """Banks generated questions under `subject` and the source text's hash; returns (added, duplicates)."""
+    from question_bank import question_bank, source_hash
+
+    try:
+        return question_bank.add_questions(questions, subject, source_hash(source_text) if source_text else "")
+    except Exception as e:
+        notify(notices, "warning", f"Could not save the questions to the question bank: {e}")
+        return 0, 0
+
+
+def assemble_quiz_from_bank(num_questions, subject="", source_text="", notices=None):
+    """An N-question quiz from banked questions for a subject and/or document, with no LLM call.
+
+    Returns [] (with a notice) when the bank does not hold enough matching questions.
+    """
+    from question_bank import question_bank, source_hash
+
+    doc_hash = source_hash(source_text) if source_text and source_text.strip() else None
+    if not subject and not doc_hash:
+        notify(notices, "warning", "Enter a subject or provide the content to assemble a quiz from the bank.")
+        return []
+    questions = question_bank.assemble_quiz(num_questions, subject=subject, source_hash=doc_hash)
+    if questions is None:
+        available = question_bank.count(subject=subject, source_hash=doc_hash)
+        notify(notices, "info", f"The question bank has only {available} matching question(s); "
+                                f"generate a quiz with AI to add more.")
+        return []
+    return questions
+
+
+# --- COMBINED (ONE ROUND TRIP) GENERATION ---
+# One prompt asks for the explanation, then a marker line, then the quiz in the usual
+# Q/A)-D)/ANSWER format, so the text is sent (and paid for) once instead of twice and
+# both parts still stream. Several difficulty levels are rewritten in one call the
+# same way, each under its own header line. Missing parts fall back to separate calls.
+COMBINED_GENERATION = os.getenv("COMBINED_GENERATION", "1") != "0"
+QUIZ_SECTION_MARKER = "=== QUIZ ==="
+_LEVEL_HEADER = re.compile(r"^[#*\s]*===\s*([A-Za-z]+)\s*===[*\s]*$", re.MULTILINE)
+
+
+def build_explain_and_quiz_prompt(text, num_questions):
+    return (
+        f"Do two things with the text below, in this order.\n"
+        f"First, explain it in simpler terms, suitable for a student who might be finding it difficult. "
+        f"Break down complex ideas and use clear language.\n"
+        f"Then write a line containing only {QUIZ_SECTION_MARKER} and after it exactly {num_questions} "
+        f"multiple-choice questions based on the text.\n"
+        + QUIZ_TEXT_FORMAT +
+        f"--- TEXT START ---\n{text}\n--- TEXT END ---"
+    )
+
+
+def combined_generation_applies(text):
+    """Long documents keep the map-reduce quiz pipeline, so they are not combined."""
+    return COMBINED_GENERATION and estimate_tokens(text) <= QUIZ_SECTION_TOKENS
+
+
+def _find_quiz_start(text, at_line_start=True):
+    """(end of the explanation, start of the quiz text) in `text`, or None if the quiz has not begun.
+
+    The quiz begins at the marker or, if the model left the marker out, at the first
+    line that starts a question. With `at_line_start=False` the text begins mid-line.
+    """
+    marker_at = text.find(QUIZ_SECTION_MARKER)
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        if 0 <= marker_at < offset + len(line):
+            break
+        if (offset or at_line_start) and line.endswith("\n") and is_question_line(line):
+            return offset, offset
+        offset += len(line)
+    if marker_at >= 0:
+        return marker_at, marker_at + len(QUIZ_SECTION_MARKER)
+    partial_at = text.rfind("\n") + 1
+    if (partial_at or at_line_start) and is_question_line(text[partial_at:]):
+        return partial_at, partial_at
+    return None
+
+
+def _explanation_safe_length(text, at_line_start=True):
+    """How much of `text` (with no quiz start in it) can already be shown as explanation.
+
+    Held back: a possible partial marker at the end, and an unfinished last line that
+    may still turn out to start a question.
+    """
+    safe = len(text) - len(QUIZ_SECTION_MARKER)
+    partial_at = text.rfind("\n") + 1
+    if (partial_at or at_line_start) and may_start_question_line(text[partial_at:]):
+        safe = min(safe, partial_at)
+    return max(0, safe)
+
+
+def iter_explanation_and_quiz(text, num_questions=3, notices=None, lane="interactive"):
+    """Yields ("explanation", chunk) events and then ("question", dict) events from one call.
+
+    If the response has no explanation, it is generated separately (streamed); if it
+    has too few questions, only the missing ones are requested.
+    """
+    parser = QuizStreamParser()
+    questions = []
+    explanation, held = [], ""
+    at_line_start = True  # Whether `held` begins a line.
+    in_quiz = False
+    for chunk in call_openrouter_api(build_explain_and_quiz_prompt(text, num_questions), stream=True, lane=lane,
+                                     feature="explain_quiz"):
+        if in_quiz:
+            quiz_text = chunk
+        else:
+            held += chunk
+            start = _find_quiz_start(held, at_line_start)
+            if start is None:
+                safe = _explanation_safe_length(held, at_line_start)
+                if safe:
+                    explanation.append(held[:safe])
+                    yield "explanation", held[:safe]
+                    at_line_start = held[safe - 1] == "\n"
+                    held = held[safe:]
+                continue
+            explanation_end, quiz_at = start
+            if held[:explanation_end]:
+                explanation.append(held[:explanation_end])
+                yield "explanation", held[:explanation_end]
+            in_quiz, quiz_text = True, held[quiz_at:]
+            if not "".join(explanation).strip():
+                yield from _fallback_explanation(text, lane)
+        for question in parser.feed(quiz_text):
+            questions.append(question)
+            yield "question", question
+    if not in_quiz and held:
+        explanation.append(held)
+        yield "explanation", held
+    for question in parser.close():
+        questions.append(question)
+        yield "question", question
+
+    if not in_quiz:
+        if not "".join(explanation).strip():
+            yield from _fallback_explanation(text, lane)
+        elif not questions:
+            # No marker: the model may still have written the questions after its explanation.
+            questions = parse_quiz_text("".join(explanation))[0]
+            for question in questions:
+                yield "question", question
+    if len(questions) < num_questions:
+        yield from (("question", q) for q in _top_up_questions(text, questions, num_questions, notices, lane))
+
+
+def _fallback_explanation(text, lane):
+    telemetry.increment("combined_fallback_calls_total", "explain_quiz", "explanation", label_name="part")
+    for chunk in call_openrouter_api(simplify_text_prompt(text), stream=True, lane=lane, feature="simplify"):
+        yield "explanation", chunk
+
+
+def _top_up_questions(text, questions, num_questions, notices, lane):
+    """New questions (not near-duplicates of `questions`) to make up the missing count."""
+    telemetry.increment("combined_fallback_calls_total", "explain_quiz", "quiz", label_name="part")
+    extra = generate_quiz_single_call(text, num_questions - len(questions), notices, lane)
+    added = deduplicate_questions(questions + extra)[len(questions):num_questions]
+    stamp = int(time.time())
+    for i, question in enumerate(added):
+        question["id"] = f"q_extra_{i+1}_{stamp}"
+    return added
+
+
+def explain_and_quiz(text, num_questions=3, notices=None, lane="interactive"):
+    """Non-streaming iter_explanation_and_quiz: returns (explanation, questions)."""
+    explanation, questions = [], []
+    for kind, value in iter_explanation_and_quiz(text, num_questions, notices, lane):
+        (explanation if kind == "explanation" else questions).append(value)
+    return "".join(explanation).strip(), questions
+
+
+def build_personalization_levels_prompt(topic_content, difficulties):
+    headers = ", ".join(f"=== {d.upper()} ===" for d in difficulties)
+    return (
+        f"Rewrite the following content once for each of these student levels: {', '.join(difficulties)}. "
+        f"Make every version engaging and include analogies or relevant examples if possible. "
+        f"Start each version with its own header line, exactly: {headers}\n\n{topic_content}"
+    )
+
+
+def split_level_sections(raw_output, difficulties):
+    """{difficulty: text} for each requested level found under its header line."""
+    parts = _LEVEL_HEADER.split(raw_output or "")
+    wanted = {d.lower(): d for d in difficulties}
+    sections = {}
+    for name, body in zip(parts[1::2], parts[2::2]):
+        difficulty = wanted.get(name.lower())
+        if difficulty and body.strip():
+            sections[difficulty] = body.strip()
+    return sections
+
+
+def format_personalized_versions(versions, difficulties):
+    """Markdown with one headed section per difficulty, in the requested order."""
+    return "\n\n".join(f"#### {d.capitalize()} level\n\n{versions[d]}" for d in difficulties if versions.get(d))
+
+
+def generate_personalized_versions(topic_content, difficulties=("easy", "medium", "hard"), notices=None,
+                                   on_text=None, lane="interactive"):
+    """Rewrites the content for several difficulty levels in one call; returns {difficulty: text}.
+
+    `on_text(text_so_far)` is called as the response streams in. Levels missing from
+    the response (or all of them, if the call fails) are generated with parallel
+    single-level calls.
+    """
+    difficulties = list(difficulties)
+    versions = {}
+    if len(difficulties) > 1:
+        stream = call_openrouter_api(build_personalization_levels_prompt(topic_content, difficulties),
+                                     stream=True, lane=lane, feature="personalize_levels")
+        parts = []
+        try:
+            while True:
+                try:
+                    chunk = next(stream)
+                except StopIteration:
+                    break
+                except Exception as e:  # Only API errors; on_text may raise to stop us (e.g. a cancelled job).
+                    notify(notices, "warning", f"Batched personalization failed ({e}); generating each level separately.")
+                    parts = []
+                    break
+                parts.append(chunk)
+                if on_text is not None:
+                    on_text("".join(parts))
+        finally:
+            stream.close()
+        versions = split_level_sections("".join(parts), difficulties)
+    missing = [d for d in difficulties if d not in versions]
+    if missing:
+        if len(difficulties) > 1:
+            for difficulty in missing:
+                telemetry.increment("combined_fallback_calls_total", "personalize_levels", difficulty, label_name="part")
+        results, errors = run_in_parallel(
+            {d: (lambda d=d: generate_personalized_content(topic_content, d)) for d in missing}
+        )
+        versions.update(results)
+        for difficulty, err in errors.items():
+            notify(notices, "error", f"Could not generate the {difficulty} version: {err}")
+    return versions
+
+
+# --- CONCURRENT GENERATION ---
+def process_student_text(text_input, num_questions=3, notices=None):
+    """Generates the explanation and the quiz, in one combined call when the text is short enough.
+
+    Otherwise (or if the combined call fails) the two calls run concurrently.
+    Returns (simplified_text, questions, errors); a failed branch yields "" / [] and an
+    entry in `errors` keyed by "explanation" or "quiz".
+    """
+    if combined_generation_applies(text_input):
+        try:
+            explanation, questions = explain_and_quiz(text_input, num_questions, notices)
+            return explanation, questions, {}
+        except Exception as e:
+            notify(notices, "warning", f"Combined generation failed ({e}); using separate calls.")
+    results, errors = run_in_parallel({
+        "explanation": lambda: simplify_text(text_input),
+        "quiz": lambda: generate_quiz_from_paragraph(text_input, num_questions, notices),
+    })
+    return results.get("explanation", ""), results.get("quiz", []), errors
+
+
+def start_student_text_processing(text_input, num_questions=3, notices=None, cancel=None):
+    """Streaming counterpart of process_student_text.
+
+    Starts the generation in the background and returns (explanation_stream,
+    question_iter): the explanation can be rendered token by token while questions
+    keep arriving, and question_iter yields each one as soon as it has been parsed.
+    If the combined call fails before any question arrives, the quiz (and, unless part
+    of it was already streamed, the explanation) falls back to separate calls.
+    Setting `cancel` (a threading.Event) stops the background generation.
+    """
+    if not combined_generation_applies(text_input):
+        question_iter = iterate_in_background(iter_quiz_from_paragraph, text_input, num_questions, notices, stop=cancel)
+        return simplify_text(text_input, stream=True), question_iter
+
+    events = iterate_in_background(iter_explanation_and_quiz, text_input, num_questions, notices, stop=cancel)
+    first_question = []
+    separate_quiz = []  # The fallback question iterator, once the combined call has failed.
+
+    def fall_back(error):
+        if (cancel is not None and cancel.is_set()) or first_question or separate_quiz:
+            return False
+        notify(notices, "warning", f"Combined generation failed ({error}); using separate calls.")
+        separate_quiz.append(iterate_in_background(iter_quiz_from_paragraph, text_input, num_questions, notices,
+                                                   stop=cancel))
+        return True
+
+    def explanation_stream():
+        streamed = False
+        try:
+            for kind, value in events:
+                if kind == "question":
+                    first_question.append(value)
+                    return
+                streamed = True
+                yield value
+        except Exception as e:
+            if not fall_back(e) or streamed:
+                raise  # A half-streamed explanation is not restarted; the quiz still falls back.
+            telemetry.increment("combined_fallback_calls_total", "explain_quiz", "explanation", label_name="part")
+            yield from simplify_text(text_input, stream=True)
+
+    def question_iter():
+        yield from first_question  # Stashed by explanation_stream when it reached the quiz.
+        try:
+            for kind, value in events:
+                if kind == "question":
+                    first_question.append(value)
+                    yield value
+        except Exception as e:
+            if not fall_back(e):
+                raise
+        if separate_quiz:
+            telemetry.increment("combined_fallback_calls_total", "explain_quiz", "quiz", label_name="part")
+            yield from separate_quiz[0]
+
+    return explanation_stream(), question_iter()
+
+
+def prepare_teacher_resources(topic_content, num_questions=3, difficulty="medium", notices=None):
+    """Generates the personalized preview and the quiz concurrently.
+
+    Returns (personalized_content, questions, errors) with the same partial-result
+    semantics as process_student_text; error keys are "preview" and "quiz".
+    """
+    results, errors = run_in_parallel({
+        "preview": lambda: generate_personalized_content(topic_content, difficulty),
+        "quiz": lambda: generate_quiz_from_paragraph(topic_content, num_questions, notices),
+    })
+    return results.get("preview", ""), results.get("quiz", []), errors
+
+
+# --- BACKGROUND JOBS ---
+# Job bodies for jobs.job_queue: `fn(job, ...)` reports progress through job.report()
+# (which also stops the job once it is cancelled), streams partial output into
+# job.partial for the page to poll, and returns a plain dict of results. Results name
+# their input by document-store handle rather than keeping another copy of the text.
+def quiz_job_key(content, num_questions, exact_count=False):
+    """Identifies a teacher quiz job, so a speculative prefetch is reused by the real request."""
+    return ("teacher_quiz", hashlib.sha256(content.strip().encode("utf-8")).hexdigest(), num_questions, exact_count)
+
+
+def _stream_into(job, stream, message):
+    """Collects a text stream into job.partial["text"], checking for cancellation per chunk."""
+    parts = []
+    for chunk in stream:
+        parts.append(chunk)
+        job.partial["text"] = "".join(parts)
+        job.report(message=message)
+    return "".join(parts)
+
+
+def teacher_preview_job(job, topic_content, difficulties=("medium",)):
+    """One difficulty streams as before; several are written in one batched call."""
+    if len(difficulties) == 1:
+        text = _stream_into(job, generate_personalized_content(topic_content, difficulties[0], stream=True),
+                            "Writing the personalized preview...")
+    else:
+        def on_text(raw):
+            job.partial["text"] = format_personalized_versions(split_level_sections(raw, difficulties), difficulties)
+            job.report(message=f"Writing {len(difficulties)} difficulty levels in one pass...")
+
+        versions = generate_personalized_versions(topic_content, difficulties, job.notices, on_text)
+        text = format_personalized_versions(versions, difficulties)
+    return {"content": text, "source_handle": document_handle(topic_content)}
+
+
+def teacher_quiz_job(job, content, num_questions=3, exact_count=False):
+    """Quiz for the teacher view; streamed questions are published as they are parsed."""
+    lane = "batch" if job.speculative else "interactive"
+    if exact_count:
+        job.report(message="Generating and validating questions...")
+        questions, stats = generate_quiz_structured(content, num_questions, job.notices, lane=lane)
+        return {"questions": questions, "stats": stats, "source_handle": document_handle(content)}
+    questions = job.partial.setdefault("questions", [])
+    job.report(0.0, "Generating quiz...")
+    for question in iter_quiz_from_paragraph(content, num_questions, job.notices, lane=lane):
+        questions.append(question)
+        job.report(len(questions) / num_questions, f"{len(questions)}/{num_questions} questions ready")
+    return {"questions": list(questions), "stats": None, "source_handle": document_handle(content)}
+
+
+def teacher_resources_job(job, topic_content, num_questions=3, difficulty="medium"):
+    job.report(message="Generating personalized version and quiz...")
+    content, questions, errors = prepare_teacher_resources(topic_content, num_questions, difficulty, job.notices)
+    return {"content": content, "questions": questions, "errors": errors, "source_handle": document_handle(topic_content)}
+
+
+def student_processing_job(job, text_input, num_questions=3):
+    """Explanation streamed into job.partial["text"] while the quiz is generated alongside."""
+    explanation_stream, question_iter = start_student_text_processing(text_input, num_questions, job.notices,
+                                                                      cancel=job.cancel_event)
+    build_qna_index(text_input)
+    errors = {}
+    try:
+        explanation = _stream_into(job, explanation_stream, "Explaining your text...")
+    except Exception as e:
+        if job.cancelled:
+            raise
+        explanation, errors["explanation"] = "", e
+    questions = job.partial.setdefault("questions", [])
+    try:
+        for question in question_iter:
+            questions.append(question)
+            job.report(len(questions) / num_questions, f"{len(questions)}/{num_questions} quiz questions ready")
+    except Exception as e:
+        if job.cancelled:
+            raise
+        errors["quiz"] = e
+    return {"explanation": explanation, "questions": list(questions), "errors": errors, "source_handle": document_handle(text_input)}
+
+
+def chat_summary_job(job, summary, turns):
+    """Folds older chat turns into the running summary (see conversation.Conversation)."""
+    job.report(message="Summarizing earlier chat turns...")
+    new_summary = summarize_conversation(summary, turns)
+    if not new_summary:
+        raise ValueError("The AI returned an empty conversation summary.")
+    return new_summary
+
+
+JOB_FUNCTIONS = {
+    "teacher_preview": teacher_preview_job,
+    "teacher_quiz": teacher_quiz_job,
+    "teacher_resources": teacher_resources_job,
+    "student_processing": student_processing_job,
+    "chat_summary": chat_summary_job,
+}
+
+
+# --- GRADING ---
+def grade_assessment(student_answers, questions_list, notices=None):
+    score = 0
+    feedback = []
+    if not isinstance(questions_list, list):
+        notify(notices, "error", "Grading error: Questions data is not a list.")
+        return 0, 0, ["Error: Could not load questions for grading."]
+
+    for q_data in questions_list:
+        if not isinstance(q_data, dict):
+            feedback.append(f"Skipping an invalid question item.")
+            continue
+
+        q_id = q_data.get('id')
+        correct_ans_text = q_data.get('correct_answer')
+        question_text = q_data.get('question_text', 'N/A')
+
+        if q_id is None or correct_ans_text is None:
+            feedback.append(f"Q: {question_text} — Error: Question data incomplete for grading.")
+            continue
+
+        selected_ans_text = student_answers.get(q_id)
+
+        if selected_ans_text == correct_ans_text:
+            score += 1
+            feedback.append(f"Q: {question_text} — ✅ Correct!")
+        elif selected_ans_text is None:
+            feedback.append(f"Q: {question_text} — ❌ Not answered. The correct answer was: {correct_ans_text}")
+        else:
+            feedback.append(f"Q: {question_text} — ❌ Your answer: {selected_ans_text}. The correct answer was: {correct_ans_text}")
+
+    return score, len(questions_list), feedback